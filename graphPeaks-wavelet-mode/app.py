@@ -2,11 +2,14 @@
 import sys
 from PyQt5.QtWidgets import QApplication
 from main_window import MainWindow
+from startup import warm_up
 
 def main():
     app = QApplication(sys.argv)
     win = MainWindow()
     win.show()
+    # scipy and pandas load behind the shown window instead of before it
+    warm_up()
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
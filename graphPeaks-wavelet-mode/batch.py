@@ -0,0 +1,184 @@
+#Headless batch runner: detects peaks in many files without the GUI (never imports PyQt5).
+#  python batch.py data/ more/*.txt --out peaks/ --mode threshold --jobs 8 --format parquet
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import constants as C
+
+# io_utils.DATA_EXTENSIONS, repeated so this module imports nothing heavy
+EXTENSIONS = (".csv", ".txt", ".xls", ".xlsx", ".npy", ".npz", ".tiles", ".h5", ".hdf5", ".bin", ".raw", ".dat")
+# --format -> output extension (see peak_writer.WRITERS)
+FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather", "npz": ".npz", "npy": ".npy"}
+MANIFEST_NAME = "manifest.json"
+
+
+def find_inputs(patterns):
+    """Files named by the patterns: directories are scanned, globs expanded."""
+    found = []
+    for pattern in patterns:
+        if os.path.isdir(pattern):
+            paths = [os.path.join(pattern, f) for f in os.listdir(pattern)]
+        else:
+            paths = glob.glob(pattern)
+        found.extend(p for p in paths if os.path.isfile(p) and p.lower().endswith(EXTENSIONS))
+    return sorted(set(os.path.abspath(p) for p in found))
+
+
+def output_names(inputs, out_dir, ext=".csv"):
+    """input -> <out_dir>/<stem>_peaks<ext>, numbered when stems repeat."""
+    names, seen = {}, {}
+    for path in inputs:
+        stem = os.path.splitext(os.path.basename(path))[0]
+        n = seen.get(stem, 0)
+        seen[stem] = n + 1
+        names[path] = os.path.join(out_dir, f"{stem}_peaks{ext}" if n == 0 else f"{stem}_{n}_peaks{ext}")
+    return names
+
+
+def is_up_to_date(path, out_path, params, previous):
+    """Output exists, is newer than its input and came from the same parameters."""
+    entry = previous.get(path)
+    return (entry is not None and entry.get("status") == "ok" and entry.get("params") == params
+            and os.path.exists(out_path) and os.path.getmtime(out_path) >= os.path.getmtime(path))
+
+
+def process_file(path, out_path, params, profile=False):
+    """
+    Load, detect and export one file; returns its manifest entry (with the stage
+    profile if asked). Threshold runs with one height stream their peaks to the
+    output chunk by chunk.
+    """
+    # imported here so worker start-up and `--help` stay light
+    from io_utils import load_data
+    from detect import run_pipeline
+    from chunked import iter_threshold
+    from peak_writer import open_peak_writer, peak_metadata
+    from profiling import StageProfiler
+
+    config = C.DEFAULT_CONFIG.replace(height=params["apex_min_height"], alpha=params["alpha"])
+    timings = {}
+    t0 = time.perf_counter()
+    # a one-shot run: no converted copy of every input in the shared cache
+    x, y = load_data(path, use_cache=False)
+    timings["load"] = time.perf_counter() - t0
+
+    height = config.height
+    auto = params.get("auto_height") if params["mode"] == "threshold" else None
+    if auto:
+        from noise import estimate_noise, window_heights, run_adaptive
+        t0 = time.perf_counter()
+        noise = estimate_noise(y)
+        timings["noise"] = time.perf_counter() - t0
+        height = noise["height"] if auto == "file" else "per-window"
+        config = config.replace(height=noise["height"])
+
+    profiler = StageProfiler(memory=True) if profile else None
+    t0 = time.perf_counter()
+    meta = peak_metadata(config, params["mode"], params["engine"], source=path, height=height)
+    timings["hash"] = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    islands = 0
+    with open_peak_writer(out_path, meta) as writer:
+        if params["mode"] == "threshold" and auto != "window":
+            # region ids continue across blocks, as in a single-shot run
+            for start, res in iter_threshold(y, params["engine"], C.CHUNK_SIZE, config=config,
+                                             profiler=profiler):
+                writer.write(res["kept_rows"].shifted(start, islands))
+                islands += len(res["islands"])
+        else:
+            if auto == "window":
+                result = run_adaptive(y, window_heights(noise), params["engine"], config, profiler=profiler)
+            else:
+                result = run_pipeline(y, mode=params["mode"], engine=params["engine"], config=config,
+                                      profiler=profiler)
+            islands = len(result.get("islands", []))
+            writer.write(result["kept_rows"])
+    # detection and export overlap when streaming
+    timings["detect_export"] = time.perf_counter() - t0
+    entry = {"input": path, "output": out_path, "params": params, "status": "ok",
+             "height": height, "points": int(len(y)), "islands": islands,
+             "peaks": writer.count, "source_sha256": meta["source_sha256"], "seconds": timings}
+    if profiler is not None:
+        entry["profile"] = profiler.summary()
+        profiler.close()
+    return entry
+
+
+def load_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    if not os.path.exists(path):
+        return {}
+    with open(path) as fh:
+        return {e["input"]: e for e in json.load(fh).get("files", [])}
+
+
+def save_manifest(out_dir, entries):
+    path = os.path.join(out_dir, MANIFEST_NAME)
+    with open(path + ".part", "w") as fh:
+        json.dump({"written": time.strftime("%Y-%m-%dT%H:%M:%S"),
+                   "files": sorted(entries.values(), key=lambda e: e["input"])}, fh, indent=1)
+    os.replace(path + ".part", path)
+
+
+def run_batch(patterns, out_dir, mode="threshold", jobs=C.WORKERS, force=False, config=C.DEFAULT_CONFIG,
+              auto_height=None, profile=False, fmt="csv"):
+    """Process every input not already up to date; returns the manifest entries."""
+    os.makedirs(out_dir, exist_ok=True)
+    inputs = find_inputs(patterns)
+    outputs = output_names(inputs, out_dir, FORMATS[fmt])
+    params = {"mode": mode, "engine": C.ENGINE, "format": fmt,
+              "apex_min_height": config.height, "alpha": config.alpha, "auto_height": auto_height}
+    previous = load_manifest(out_dir)
+    entries = dict(previous)
+
+    todo = [p for p in inputs if force or not is_up_to_date(p, outputs[p], params, previous)]
+    print(f"{len(inputs)} files, {len(inputs) - len(todo)} up to date, {len(todo)} to process")
+    if todo:
+        with ProcessPoolExecutor(max_workers=max(1, min(jobs, len(todo))),
+                                 mp_context=multiprocessing.get_context(C.POOL_START)) as pool:
+            futures = {pool.submit(process_file, p, outputs[p], params, profile): p for p in todo}
+            for fut in as_completed(futures):
+                path = futures[fut]
+                try:
+                    entry = fut.result()
+                    print(f"ok    {path}: {entry['peaks']} peaks in {sum(entry['seconds'].values()):.2f}s")
+                except Exception as e:
+                    entry = {"input": path, "output": outputs[path], "params": params,
+                             "status": "error", "error": f"{type(e).__name__}: {e}"}
+                    print(f"error {path}: {entry['error']}")
+                entries[path] = entry
+    save_manifest(out_dir, entries)
+    return {p: entries[p] for p in inputs}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Detect peaks in many files without the GUI.")
+    parser.add_argument("inputs", nargs="+", help="files, directories or glob patterns")
+    parser.add_argument("--out", default="peaks", help="output folder for <name>_peaks.<format> and manifest.json")
+    parser.add_argument("--format", choices=list(FORMATS), default="csv",
+                        help="peak file format (parquet and feather need pyarrow)")
+    parser.add_argument("--mode", choices=["threshold", "wavelet"], default="threshold")
+    parser.add_argument("--height", type=float, default=C.APEX_MIN_HEIGHT, help="minimum peak height (threshold mode)")
+    parser.add_argument("--auto-height", choices=["file", "window"],
+                        help="pick the height from each file's noise floor (whole file or per window)")
+    parser.add_argument("--alpha", type=float, default=C.ALPHA, help="width threshold as a fraction of the apex")
+    parser.add_argument("--jobs", type=int, default=C.WORKERS, help="files processed at once")
+    parser.add_argument("--force", action="store_true", help="reprocess files that are up to date")
+    parser.add_argument("--profile", action="store_true",
+                        help="record per-stage time, memory peak and counts of detection in the manifest")
+    args = parser.parse_args(argv)
+
+    config = C.DEFAULT_CONFIG.replace(height=args.height, alpha=args.alpha)
+    entries = run_batch(args.inputs, args.out, mode=args.mode, jobs=args.jobs, force=args.force, config=config,
+                        auto_height=args.auto_height, profile=args.profile, fmt=args.format)
+    return 1 if any(e.get("status") == "error" for e in entries.values()) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
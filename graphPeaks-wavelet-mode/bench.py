@@ -0,0 +1,236 @@
+#Benchmarks: times and memory-profiles every detection stage on seeded synthetic signals.
+#  python bench.py --sizes 10k,1M --out bench.json
+#  python bench.py --sizes 10k,1M --baseline bench.json   (exit 1 when a stage got slower)
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+import numpy as np
+import constants as C
+
+# ----------------------------------------------------
+# synthetic signals
+# ----------------------------------------------------
+PROFILES = {
+    # background level and noise, peaks per point, peak height and width, share of
+    # split (two close apexes), shoulder (small apex on a flank) and flat-top peaks
+    "sparse":   dict(baseline=5, noise=2.0, density=2e-4, height=300, width=15, split=0.1, shoulder=0.1, plateau=0.05),
+    "dense":    dict(baseline=5, noise=2.0, density=5e-3, height=300, width=15, split=0.2, shoulder=0.2, plateau=0.05),
+    "noisy":    dict(baseline=20, noise=12.0, density=1e-3, height=150, width=25, split=0.1, shoulder=0.1, plateau=0.0),
+    "split":    dict(baseline=5, noise=2.0, density=1e-3, height=300, width=21, split=0.8, shoulder=0.2, plateau=0.0),
+    "plateau":  dict(baseline=5, noise=0.0, density=1e-3, height=200, width=31, split=0.0, shoulder=0.0, plateau=0.6),
+}
+
+
+def make_signal(n, profile="sparse", seed=0):
+    """Seeded counts-like signal of n points (float64) for one of PROFILES."""
+    p = PROFILES[profile]
+    rng = np.random.default_rng(seed)
+    y = np.full(n, float(p["baseline"]))
+    if p["noise"]:
+        y += rng.normal(0.0, p["noise"], n)
+    k = max(1, int(n * p["density"]))
+    centers = rng.integers(0, n, k)
+    heights = p["height"] * (0.3 + rng.random(k))
+    kind = rng.random(k)
+    w = p["width"]
+    half = w // 2
+    shape = np.hanning(w)
+    spikes = np.zeros(n)
+    # split peaks: a second apex about one width away; shoulders: a small one on the flank
+    split = kind < p["split"]
+    shoulder = (kind >= p["split"]) & (kind < p["split"] + p["shoulder"])
+    for mask, dist, scale in ((split, w // 2 + 2, 0.9), (shoulder, w // 3, 0.35)):
+        extra = np.clip(centers[mask] + dist, 0, n - 1)
+        np.add.at(spikes, extra, heights[mask] * scale)
+    np.add.at(spikes, centers, heights)
+    y += np.convolve(spikes, shape, "same")
+    # flat tops: clip the top of some peaks to a plateau
+    flat = centers[(kind >= 1 - p["plateau"])]
+    for c in flat:
+        a, b = max(0, c - half), min(n, c + half + 1)
+        y[a:b] = np.minimum(y[a:b], y[c] * 0.8)
+    return np.maximum(np.round(y, 1), 0.0)
+
+
+def parse_size(text):
+    text = text.strip().lower()
+    mult = {"k": 10 ** 3, "m": 10 ** 6, "g": 10 ** 9}.get(text[-1:], 1)
+    return int(float(text[:-1] if mult > 1 else text) * mult)
+
+
+# ----------------------------------------------------
+# measurement
+# ----------------------------------------------------
+def measure(fn, repeat=3, memory=True):
+    """(best seconds over repeat runs, peak traced MB of one more run, last result)."""
+    best, result = np.inf, None
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - t0)
+    peak = None
+    if memory:
+        # numpy reports its buffers to tracemalloc; traced runs are slower, so time separately
+        tracemalloc.start()
+        fn()
+        peak = tracemalloc.get_traced_memory()[1] / 1e6
+        tracemalloc.stop()
+    return best, peak, result
+
+
+def stages(y, python_max, load_max, tmp):
+    """[(stage, engine, callable), ...] for one signal; each callable is one timed unit."""
+    import detect
+    from detect import run_pipeline
+    from chunked import run_chunked
+    from noise import estimate_noise
+    cfg = C.DEFAULT_CONFIG
+    n = len(y)
+
+    mask = detect._island_mask(y, cfg.height)
+    starts, ends = detect._island_bounds(mask)
+    cand = detect._local_maxima_np(y, mask, starts, ends)
+    W = detect._widths_np(y, *cand, starts, ends, cfg.alpha)
+    R = detect._radii_np(W).tolist()
+    cands = [[i, v, r] for i, v, r in zip(*(c.tolist() for c in cand))]
+    out = [
+        ("islands", "numpy", lambda: detect._island_bounds(detect._island_mask(y, cfg.height))),
+        ("local_maxima", "numpy", lambda: detect._local_maxima_np(y, mask, starts, ends)),
+        ("widths", "numpy", lambda: detect._widths_np(y, *cand, starts, ends, cfg.alpha)),
+        ("apex_min_separation", "-", lambda: detect.apex_min_separation(cands, R, cfg.separation)),
+        ("apex_min_separation", "numpy", lambda: detect._separate_np(cand[0], cand[1], cand[2],
+                                                                     np.asarray(R), cfg.separation)),
+        ("threshold", "numpy", lambda: run_pipeline(y, config=cfg)),
+        ("threshold_chunked", "numpy", lambda: run_chunked(y, chunk_size=C.CHUNK_SIZE, config=cfg)),
+        ("cwt", "fft", lambda: detect._cwt_abs_sum(y, cfg.wavelet_widths)),
+        ("wavelet", "fft", lambda: run_pipeline(y, mode="wavelet", config=cfg)),
+        ("noise", "-", lambda: estimate_noise(y)),
+    ]
+    if n <= python_max:
+        ys = y.tolist()
+        isl = detect.islands_of_activity(ys, cfg.height)
+        lm = detect.find_local_maxima(isl, ys)
+        out += [
+            ("islands", "python", lambda: detect.islands_of_activity(ys, cfg.height)),
+            ("local_maxima", "python", lambda: detect.find_local_maxima(isl, ys)),
+            ("widths", "python", lambda: detect.width_per_island(ys, isl, lm, cfg.alpha)),
+            ("threshold", "python", lambda: run_pipeline(y, engine="python", config=cfg)),
+        ]
+    if n <= load_max:
+        from io_utils import load_data
+        path = os.path.join(tmp, f"signal_{n}.csv")
+        with open(path, "w") as fh:
+            fh.write("x,y\n")
+            np.savetxt(fh, np.column_stack([np.arange(n), y]), fmt=["%d", "%.1f"], delimiter=",")
+        load_data(path)  # writes the binary cache the "cached" stage reads
+        out += [
+            ("load_data", "parse", lambda: load_data(path, use_cache=False)),
+            ("load_data", "cached", lambda: load_data(path)),
+        ]
+    return out
+
+
+def _bench_rows(sizes, profiles, repeat, memory, python_max, load_max, only, seed, tmp):
+    for profile in profiles:
+        for n in sizes:
+            y = make_signal(n, profile, seed)
+            for stage, engine, fn in stages(y, python_max, load_max, tmp):
+                if only and stage not in only:
+                    continue
+                seconds, peak, res = measure(fn, repeat, memory)
+                peaks = len(res["kept_rows"]) if isinstance(res, dict) and "kept_rows" in res else None
+                yield {"profile": profile, "size": n, "stage": stage, "engine": engine,
+                       "seconds": seconds, "points_per_s": n / seconds if seconds else None,
+                       "peak_mb": peak, "peaks": peaks}
+
+
+def run_bench(sizes, profiles, repeat=3, memory=True, python_max=1_000_000, load_max=10_000_000,
+              only=None, seed=0, log=print):
+    """List of result dicts, one per (profile, size, stage, engine)."""
+    import cache
+    results = []
+    saved_dir = cache.CACHE_DIR
+    with tempfile.TemporaryDirectory() as tmp:
+        # keep the benchmark files out of (and from pruning) the user's cache
+        cache.CACHE_DIR = os.path.join(tmp, "cache")
+        try:
+            for row in _bench_rows(sizes, profiles, repeat, memory, python_max, load_max, only, seed, tmp):
+                results.append(row)
+                mem = f"{row['peak_mb']:9.1f} MB" if row["peak_mb"] is not None else ""
+                log(f"{row['profile']:8s} {row['size']:>11,d} {row['stage']:20s} {row['engine']:7s} "
+                    f"{row['seconds']:9.4f} s {mem}")
+        finally:
+            cache.CACHE_DIR = saved_dir
+    return results
+
+
+# ----------------------------------------------------
+# baselines
+# ----------------------------------------------------
+def _key(row):
+    return row["profile"], row["size"], row["stage"], row["engine"]
+
+
+def compare(results, baseline, tolerance=0.25, min_seconds=0.005):
+    """Rows slower than baseline by more than tolerance (ignoring sub-min_seconds timings)."""
+    base = {_key(r): r for r in baseline["results"]}
+    slower = []
+    for row in results:
+        old = base.get(_key(row))
+        if old is None or max(old["seconds"], row["seconds"]) < min_seconds:
+            continue
+        ratio = row["seconds"] / old["seconds"] if old["seconds"] else np.inf
+        if ratio > 1 + tolerance:
+            slower.append(dict(row, baseline_seconds=old["seconds"], ratio=ratio))
+    return slower
+
+
+def environment():
+    import scipy
+    return {"python": platform.python_version(), "numpy": np.__version__, "scipy": scipy.__version__,
+            "platform": platform.platform(), "cpus": os.cpu_count(),
+            "when": time.strftime("%Y-%m-%dT%H:%M:%S")}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the detection stages on synthetic signals.")
+    parser.add_argument("--sizes", default="10k,100k,1M", help="comma list, k/M suffixes (up to 100M)")
+    parser.add_argument("--profiles", default=",".join(PROFILES), help=f"comma list of {', '.join(PROFILES)}")
+    parser.add_argument("--stages", help="only these stages (comma list)")
+    parser.add_argument("--repeat", type=int, default=3, help="timed runs per stage, the best is kept")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc run")
+    parser.add_argument("--python-max", type=parse_size, default=1_000_000,
+                        help="largest size for the pure-python reference stages")
+    parser.add_argument("--load-max", type=parse_size, default=10_000_000,
+                        help="largest size written to CSV for load_data")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", help="write results as JSON")
+    parser.add_argument("--baseline", help="JSON from an earlier --out to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.25, help="allowed slowdown before a stage counts as regressed")
+    args = parser.parse_args(argv)
+
+    results = run_bench([parse_size(s) for s in args.sizes.split(",")], args.profiles.split(","),
+                        repeat=args.repeat, memory=not args.no_memory, python_max=args.python_max,
+                        load_max=args.load_max, only=set(args.stages.split(",")) if args.stages else None,
+                        seed=args.seed)
+    report = {"environment": environment(), "results": results}
+    if args.out:
+        with open(args.out, "w") as fh:
+            json.dump(report, fh, indent=1)
+    if args.baseline:
+        with open(args.baseline) as fh:
+            slower = compare(results, json.load(fh), args.tolerance)
+        for row in slower:
+            print(f"REGRESSION {row['profile']} {row['size']:,} {row['stage']} ({row['engine']}): "
+                  f"{row['baseline_seconds']:.4f} s -> {row['seconds']:.4f} s (x{row['ratio']:.2f})")
+        return 1 if slower else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,55 @@
+#Per-source cache folders: everything derived from one input file (tile store,
+#converted arrays, ...) lives under CACHE_DIR/<fingerprint of that file>
+import hashlib
+import os
+import shutil
+import time
+from constants import CACHE_DIR, CACHE_MAX_SOURCES, CACHE_GRACE
+
+
+def source_fingerprint(path, sample=1 << 20):
+    """
+    SHA-1 over the file size, mtime and its first and last `sample` bytes.
+    Cheap even for multi-GB inputs and changes whenever the file is rewritten.
+    """
+    st = os.stat(path)
+    h = hashlib.sha1(f"{st.st_size}:{st.st_mtime_ns}".encode())
+    with open(path, "rb") as fh:
+        h.update(fh.read(sample))
+        if st.st_size > sample:
+            fh.seek(max(sample, st.st_size - sample))
+            h.update(fh.read(sample))
+    return h.hexdigest()
+
+
+def source_cache_dir(path, fingerprint=None):
+    """Cache folder for one source file, created on demand."""
+    folder = os.path.join(CACHE_DIR, fingerprint or source_fingerprint(path))
+    if not os.path.isdir(folder):
+        os.makedirs(folder, exist_ok=True)
+        prune_cache(exclude=folder)
+    else:
+        os.utime(folder)  # mark as recently used
+    return folder
+
+
+def prune_cache(keep=CACHE_MAX_SOURCES, exclude=None, grace=CACHE_GRACE):
+    """
+    Remove the least recently used source folders beyond `keep`. Folders used in
+    the last `grace` seconds and `exclude` are never removed: other processes may
+    still be writing or mapping them.
+    """
+    if not os.path.isdir(CACHE_DIR):
+        return
+    folders = []
+    for entry in os.scandir(CACHE_DIR):
+        try:
+            if entry.is_dir():
+                folders.append((entry.stat().st_mtime, entry.path))
+        except FileNotFoundError:  # pruned by another process meanwhile
+            pass
+    folders.sort(reverse=True)
+    recent = time.time() - grace
+    for mtime, path in folders[keep:]:
+        if mtime < recent and path != exclude:
+            shutil.rmtree(path, ignore_errors=True)
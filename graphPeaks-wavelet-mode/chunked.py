@@ -0,0 +1,282 @@
+#Chunked detection: runs detect.run_pipeline over fixed-size blocks with results identical
+#to a single-shot run. The signal is only read a few chunks at a time; what is kept in
+#memory beyond that is the result itself (islands, W/R per island, kept peaks)
+import os
+import tempfile
+import numpy as np
+from constants import APEX_MIN_HEIGHT, CHUNK_SIZE, ENGINE, DEFAULT_CONFIG
+import detect
+from profiling import stage
+from peak_table import PeakTable
+
+
+def iter_chunks(values, chunk_size=CHUNK_SIZE):
+    """Yield consecutive chunk_size slices of values as arrays."""
+    for a in range(0, len(values), chunk_size):
+        yield np.asarray(values[a:a + chunk_size])
+
+
+# ----------------------------------------------------
+# island-aligned chunk boundaries (threshold mode)
+# ----------------------------------------------------
+def next_cut(data, pos, height=APEX_MIN_HEIGHT, step=65536):
+    """
+    First index >= pos where a block may start: the point before it is below
+    height, so no island crosses the cut (a NaN carries the previous state,
+    a value below height always closes an island).
+    """
+    n = len(data)
+    while 0 < pos < n:
+        window = np.asarray(data[pos - 1:min(pos - 1 + step, n - 1)])
+        hits = np.flatnonzero(window < height)
+        if hits.size:
+            return pos + int(hits[0])
+        pos += len(window)
+    return min(pos, n)
+
+
+def prev_cut(data, pos, height=APEX_MIN_HEIGHT, step=65536):
+    """Last index <= pos where a block may start (the cut rule of next_cut, searched backwards)."""
+    pos = min(pos, len(data))
+    while pos > 0:
+        lo = max(0, pos - step)
+        hits = np.flatnonzero(np.asarray(data[lo:pos]) < height)
+        if hits.size:
+            return lo + int(hits[-1]) + 1
+        pos = lo
+    return 0
+
+
+def island_aligned_chunks(data, chunk_size=CHUNK_SIZE, height=APEX_MIN_HEIGHT):
+    """
+    (start, stop) blocks covering data. Each block boundary is the first cut at
+    or after a multiple of chunk_size, so boundaries depend only on the data and
+    the grid, and an island longer than a chunk simply stretches its block.
+    """
+    n = len(data)
+    start = 0
+    for g in range(chunk_size, n + chunk_size, chunk_size):
+        stop = next_cut(data, g, height) if g < n else n
+        if stop > start:
+            yield start, stop
+            start = stop
+
+
+def merge_threshold(parts, local_max=True):
+    """
+    Stitch per-block run_pipeline results ((start, result) pairs, in order); the
+    parts are not modified. With local_max=False the candidates are dropped as
+    each part is merged and the result has no "local_max".
+    """
+    islands, candidates, W_by_island, R_by_island, rows = [], [], [], [], []
+    rid0 = 0
+    for start, res in parts:
+        islands.append(res["islands"] + start)
+        if local_max:
+            candidates.append(res["local_max"].shifted(start, rid0))
+        W_by_island.append(res["W_by_island"])
+        R_by_island.append(res["R_by_island"])
+        rows.append(res["kept_rows"].shifted(start, rid0))
+        rid0 += len(res["islands"])
+    if not islands:
+        result = {"islands": np.empty((0, 2), dtype=np.int64), "local_max": PeakTable(),
+                  "W_by_island": np.empty(0, dtype=np.int64), "R_by_island": np.empty(0, dtype=np.int64),
+                  "kept_rows": PeakTable()}
+    else:
+        result = {"islands": np.concatenate(islands),
+                  "local_max": PeakTable.concat(candidates) if local_max else None,
+                  "W_by_island": np.concatenate(W_by_island), "R_by_island": np.concatenate(R_by_island),
+                  "kept_rows": PeakTable.concat(rows)}
+    if not local_max:
+        del result["local_max"]
+    return result
+
+
+# ----------------------------------------------------
+# exact median of an array too large to sort in memory
+# ----------------------------------------------------
+def _kth_smallest(values, k, chunk_size, bins=4096):
+    """k-th smallest value (0-based), narrowing a histogram over chunked passes."""
+    lo, hi, below = -np.inf, np.inf, 0
+    while True:
+        vmin, vmax, total = np.inf, -np.inf, 0
+        for chunk in iter_chunks(values, chunk_size):
+            v = chunk[(chunk >= lo) & (chunk <= hi)]
+            if v.size:
+                vmin, vmax, total = min(vmin, v.min()), max(vmax, v.max()), total + v.size
+        lo, hi = vmin, vmax
+        if lo == hi:
+            return lo
+        if total <= chunk_size:
+            v = np.concatenate([c[(c >= lo) & (c <= hi)] for c in iter_chunks(values, chunk_size)])
+            return np.partition(v, k - below)[k - below]
+
+        edges = np.linspace(lo, hi, bins + 1)
+        counts = np.zeros(bins, dtype=np.int64)
+        at_lo = 0
+        for chunk in iter_chunks(values, chunk_size):
+            v = chunk[(chunk >= lo) & (chunk <= hi)]
+            at_lo += np.count_nonzero(v == lo)
+            b = np.clip(np.searchsorted(edges, v, side="right") - 1, 0, bins - 1)
+            counts += np.bincount(b, minlength=bins)
+        if k - below < at_lo:
+            return lo
+        cum = np.cumsum(counts)
+        j = int(np.searchsorted(cum, k - below, side="right"))
+        if counts[j] == total:
+            # float edges too close to split: step past the smallest value instead
+            below += at_lo
+            lo = np.nextafter(lo, np.inf)
+            continue
+        below += int(cum[j] - counts[j])
+        lo, hi = edges[j], hi if j == bins - 1 else np.nextafter(edges[j + 1], -np.inf)
+
+
+def chunked_median(values, chunk_size=CHUNK_SIZE):
+    """Same value as np.median(values), reading at most chunk_size points at a time."""
+    n = len(values)
+    if n == 0 or any(np.isnan(c).any() for c in iter_chunks(values, chunk_size)):
+        return np.nan
+    lo = _kth_smallest(values, (n - 1) // 2, chunk_size)
+    hi = lo if n % 2 else _kth_smallest(values, n // 2, chunk_size)
+    return np.mean([lo, hi])
+
+
+# ----------------------------------------------------
+# prominence peaks of an array too large to search in memory
+# ----------------------------------------------------
+def _block_extremes(values, chunk_size):
+    """Per chunk_size block: (min, max), NaN counted as +inf so a block holding one is never skipped."""
+    mins, maxs = [], []
+    for chunk in iter_chunks(values, chunk_size):
+        chunk = np.where(np.isnan(chunk), np.inf, chunk)
+        mins.append(chunk.min())
+        maxs.append(chunk.max())
+    return np.array(mins), np.array(maxs)
+
+
+def _outer_min(values, v, edge, left, chunk_size, extremes):
+    """
+    Min of values from the block edge `edge` outward (leftward when left) up to,
+    not including, the first value above v (or NaN), or the end of values.
+    Whole blocks below v are taken from their extremes; only the block holding
+    the first higher value is read.
+    """
+    mins, maxs = extremes
+    j = edge // chunk_size
+    if left:
+        higher = np.flatnonzero(maxs[:j] > v)
+        k = int(higher[-1]) if higher.size else -1
+        low = mins[k + 1:j].min(initial=np.inf)
+    else:
+        higher = np.flatnonzero(maxs[j:] > v)
+        k = j + int(higher[0]) if higher.size else len(maxs)
+        low = mins[j:k].min(initial=np.inf)
+    if 0 <= k < len(maxs):
+        block = np.asarray(values[k * chunk_size:(k + 1) * chunk_size], dtype=np.float64)
+        block = np.where(np.isnan(block), np.inf, block)
+        if left:
+            block = block[::-1]
+        stop = int(np.argmax(block > v))
+        low = min(low, block[:stop].min(initial=np.inf))
+    return low
+
+
+def wavelet_peaks(values, threshold, chunk_size=CHUNK_SIZE):
+    """
+    Same indices as scipy.signal.find_peaks(values, prominence=threshold)[0],
+    reading three chunks at a time. Each block is searched with one chunk of
+    halo either side; a peak whose prominence range runs past the halo is
+    finished from per-block extremes, so the whole array is never loaded.
+    """
+    from scipy.signal import find_peaks, peak_prominences
+    n = len(values)
+    extremes = _block_extremes(values, chunk_size)
+    found = []
+    for a in range(0, n, chunk_size):
+        b = min(a + chunk_size, n)
+        lo, hi = max(0, a - chunk_size), min(n, b + chunk_size)
+        # a plateau started in the block has to end inside the window to be a peak
+        while hi < n and np.all(np.asarray(values[b - 1:hi]) == values[b - 1]):
+            hi = min(n, hi + chunk_size)
+        w = np.asarray(values[lo:hi], dtype=np.float64)
+        peaks, props = find_peaks(w, plateau_size=(None, None))
+        edges = props["left_edges"] + lo
+        peaks = peaks[(edges >= a) & (edges < b)]
+        if not len(peaks):
+            continue
+        v = w[peaks]
+        _, left_base, right_base = peak_prominences(w, peaks)
+        left_min, right_min = w[left_base], w[right_base]
+        # no higher value (or NaN) between the peak and the window edge: look further out
+        barrier = np.where(np.isnan(w), np.inf, w)
+        left_open = ~(np.maximum.accumulate(barrier)[peaks - 1] > v) if lo > 0 else np.zeros(len(peaks), bool)
+        right_open = (~(np.maximum.accumulate(barrier[::-1])[::-1][peaks + 1] > v) if hi < n
+                      else np.zeros(len(peaks), bool))
+        for i in np.flatnonzero(left_open):
+            left_min[i] = min(left_min[i], _outer_min(values, v[i], lo, True, chunk_size, extremes))
+        for i in np.flatnonzero(right_open):
+            right_min[i] = min(right_min[i], _outer_min(values, v[i], hi, False, chunk_size, extremes))
+        keep = threshold <= v - np.maximum(left_min, right_min)
+        found.append(peaks[keep] + lo)
+    return np.concatenate(found) if found else np.empty(0, dtype=np.intp)
+
+
+# ----------------------------------------------------
+# chunked driver
+# ----------------------------------------------------
+def run_chunked(data, mode="threshold", engine=ENGINE, chunk_size=CHUNK_SIZE, progress=None,
+                config=DEFAULT_CONFIG, profiler=None, local_max=False):
+    """
+    Same result as detect.run_pipeline(data, mode), computed block by block.
+    data only needs len() and slicing, so a np.memmap is never fully read in.
+    Memory is a few chunks plus the result (O(chunk_size + islands + peaks));
+    the threshold candidates are only kept with local_max=True.
+
+    threshold: blocks are cut between islands (see island_aligned_chunks) and
+    every stage only looks inside one island, so blocks are independent.
+    wavelet: the CWT abs-sum is computed per block with a halo of one kernel
+    length into a temporary memmap, then its median and peaks are taken from
+    it chunk by chunk (see wavelet_peaks).
+    progress("chunks", fraction) is reported after every block.
+    """
+    if mode == "wavelet":
+        return _run_wavelet_chunked(data, chunk_size, progress, config.wavelet_widths, profiler)
+    return merge_threshold(iter_threshold(data, engine, chunk_size, progress, config, profiler), local_max)
+
+
+def iter_threshold(data, engine=ENGINE, chunk_size=CHUNK_SIZE, progress=None, config=DEFAULT_CONFIG,
+                   profiler=None):
+    """
+    (start, result) per island-aligned block, indices relative to the block, in
+    order; merge_threshold of all of them is the run_chunked result. Consumers
+    that write peaks out as they come can shift each block's kept_rows by start
+    and by the number of islands seen so far.
+    """
+    n = len(data)
+    for a, b in island_aligned_chunks(data, chunk_size, config.height):
+        with stage(profiler, "chunk", points=b - a):
+            res = detect.run_pipeline(np.asarray(data[a:b]), "threshold", engine, config=config,
+                                      profiler=profiler)
+        yield a, res
+        detect._report(progress, "chunks", b / n)
+
+
+def _run_wavelet_chunked(data, chunk_size, progress=None, widths=DEFAULT_CONFIG.wavelet_widths,
+                         profiler=None):
+    n = len(data)
+    with tempfile.TemporaryDirectory() as tmp:
+        cwt_sum = np.lib.format.open_memmap(os.path.join(tmp, "cwt_sum.npy"), mode="w+",
+                                            dtype=np.float64, shape=(n,))
+        for a in range(0, n, chunk_size):
+            stop = min(a + chunk_size, n)
+            with stage(profiler, "cwt", points=stop - a, widths=len(widths)):
+                cwt_sum[a:stop] = detect._cwt_abs_sum(data, widths, a, stop)
+            detect._report(progress, "chunks", stop / n)
+        with stage(profiler, "median", points=n):
+            median = chunked_median(cwt_sum, chunk_size)
+        with stage(profiler, "peaks") as counts:
+            peaks = wavelet_peaks(cwt_sum, median * 0.5, chunk_size)
+            counts["peaks"] = len(peaks)
+        del cwt_sum
+    return {"kept_rows": PeakTable.from_columns(peaks, np.asarray(data)[peaks])}
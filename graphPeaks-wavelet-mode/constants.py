@@ -1,7 +1,52 @@
 #Configuration Parameters
+import os
+import dataclasses
+import multiprocessing
+from dataclasses import dataclass
+from typing import Callable, Tuple
+
 APEX_MIN_SEPARATION = 2 #This is our minimum distance required between distinct maxima so we don't call everything a peak apex
 APEX_MIN_HEIGHT = 10 #Minimum y-value required to consider a point a valid peak
 ALPHA = 0.5 #if peaks are spiky .4 or peaks rly broad .6
+ENGINE = "numpy" #threshold pipeline backend: "numpy" (vectorized) or "python" (reference loops)
+WAVELET_BLOCK = 8192 #points per FFT block in wavelet mode, bounds the CWT working memory
+CHUNK_SIZE = 1_000_000 #points per block for chunked (bounded memory) detection
+WORKERS = os.cpu_count() or 1 #processes for parallel detection, 1 runs in-process
+#how pool workers start: never plain fork, the GUI's threads may hold locks (imports, tile prefetch) at that moment
+POOL_START = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+TILE_SIZE = 10000 #points per tile when plotting large files in tile mode
+TILE_CACHE_BYTES = 256 << 20 #in-memory budget for loaded tiles and pyramid blocks in tile mode
+REDRAW_DELAY_MS = 15 #pan/zoom redraws wait this long for the view to settle
+FOLLOW_INTERVAL_MS = 1000 #how often a followed file is checked for appended data
+STARTUP_BUDGET = 1.5 #seconds from launch to a shown window, checked by startup.py
+PYRAMID_BASE = 8 #points per bucket in the finest min/max plotting level, each level above doubles it
+CACHE_DIR = os.environ.get("GRAPHPEAKS_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "graphpeaks")) #per-source tile stores
+CACHE_MAX_SOURCES = 20 #oldest per-source cache folders beyond this are removed
+CACHE_GRACE = 600 #seconds a cache folder is safe from pruning after its last use (another process may be filling it)
+VIEW_CHUNK = 65536 #grid step of the chunks whose viewport detection results are cached
+NOISE_WINDOW = 100_000 #points per window when estimating the noise floor
+NOISE_K = 5.0 #suggested height = noise baseline + NOISE_K * noise spread
+VIEW_CACHE_ENTRIES = 1024 #cached chunk results kept per dataset (least recently used dropped first)
 
 def radius_rule(width: int) -> int:
-    return max(2, round(width/3))
\ No newline at end of file
+    return max(2, round(width/3))
+
+
+@dataclass(frozen=True)
+class DetectionConfig:
+    """
+    Detection parameters for one run, passed explicitly to every stage so runs
+    with different settings can share a process. Immutable and hashable: use
+    config.replace(height=...) for a variant and the config itself as a cache key.
+    The radius rule must be a module-level function for process-pool runs.
+    """
+    height: float = APEX_MIN_HEIGHT
+    alpha: float = ALPHA
+    separation: int = APEX_MIN_SEPARATION
+    radius_rule: Callable[[int], int] = radius_rule
+    wavelet_widths: Tuple[int, ...] = tuple(range(1, 50))
+
+    def replace(self, **changes):
+        return dataclasses.replace(self, **changes)
+
+DEFAULT_CONFIG = DetectionConfig()
@@ -1,8 +1,20 @@
 #Detection Pipeline
+#scipy is imported inside the wavelet functions: threshold runs (and the GUI's startup)
+#never load it
+from functools import lru_cache
 import numpy as np
-import matplotlib.pyplot as plt
-from constants import APEX_MIN_HEIGHT, APEX_MIN_SEPARATION, ALPHA
-from scipy.signal import find_peaks
+from constants import (APEX_MIN_HEIGHT, APEX_MIN_SEPARATION, ALPHA, ENGINE, WAVELET_BLOCK, CHUNK_SIZE,
+                       DEFAULT_CONFIG, radius_rule)
+from profiling import stage
+from peak_table import PeakTable, islands_array
+
+class DetectionCancelled(Exception):
+    """Raised from a progress callback to stop a running detection."""
+
+def _report(progress, stage, fraction):
+    # progress(stage, fraction) is the hook for progress bars and cancellation
+    if progress is not None:
+        progress(stage, fraction)
 
 # --- lightweight internal wavelet implementation ---
 def _ricker_wavelet(width):
@@ -13,27 +25,69 @@ def _ricker_wavelet(width):
     xsq = (x / width) ** 2
     return A * (1 - xsq) * np.exp(-xsq / 2)
 
-def _cwt(data, widths):
-    """Very small custom Continuous Wavelet Transform using Ricker kernel."""
-    cwt_matrix = np.zeros((len(widths), len(data)))
+@lru_cache(maxsize=None)
+def _ricker_kernel(width):
+    """Read-only Ricker kernel, built once per width."""
+    kernel = _ricker_wavelet(width)
+    kernel.flags.writeable = False
+    return kernel
+
+@lru_cache(maxsize=8)
+def _kernel_bank(widths, nfft):
+    """
+    Spectra of all kernels zero-padded to nfft. Each kernel is rolled by its
+    'same'-mode center so every row of the product lines up with the input.
+    """
+    from scipy.fft import rfft
+    bank = np.zeros((len(widths), nfft))
     for i, w in enumerate(widths):
-        wavelet = _ricker_wavelet(w)
-        conv = np.convolve(data, wavelet, mode="same")
-        cwt_matrix[i, :] = conv
-    return cwt_matrix
+        kernel = _ricker_kernel(w)
+        bank[i, :len(kernel)] = kernel
+        bank[i] = np.roll(bank[i], -((len(kernel) - 1) // 2))
+    return rfft(bank, axis=1)
+
+def _cwt_abs_sum(data, widths, start=0, stop=None, block=WAVELET_BLOCK, progress=None):
+    """
+    sum(abs(CWT), axis=0) over data[start:stop] using the Ricker kernel.
+    Overlap-save FFT convolution on a fixed grid of blocks: only one block of
+    len(widths) rows is ever in memory, never the full widths x data matrix,
+    and a block gives the same values whichever range asked for it.
+    """
+    from scipy.fft import rfft, irfft, next_fast_len
+    n = len(data)
+    stop = n if stop is None else stop
+    widths = tuple(np.asarray(widths).tolist())
+    halo = max(len(_ricker_kernel(w)) for w in widths)
+    nfft = next_fast_len(block + 2 * halo, real=True)
+    bank = _kernel_bank(widths, nfft)
+    l1 = np.array([np.abs(_ricker_kernel(w)).sum() for w in widths])
+    out = np.empty(max(stop - start, 0))
+    for a in range(start - start % block, stop, block):
+        b = min(a + block, n)
+        lo, hi = max(a - halo, 0), min(b + halo, n)
+        seg = np.zeros(nfft)
+        seg[lo - (a - halo):hi - (a - halo)] = data[lo:hi]
+        rows = np.abs(irfft(rfft(seg) * bank, nfft, axis=1)[:, halo:halo + b - a])
+        # FFT round-off leaves ~1e-16 residue where the direct sum is exactly 0
+        rows[rows < 1e-11 * np.abs(seg).max() * l1[:, None]] = 0.0
+        acc = rows.sum(axis=0)
+        lo, hi = max(a, start), min(b, stop)
+        out[lo - start:hi - start] = acc[lo - a:hi - a]
+        _report(progress, "cwt", (hi - start) / max(stop - start, 1))
+    return out
 
 # ----------------------------------------------------
 # threshold-based helper functions
 # ----------------------------------------------------
-def islands_of_activity(data):
+def islands_of_activity(data, height=APEX_MIN_HEIGHT):
     new_start = True
     islands = []
     start = None
     for index, value in enumerate(data):
-        if value >= APEX_MIN_HEIGHT and new_start:
+        if value >= height and new_start:
             start = index
             new_start = False
-        elif value < APEX_MIN_HEIGHT and not new_start:
+        elif value < height and not new_start:
             end = index - 1
             new_start = True
             islands.append([start, end])
@@ -84,55 +138,302 @@ def width_per_island(data, islands, local_max, ALPHA):
         widths_per_island.append(W)
     return widths_per_island
 
-def radius_from_width(width_per_island):
-    return [max(2, round(w/3)) for w in width_per_island]
+def radius_from_width(width_per_island, rule=radius_rule):
+    return [rule(w) for w in width_per_island]
 
 def flatten_candidates(local_max):
     return [[i,v,r] for r, arr in enumerate(local_max) for i,v in arr]
 
-def apex_min_separation(global_candidates, radius_per_island):
-    cands = sorted(global_candidates, key=lambda p:(-p[1],p[0]))
+def apex_min_separation(global_candidates, radius_per_island, separation=APEX_MIN_SEPARATION):
+    # NMS only compares peaks of the same island, so run it island by island. Every
+    # kept peak marks the indices within R of it as suppressed; kept peaks are at
+    # least R apart, so the marks cost O(island span) and each candidate one lookup.
+    by_island = {}
+    for idx,val,rid in global_candidates:
+        by_island.setdefault(rid, []).append([idx,val,rid])
     kept = []
-    for idx,val,rid in cands:
-        R = max(2,int(radius_per_island[rid])); keep=True
-        for k_i, k_v, k_r in kept:
-            if k_r==rid and abs(idx-k_i)<R:
-                keep=False; break
-        if keep: kept.append([idx,val,rid])
-    kept.sort(key=lambda p:(p[2],p[0]))
+    for rid in sorted(by_island):
+        R = max(separation,int(radius_per_island[rid]))
+        cands = by_island[rid]
+        lo = min(p[0] for p in cands)
+        suppressed = np.zeros(max(p[0] for p in cands) - lo + 1, dtype=bool)
+        rows = []
+        for idx,val,_ in sorted(cands, key=lambda p:(-p[1],p[0])):
+            if suppressed[idx-lo]: continue
+            suppressed[max(0, idx-lo-R+1):idx-lo+R] = True
+            rows.append([idx,val,rid])
+        rows.sort(key=lambda p:p[0])
+        kept.extend(rows)
     return kept
 
+# ----------------------------------------------------
+# vectorized (numpy) engine for the threshold pipeline
+# same islands / maxima / widths as the loops above
+# ----------------------------------------------------
+def _island_mask(data, height=APEX_MIN_HEIGHT):
+    """Boolean "inside an island" mask, same rules as islands_of_activity."""
+    mask = data >= height
+    if data.dtype.kind == "f":
+        nan = np.isnan(data)
+        if nan.any():
+            # a NaN neither opens nor closes an island, it keeps the previous state
+            src = np.where(nan, 0, np.arange(len(data)))
+            np.maximum.accumulate(src, out=src)
+            mask = mask[src] & ~nan[src]
+    return mask
+
+def _island_bounds(mask):
+    """Start and end (inclusive) index arrays of the True runs of mask."""
+    edges = np.flatnonzero(np.diff(mask, prepend=False, append=False))
+    return edges[0::2], edges[1::2] - 1
+
+def _local_maxima_np(data, mask, starts, ends):
+    """Candidate (index, value, island) arrays, plateaus collapsed to their center."""
+    n = len(data)
+    # brk[p]: a run of equal values ends between p-1 and p
+    brk = np.ones(n + 1, dtype=bool)
+    np.not_equal(data[1:], data[:-1], out=brk[1:n])
+    brk[starts] = True
+    brk[ends + 1] = True
+    rs = np.flatnonzero(brk[:n] & mask)
+    re = np.flatnonzero(brk[1:] & mask)
+    isl = np.searchsorted(starts, rs, side="right") - 1
+    vals = data[rs]
+    at_start = rs == starts[isl]
+    at_end = re == ends[isl]
+    gt_left = np.where(at_start, vals > -np.inf, vals > data[rs - 1])
+    right = data[np.minimum(re + 1, n - 1)]
+    gt_right = np.where(at_end, vals > -np.inf,
+                        np.where(re > rs, vals > right, vals >= right))
+    keep = gt_left & gt_right
+    return (rs[keep] + re[keep]) // 2, vals[keep], isl[keep]
+
+def _min_levels(data):
+    """Minima of aligned blocks of 2, 4, 8, ... points, packed in one buffer."""
+    sizes = []
+    m = len(data) // 2
+    while m:
+        sizes.append(m)
+        m //= 2
+    offs = np.concatenate([[0], np.cumsum(sizes)]).astype(np.int64)
+    flat = np.empty(offs[-1], dtype=data.dtype)
+    prev = data
+    for k, m in enumerate(sizes):
+        cur = flat[offs[k]:offs[k + 1]]
+        np.minimum(prev[0:2 * m:2], prev[1:2 * m:2], out=cur)
+        prev = cur
+    return flat, offs
+
+def _run_length_np(data, levels, idx, thr, bound, right):
+    """
+    Number of consecutive points next to idx (left or right, not past bound)
+    with data >= thr.  Walks the block-minimum pyramid: climb to larger blocks
+    while they pass, then binary-search inside the first block that fails.
+    """
+    flat, offs = levels
+    top = len(offs) - 1
+    pos = idx + 1 if right else idx.copy()
+    k = np.zeros(len(idx), dtype=np.int64)
+    up = np.ones(len(idx), dtype=bool)
+    act = np.arange(len(idx))
+    while act.size:
+        p, kk = pos[act], k[act]
+        size = np.left_shift(1, kk)
+        if right:
+            ok = p + size - 1 <= bound[act]
+            blk = p >> kk
+        else:
+            ok = p - size >= bound[act]
+            blk = (p >> kk) - 1
+        blk = np.where(ok, blk, 0)
+        lvl = kk > 0
+        v = data[blk]
+        v[lvl] = flat[offs[kk[lvl] - 1] + blk[lvl]]
+        ok &= v >= thr[act]
+        p = np.where(ok, p + size if right else p - size, p)
+        pos[act] = p
+        u = up[act]
+        climb = u & ok & ((p >> kk) & 1 == 0) & (kk < top)
+        done = (kk == 0) & (~ok | ~u)
+        kk = np.where(climb, kk + 1, np.where(u & ok, kk, kk - 1))
+        k[act] = kk
+        up[act] = u & ok
+        act = act[~done]
+    return pos - idx - 1 if right else idx - pos
+
+def _widths_np(data, cand_idx, cand_val, cand_isl, starts, ends, alpha=ALPHA):
+    """Per-island median width W, same rule as width_per_island."""
+    thr = alpha * cand_val
+    levels = _min_levels(data)
+    left = _run_length_np(data, levels, cand_idx, thr, starts[cand_isl], right=False)
+    right = _run_length_np(data, levels, cand_idx, thr, ends[cand_isl], right=True)
+    return _median_widths(left + right + 1, cand_isl, ends - starts + 1)
+
+def _median_widths(w, cand_isl, length):
+    """
+    Per-island median of the candidate widths w, clamped to [3, island length];
+    an island without candidates gets its length.
+    """
+    counts = np.bincount(cand_isl, minlength=len(length))
+    ws = w[np.lexsort((w, cand_isl))]
+    mid = np.cumsum(counts) - counts + counts // 2
+    odd = counts % 2 == 1
+    even = (counts > 0) & ~odd
+    W = length.copy()
+    W[odd] = ws[mid[odd]]
+    W[even] = (ws[mid[even] - 1] + ws[mid[even]]) // 2
+    return np.maximum(3, np.minimum(W, length))
+
+def _radii_np(W, rule=radius_rule):
+    """rule applied to every island width (vectorized for the default rule)."""
+    if rule is radius_rule:
+        return np.maximum(2, np.rint(W / 3)).astype(np.int64)
+    return np.array([rule(int(w)) for w in W], dtype=np.int64)
+
+def _separate_np(idx, val, isl, R, separation=APEX_MIN_SEPARATION, memo=None):
+    """
+    Positions in the candidate arrays that apex_min_separation keeps, in index order.
+    Single-candidate islands are kept as they are; the others are resolved island
+    by island, memoized by (island, radius) in memo when one is given.
+    """
+    counts = np.bincount(isl, minlength=len(R))
+    single = counts[isl] == 1
+    keep = [np.flatnonzero(single)]
+    multi = np.flatnonzero(~single)
+    if multi.size:
+        bounds = np.flatnonzero(np.diff(isl[multi], prepend=-1, append=-1))
+        for a, b in zip(bounds[:-1].tolist(), bounds[1:].tolist()):
+            rows = multi[a:b]
+            rid = int(isl[rows[0]])
+            key = (rid, int(R[rid]))
+            kept = memo.get(key) if memo is not None else None
+            if kept is None:
+                kept = apex_min_separation(
+                    zip(idx[rows].tolist(), val[rows].tolist(), [rid] * len(rows)), R, separation)
+                # candidate indices are sorted and unique: map the kept ones back
+                kept = np.searchsorted(idx, [p[0] for p in kept])
+                if memo is not None:
+                    memo[key] = kept
+            keep.append(kept)
+    return np.sort(np.concatenate(keep)).astype(np.int64)
+
+def _threshold_numpy(data, progress=None, config=DEFAULT_CONFIG, profiler=None):
+    """
+    Vectorized threshold pipeline, same stage outputs as the reference loops:
+    islands array, candidates PeakTable, W and R arrays.
+    """
+    data = np.asarray(data)
+    _report(progress, "islands", 0.0)
+    with stage(profiler, "islands", points=len(data)) as counts:
+        mask = _island_mask(data, config.height)
+        starts, ends = _island_bounds(mask)
+        counts["islands"] = len(starts)
+    _report(progress, "maxima", 0.2)
+    with stage(profiler, "maxima") as counts:
+        cand_idx, cand_val, cand_isl = _local_maxima_np(data, mask, starts, ends)
+        counts["candidates"] = len(cand_idx)
+    _report(progress, "widths", 0.4)
+    with stage(profiler, "widths", candidates=len(cand_idx)):
+        W = _widths_np(data, cand_idx, cand_val, cand_isl, starts, ends, config.alpha)
+        R = _radii_np(W, config.radius_rule)
+    cands = PeakTable.from_columns(cand_idx, cand_val, cand_isl, W[cand_isl], R[cand_isl])
+    return islands_array(starts, ends), cands, W.astype(np.int64), R
+
 # ----------------------------------------------------
 # main pipeline
 # ----------------------------------------------------
-def run_pipeline(data, mode="threshold"):
+def run_pipeline(data, mode="threshold", engine=ENGINE, chunk_size=None, workers=1, progress=None,
+                 config=DEFAULT_CONFIG, profiler=None):
+    """
+    Detect peaks in data with the parameters in config (a constants.DetectionConfig).
+    workers > 1 runs on a process pool, chunk_size runs in bounded memory; both
+    give the same result. progress(stage, fraction) is called between stages
+    and may raise DetectionCancelled to stop the run. With a profiling.StageProfiler
+    every stage is timed, and the outermost call adds its summary as "profile".
+    """
+    outer = profiler is not None and not profiler.active()
+    since = profiler.mark() if outer else 0
+    # nested runs (chunks, cache misses) are covered by their caller's stage
+    with stage(profiler if outer else None, "run_pipeline", points=len(data)):
+        result = _run_pipeline(data, mode, engine, chunk_size, workers, progress, config, profiler)
+    if outer:
+        result["profile"] = profiler.summary(since)
+    return result
+
+def _run_pipeline(data, mode, engine, chunk_size, workers, progress, config, profiler):
+    if workers > 1:
+        from parallel import run_parallel
+        return run_parallel(data, mode=mode, engine=engine, workers=workers,
+                            chunk_size=chunk_size or CHUNK_SIZE, progress=progress, config=config,
+                            profiler=profiler)
+    if chunk_size is not None:
+        from chunked import run_chunked
+        return run_chunked(data, mode=mode, engine=engine, chunk_size=chunk_size, progress=progress,
+                           config=config, profiler=profiler)
     if mode == "wavelet":
-        return run_wavelet_mode(data)
+        return run_wavelet_mode(data, config.wavelet_widths, progress=progress, profiler=profiler)
 
-    islands = islands_of_activity(data)
-    local_max = find_local_maxima(islands, data)
-    W_by_island = width_per_island(data, islands, local_max, ALPHA)
-    R_by_island = radius_from_width(W_by_island)
-    global_cands = flatten_candidates(local_max)
-    kept = apex_min_separation(global_cands, R_by_island)
+    if engine == "numpy":
+        islands, local_max, W_by_island, R_by_island = _threshold_numpy(data, progress, config, profiler)
+        _report(progress, "nms", 0.6)
+        with stage(profiler, "nms") as counts:
+            kept = _separate_np(local_max["index"], local_max["value"], local_max["region_id"],
+                                R_by_island, config.separation)
+            counts["candidates"], counts["kept"] = len(local_max), len(kept)
+        return {"islands": islands, "local_max": local_max,
+                "W_by_island": W_by_island, "R_by_island": R_by_island,
+                "kept_rows": local_max[kept]}
+    elif engine == "python":
+        _report(progress, "islands", 0.0)
+        with stage(profiler, "islands", points=len(data)) as counts:
+            islands = islands_of_activity(data, config.height)
+            counts["islands"] = len(islands)
+        _report(progress, "maxima", 0.2)
+        with stage(profiler, "maxima") as counts:
+            local_max = find_local_maxima(islands, data)
+            counts["candidates"] = sum(len(c) for c in local_max)
+        _report(progress, "widths", 0.4)
+        with stage(profiler, "widths"):
+            W_by_island = width_per_island(data, islands, local_max, config.alpha)
+            R_by_island = radius_from_width(W_by_island, config.radius_rule)
+    else:
+        raise ValueError(f"Unknown engine: {engine}")
+    _report(progress, "nms", 0.6)
+    with stage(profiler, "nms") as counts:
+        global_cands = flatten_candidates(local_max)
+        kept = apex_min_separation(global_cands, R_by_island, config.separation)
+        counts["candidates"], counts["kept"] = len(global_cands), len(kept)
+    _report(progress, "rows", 0.9)
 
-    rows = [{
-        "index": int(i), "value": float(v), "region_id": int(r),
-        "W_region": int(W_by_island[r]), "R_region": int(R_by_island[r])
-    } for (i,v,r) in kept]
+    # the reference loops work on lists; hand back the same columnar result as numpy
+    with stage(profiler, "rows", rows=len(kept)):
+        W = np.asarray(W_by_island, dtype=np.int64)
+        R = np.asarray(R_by_island, dtype=np.int64)
+        return {"islands": islands_array([s for s, _ in islands], [e for _, e in islands]),
+                "local_max": _table(global_cands, W, R), "W_by_island": W, "R_by_island": R,
+                "kept_rows": _table(kept, W, R)}
 
-    return {"islands": islands, "local_max": local_max,
-            "W_by_island": W_by_island, "R_by_island": R_by_island,
-            "kept_rows": rows}
+def _table(triples, W, R):
+    """PeakTable of [index, value, region_id] triples with their island's W and R."""
+    idx, val, rid = (np.array(col) for col in zip(*triples)) if triples else ((), (), ())
+    rid = np.asarray(rid, dtype=np.int64)
+    return PeakTable.from_columns(idx, val, rid, W[rid], R[rid])
 
 # ----------------------------------------------------
 # wavelet mode (independent of SciPy CWT)
 # ----------------------------------------------------
-def run_wavelet_mode(data, widths=np.arange(1,50)):
+def run_wavelet_mode(data, widths=DEFAULT_CONFIG.wavelet_widths, progress=None, profiler=None):
     """Adaptive peak detection using local Ricker CWT."""
-    cwt_matrix = _cwt(data, widths)
-    cwt_sum = np.sum(np.abs(cwt_matrix), axis=0)
-    peaks,_ = find_peaks(cwt_sum, prominence=np.median(cwt_sum)*0.5)
-    rows=[{"index":int(p),"value":float(data[p]),"region_id":-1,
-           "W_region":0,"R_region":0} for p in peaks]
-    return {"kept_rows": rows}
+    with stage(profiler, "cwt", points=len(data), widths=len(widths)):
+        cwt_sum = _cwt_abs_sum(data, widths, progress=progress)
+    _report(progress, "peaks", 1.0)
+    with stage(profiler, "peaks") as counts:
+        result = wavelet_rows(data, cwt_sum, np.median(cwt_sum))
+        counts["peaks"] = len(result["kept_rows"])
+    return result
+
+def wavelet_rows(data, cwt_sum, median):
+    """Peaks of the CWT abs-sum, prominence relative to its median."""
+    from scipy.signal import find_peaks
+    peaks,_ = find_peaks(cwt_sum, prominence=median*0.5)
+    return {"kept_rows": PeakTable.from_columns(peaks, np.asarray(data)[peaks])}
@@ -1,179 +1,144 @@
-#The GUI. Creates main window, contains controls, embeds PlotWidget and a QTableView for peaks,
-#connects signals, handles file dialogs, status msgs, export, and simple validation
-from PyQt5.QtWidgets import (
-    QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QFileDialog, QTableView, QMessageBox, QStatusBar, QLabel,
-    QSpinBox, QDoubleSpinBox, QComboBox, QApplication
-)
-from PyQt5.QtCore import Qt
-from PyQt5.QtWidgets import QCheckBox
-import os
-from io_utils import save_tiles, load_csv
-from plot_widget import PlotWidget
-from io_utils import export_peaks_csv
+#Background detection for the GUI. DetectionWorker runs detect.run_pipeline on a QThread,
+#forwards stage progress, stops cooperatively when cancelled, and tags every job with a
+#generation number so the window can drop results that belong to an older run or viewport.
+#Viewport jobs go through a result_cache.ResultCache so already analyzed chunks are reused.
+#With a profiling.StageProfiler every job is one "detection" stage and its result carries
+#the summary of that job's stages as "profile".
+import numpy as np
+from PyQt5.QtCore import QThread, pyqtSignal
 import constants as C
-from detection_thread_utils import DetectionWorker, get_visible_range, downsample_line
-
+from detect import run_pipeline, DetectionCancelled
+from sweep import sweep
+from chunked import merge_threshold
+from noise import estimate_noise, window_heights, run_adaptive
+from profiling import stage
+
+
+def get_visible_range(ax, n):
+    """[start, end) indices of the series inside the axes' current xlim."""
+    xmin, xmax = ax.get_xlim()
+    start = min(max(0, int(np.floor(xmin))), n)
+    end = min(max(0, int(np.ceil(xmax)) + 1), n)
+    return start, max(start, end)
+
+
+class JobThread(QThread):
+    """Base for cancellable jobs: subclasses implement job(progress) and return its result."""
+    # every signal carries the job's generation first
+    progress = pyqtSignal(int, str, float)   # generation, stage, fraction
+    done = pyqtSignal(int, object)           # generation, result
+    failed = pyqtSignal(int, str)            # generation, error message
+    cancelled = pyqtSignal(int)              # generation
+
+    def __init__(self, generation, parent=None):
+        super().__init__(parent)
+        self.generation = generation
+        self._cancel = False
 
-class MainWindow(QMainWindow):
+    def cancel(self):
+        """Ask the job to stop at its next progress checkpoint."""
+        self._cancel = True
 
-    def on_detection_done(self, result, offset):
-        # Apply offset to peak indices
-        for row in result["kept_rows"]:
-            row["index"] += offset
+    def is_cancelled(self):
+        return self._cancel
 
-        self.rows = result["kept_rows"]
-        self.islands = result.get("islands", [])
-        self.W_by_island = result.get("W_by_island", [])
-        self.R_by_island = result.get("R_by_island", [])
+    def _on_progress(self, stage, fraction):
+        if self._cancel:
+            raise DetectionCancelled()
+        self.progress.emit(self.generation, stage, fraction)
 
-        self.plot.set_islands(self.islands)
-        self.plot.set_peaks(self.rows)
-        self.statusBar().showMessage(f"Detected {len(self.rows)} peaks", 3000)
+    def job(self, progress):
+        raise NotImplementedError
 
-    def __init__(self, parent=None):
-        super().__init__(parent)
-        self.setWindowTitle("Peak Finder")
-
-        # Persistent attributes
-        self.x = None
-        self.y = None
-        self.rows = []
-        self.islands = []
-        self.W_by_island = []
-        self.R_by_island = []
-        self.current_csv_path = None
-
-        # Main layout setup
-        central = QWidget(self)
-        ly = QVBoxLayout(central)
-        central.setLayout(ly)
-        self.setCentralWidget(central)
-
-        # Plot widget
-        self.plot = PlotWidget(self)
-        ly.addWidget(self.plot)
-
-        # Status bar
-        self.statusBar().showMessage("Ready")
-
-        # Controls layout
-        controls = QHBoxLayout()
-
-        # Buttons
-        btn_open = QPushButton("Open CSV/TXT...", self)
-        btn_run = QPushButton("Run", self)
-
-        # Detection mode selector
-        self.mode_box = QComboBox(self)
-        self.mode_box.addItems(["threshold", "wavelet"])
-        controls.addWidget(QLabel("Mode:"))
-        controls.addWidget(self.mode_box)
-
-        # Full dataset toggle
-        self.full_run_box = QCheckBox("Full Dataset")
-        self.full_run_box.setChecked(False)
-        controls.addWidget(self.full_run_box)
-
-        # Tile Mode Selector
-        self.tile_box = QComboBox(self)
-        self.tile_box.addItems(["auto", "on", "off"])
-        controls.addWidget(QLabel("Tile Mode:"))
-        controls.addWidget(self.tile_box)
-
-        # --- Threshold control (re-added) ---
-        controls.addWidget(QLabel("Min Height:"))
-        self.threshold_box = QDoubleSpinBox(self)
-        self.threshold_box.setRange(0, 1e9)
-        self.threshold_box.setDecimals(1)
-        self.threshold_box.setValue(C.APEX_MIN_HEIGHT)
-        controls.addWidget(self.threshold_box)
-
-        # Add buttons to layout
-        controls.addWidget(btn_open)
-        controls.addWidget(btn_run)
-
-        # Insert control bar above plot
-        ly.insertLayout(0, controls)
-
-        # Wire up signals
-        btn_open.clicked.connect(self.on_open_csv)
-        btn_run.clicked.connect(self.on_run)
-        self.mode_box.currentTextChanged.connect(self.on_mode_changed)
-
-        # Async detection thread object
-        self.detector = None
-
-        # For downsampled overview mode
-        self.overview_enabled = True
-        self.overview_threshold = 50_000
-
-    def on_mode_changed(self, mode):
-        self.threshold_box.setEnabled(mode != "wavelet")
-
-    def on_open_csv(self):
-        path, _ = QFileDialog.getOpenFileName(self, "Open CSV", "", "Data files (*.csv *.txt);;All Files (*)")
-        if not path:
+    def run(self):
+        try:
+            result = self.job(self._on_progress)
+        except DetectionCancelled:
+            self.cancelled.emit(self.generation)
             return
-
-        x, y = load_csv(path)
-        self.x, self.y = x, y
-        self.current_csv_path = path
-
-        self.rows = []
-        self.islands = []
-        self.W_by_island = []
-        self.R_by_island = []
-
-        if len(y) > 5_000_000:
-            tile_dir = os.path.join(os.getcwd(), "tiles")
-            save_tiles(y, tile_size=10000, out_dir=tile_dir)
-            self.plot.enable_tile_mode(tile_dir)
-            self.statusBar().showMessage(f"Loaded {len(y):,} points using tile mode", 3000)
-        else:
-            self.plot.set_series(x, y)
-            self.statusBar().showMessage(f"Loaded {len(x)} points from {path}", 3000)
-
-    def on_run(self):
-        if self.x is None:
-            QMessageBox.warning(self, "No data", "Load a data file first.")
+        except Exception as e:
+            self.failed.emit(self.generation, f"{type(e).__name__}: {e}")
             return
-
-        mode = self.mode_box.currentText()
-        tile_pref = self.tile_box.currentText()
-
-        if mode == "threshold":
-            C.APEX_MIN_HEIGHT = self.threshold_box.value()
-
-        self.plot.set_islands([])
-        self.plot.set_peaks([])
-
-        if self.full_run_box.isChecked():
-            y_slice = self.y
-            offset = 0
+        if self._cancel:
+            self.cancelled.emit(self.generation)
         else:
-            start_idx, end_idx = get_visible_range(self.plot.ax, len(self.y))
-            y_slice = self.y[start_idx:end_idx]
-            offset = start_idx
-
-        if self.full_run_box.isChecked():
-            self.statusBar().showMessage(f"Running {mode} detection on full dataset...")
+            self.done.emit(self.generation, result)
+
+
+class DetectionWorker(JobThread):
+
+    def __init__(self, y_data, mode, generation, engine=C.ENGINE, chunk_size=None, workers=1,
+                 cache=None, view=None, config=C.DEFAULT_CONFIG, auto_height=None, noise=None, profiler=None,
+                 parent=None):
+        """
+        With cache and view=(start, stop), detects cache.data[start:stop] with full-series indices.
+        auto_height "file" or "window" takes the height from noise.estimate_noise of y_data
+        (or from `noise`, an earlier estimate of it); the result then carries "noise" and "height".
+        """
+        super().__init__(generation, parent)
+        self.y_data = y_data
+        self.mode = mode
+        self.engine = engine
+        self.chunk_size = chunk_size
+        self.workers = workers
+        self.cache = cache
+        self.view = view
+        self.config = config
+        self.auto_height = auto_height
+        self.noise = noise
+        self.profiler = profiler
+
+    def job(self, progress):
+        since = self.profiler.mark() if self.profiler is not None else 0
+        with stage(self.profiler, "detection", mode=self.mode) as counts:
+            result = self.detect_auto(progress)
+            counts["peaks"] = len(result["kept_rows"])
+        if self.profiler is not None:
+            result["profile"] = self.profiler.summary(since)
+        return result
+
+    def detect_auto(self, progress):
+        if self.auto_height is None:
+            return self.detect(progress, self.config)
+        if self.noise is not None:
+            noise = self.noise
         else:
-            self.statusBar().showMessage(f"Running {mode} detection on {end_idx - start_idx:,} visible points...")
-
-        QApplication.processEvents()
-
-        self.detector = DetectionWorker(y_data=y_slice, mode=mode)
-        self.detector.finished.connect(lambda res: self.on_detection_done(res, offset))
-        self.detector.error.connect(lambda e: QMessageBox.critical(self, "Error", str(e)))
-        self.detector.start()
-
-
-if __name__ == "__main__":
-    import sys
-    from PyQt5.QtWidgets import QApplication
-
-    app = QApplication(sys.argv)
-    win = MainWindow()
-    win.show()
-    sys.exit(app.exec_())
+            with stage(self.profiler, "noise", points=len(self.y_data)):
+                noise = estimate_noise(self.y_data, progress=progress)
+        if self.auto_height == "window" and self.mode == "threshold":
+            start, stop = self.view if self.view is not None else (0, len(self.y_data))
+            spans = window_heights(noise, start, stop)
+            res = run_adaptive(self.y_data[start:stop], spans, self.engine, self.config, progress,
+                               profiler=self.profiler)
+            result = merge_threshold([(start, res)])
+            height = None
+        else:
+            height = noise["height"]
+            result = self.detect(progress, self.config.replace(height=height))
+        result["noise"] = noise
+        result["height"] = height
+        return result
+
+    def detect(self, progress, config):
+        if self.cache is not None:
+            return self.cache.detect(*self.view, mode=self.mode, engine=self.engine,
+                                     progress=progress, config=config, profiler=self.profiler)
+        return run_pipeline(self.y_data, mode=self.mode, engine=self.engine,
+                            chunk_size=self.chunk_size, workers=self.workers,
+                            progress=progress, config=config, profiler=self.profiler)
+
+
+class SweepWorker(JobThread):
+    """Runs sweep.sweep over a (height, alpha) grid."""
+
+    def __init__(self, y_data, heights, alphas, generation, config=C.DEFAULT_CONFIG, view=None, parent=None):
+        super().__init__(generation, parent)
+        self.y_data = y_data
+        self.heights = heights
+        self.alphas = alphas
+        self.config = config
+        self.view = view
+
+    def job(self, progress):
+        return sweep(self.y_data, self.heights, self.alphas, progress=progress, config=self.config,
+                     view=self.view)
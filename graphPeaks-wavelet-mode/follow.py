@@ -0,0 +1,201 @@
+#Follow mode: watch an input file that another program is still appending to (an aligner
+#writing coverage). FileTail reads only the bytes added since the last read, the series
+#and its plotting pyramid grow in place, and IncrementalDetector runs threshold detection
+#only from the last closed island onward, so each update costs about the new data.
+import io
+import os
+import tempfile
+import numpy as np
+from constants import ENGINE, DEFAULT_CONFIG
+import detect
+from io_utils import TEXT_EXTENSIONS, RAW_EXTENSIONS, _sniff, _raw_descriptor
+from peak_table import PeakTable, PEAK_FIELDS
+from pyramid import GrowingArray, GrowingPyramid
+
+FOLLOW_BLOCK = 1 << 26  # bytes read per FileTail.read()
+FOLLOW_POLL = 1 << 24   # bytes read per FollowSession.poll(), so one poll never holds up the GUI for long
+FOLLOW_EXTENSIONS = TEXT_EXTENSIONS + RAW_EXTENSIONS
+
+
+class FileTail:
+    """
+    Records appended to a .csv/.txt file or a raw file (see io_utils._read_raw)
+    since the last read(). Only complete lines or records are consumed, a
+    partial last one is left for the next read.
+    """
+
+    def __init__(self, path):
+        ext = os.path.splitext(path)[1].lower()
+        if ext not in FOLLOW_EXTENSIONS:
+            raise ValueError(f"Follow mode reads {', '.join(FOLLOW_EXTENSIONS)} files, not {ext}")
+        self.path = path
+        self.text = ext in TEXT_EXTENSIONS
+        self.header = ext == ".csv"
+        self.sep = self.ncols = None
+        self.offset = 0
+        if not self.text:
+            self.dtype, self.offset, self.ncols, _ = _raw_descriptor(path)
+
+    def read(self, limit=FOLLOW_BLOCK):
+        """(x, y) of up to `limit` bytes of new records; x is None for a single column (the index)."""
+        size = os.path.getsize(self.path)
+        if size < self.offset:
+            raise ValueError(f"{self.path} shrank: it was rewritten, not appended to")
+        with open(self.path, "rb") as fh:
+            fh.seek(self.offset)
+            buf = fh.read(min(size - self.offset, limit))
+        if self.text:
+            return self._parse_text(buf)
+        record = self.dtype.itemsize * self.ncols
+        used = len(buf) - len(buf) % record
+        self.offset += used
+        values = np.frombuffer(buf[:used], dtype=self.dtype).reshape(-1, self.ncols)
+        return (None, values[:, 0]) if self.ncols == 1 else (values[:, 0], values[:, 1])
+
+    def _parse_text(self, buf):
+        buf = buf[:buf.rfind(b"\n") + 1]
+        if self.ncols is None:
+            # the separator and column count come from the first complete data line
+            lines = [ln for ln in buf.splitlines(keepends=True) if ln.strip()]
+            if len(lines) < 1 + self.header:
+                return None, np.empty(0)
+            self.sep, self.ncols = _sniff(self.path, self.header)
+            if self.header:
+                skip = buf.index(lines[0]) + len(lines[0])
+                self.offset += skip
+                buf = buf[skip:]
+        self.offset += len(buf)
+        if not buf.strip():
+            return None, np.empty(0)
+        import pandas as pd
+        try:
+            df = pd.read_csv(io.BytesIO(buf), sep=self.sep if self.sep is not None else r"\s+", header=None,
+                             usecols=list(range(self.ncols)), dtype=np.float64)
+        except ValueError as e:
+            raise ValueError(f"Non-numeric data in {self.path}: {e}") from e
+        if self.ncols == 1:
+            return None, df.iloc[:, 0].to_numpy()
+        return df.iloc[:, 0].to_numpy(), df.iloc[:, 1].to_numpy()
+
+
+class IncrementalDetector:
+    """
+    Threshold detection of a series that only grows. update() runs the pipeline
+    from the end of what is already final to the last point below the height:
+    no island crosses that cut (see chunked.next_cut), so the islands and peaks
+    before it are exactly those of a one-shot run, and an island still open at
+    the end waits for the next update. Only the points appended since the last
+    update are searched for that cut.
+    """
+
+    def __init__(self, engine=ENGINE, config=DEFAULT_CONFIG):
+        self.engine = engine
+        self.config = config
+        self.done = 0  # points before this are final
+        self.scanned = 0  # points before this were searched for a cut
+        self.cut = 0  # one past the last point below the height seen so far
+        self.islands = GrowingArray(np.int64, (2,))
+        self.W_by_island = GrowingArray(np.int64)
+        self.R_by_island = GrowingArray(np.int64)
+        self.rows = {name: GrowingArray(dtype) for name, dtype in PEAK_FIELDS.items()}
+
+    def update(self, y, final=False):
+        """Detect the newly closed part of y (all of it when final); returns the number of new peaks."""
+        n = len(y)
+        if n > self.scanned:
+            below = np.flatnonzero(np.asarray(y[self.scanned:n]) < self.config.height)
+            if below.size:
+                self.cut = self.scanned + int(below[-1]) + 1
+            self.scanned = n
+        stop = n if final else self.cut
+        if stop <= self.done:
+            return 0
+        res = detect.run_pipeline(np.asarray(y[self.done:stop]), "threshold", self.engine, config=self.config)
+        rows = res["kept_rows"].shifted(self.done, len(self.islands))
+        self.islands.extend(res["islands"] + self.done)
+        self.W_by_island.extend(res["W_by_island"])
+        self.R_by_island.extend(res["R_by_island"])
+        for name, col in rows.columns.items():
+            self.rows[name].extend(col)
+        self.done = stop
+        return len(rows)
+
+    def result(self):
+        """Results so far, in run_pipeline's layout (without local_max); views, not copies."""
+        return {"islands": self.islands.data, "W_by_island": self.W_by_island.data,
+                "R_by_island": self.R_by_island.data,
+                "kept_rows": PeakTable({name: buf.data for name, buf in self.rows.items()})}
+
+
+class FollowSession:
+    """
+    One followed file: its tail, the growing x/y series and pyramid, and the
+    incremental detection. With backed=True the series lives in mapped files in
+    a temporary folder instead of memory.
+    """
+
+    def __init__(self, path, engine=ENGINE, config=DEFAULT_CONFIG, backed=False):
+        self.path = path
+        self.tail = FileTail(path)
+        self.detector = IncrementalDetector(engine, config)
+        self._tmp = (tempfile.TemporaryDirectory(prefix="graphpeaks-follow-", ignore_cleanup_errors=True)
+                     if backed else None)
+        self._x = self._y = None
+        self.pyramid = None
+        self.indexed = True  # x is just the index (single-column input)
+        self.behind = False  # the last poll stopped at its byte budget with more data waiting
+
+    def _buffer(self, name, dtype):
+        path = os.path.join(self._tmp.name, name) if self._tmp is not None else None
+        return GrowingArray(dtype, path=path)
+
+    def __len__(self):
+        return 0 if self._y is None else len(self._y)
+
+    @property
+    def x(self):
+        return None if self._x is None else self._x.data
+
+    @property
+    def y(self):
+        return None if self._y is None else self._y.data
+
+    def poll(self, budget=FOLLOW_POLL):
+        """
+        Read what was appended since the last poll, up to about budget bytes, and
+        detect in it; returns (new points, new peaks). behind tells whether data
+        was left for the next poll.
+        """
+        added = 0
+        start = self.tail.offset
+        self.behind = os.path.getsize(self.path) - start > budget
+        while True:
+            x, y = self.tail.read(min(FOLLOW_BLOCK, budget - (self.tail.offset - start)))
+            if not len(y):
+                break
+            if self._y is None:
+                self.indexed = x is None
+                self._y = self._buffer("y.bin", y.dtype)
+                self._x = self._buffer("x.bin", np.int64 if x is None else x.dtype)
+                self.pyramid = GrowingPyramid(y.dtype)
+            n = len(self._y)
+            self._x.extend(np.arange(n, n + len(y)) if x is None else x)
+            self._y.extend(y)
+            added += len(y)
+        # a budget too small for even one line makes no progress: leave it to the next timer tick
+        self.behind = self.behind and self.tail.offset > start
+        if not added:
+            return 0, 0
+        self.pyramid.extend(self._y.data)
+        return added, self.detector.update(self._y.data)
+
+    def finish(self):
+        """Treat the current end as the end of the data: closes a still open island; returns its new peaks."""
+        if self._y is None:
+            return 0
+        return self.detector.update(self._y.data, final=True)
+
+    def close(self):
+        if self._tmp is not None:
+            self._tmp.cleanup()
+            self._tmp = None
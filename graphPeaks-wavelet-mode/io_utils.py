@@ -1,48 +1,496 @@
-import pandas as pd
 import numpy as np
+import hashlib
+import json
 import os
+import struct
+import zipfile
+from constants import TILE_SIZE
+from cache import source_cache_dir, source_fingerprint
+from tile_writer import TileStore, write_store, STORE_NAME
+from peak_writer import CsvPeakWriter
+
+_ARROW_BLOCK = 1 << 24      # bytes per pyarrow CSV block
+_PANDAS_CHUNK = 1_000_000   # rows per pandas chunk
+_EXCEL_PROGRESS = 65536     # spreadsheet rows between progress reports
+X_NAME = "x.tiles"          # x column next to the cached series, when it is not just 0..n-1
+
+TEXT_EXTENSIONS = (".csv", ".txt")
+EXCEL_EXTENSIONS = (".xls", ".xlsx")
+RAW_EXTENSIONS = (".bin", ".raw", ".dat")   # need a <file>.json descriptor, see _read_raw
+BINARY_EXTENSIONS = (".npy", ".npz", ".tiles", ".h5", ".hdf5") + RAW_EXTENSIONS
+DATA_EXTENSIONS = TEXT_EXTENSIONS + EXCEL_EXTENSIONS + BINARY_EXTENSIONS
+
 
 # -------------------------------------------------
 # Universal file loader for CSV, TXT, and Excel
 # -------------------------------------------------
-def load_data(path):
+def load_data(path, progress=None, use_cache=True, sheet=None):
     """
-    Load data from .csv, .txt, .xls, or .xlsx files.
+    Load data from .csv, .txt, .xls, .xlsx or a binary file (see _read_binary).
     Returns two numpy arrays (x, y).
+
+    Text files are streamed (pyarrow when installed, chunked pandas otherwise),
+    Excel sheets row by row (see _read_excel; sheet is a name or index, the
+    first sheet by default). Only the first two columns are parsed and integral
+    columns are stored as int32. progress(fraction) is called while reading.
+    The arrays are cached in the file's cache folder, so reopening an unchanged
+    file just maps them. Binary inputs are memory-mapped in place and keep their dtype.
     """
     ext = os.path.splitext(path)[1].lower()
+    if ext not in DATA_EXTENSIONS:
+        raise ValueError(f"Unsupported file type: {ext}")
 
-    if ext in [".csv"]:
-        df = pd.read_csv(path)
-    elif ext in [".txt"]:
-        # Try tab or space-delimited text
-        try:
-            df = pd.read_csv(path, sep="\t", header=None)
-        except Exception:
-            df = pd.read_csv(path, delim_whitespace=True, header=None)
-    elif ext in [".xls", ".xlsx"]:
-        df = pd.read_excel(path)
+    if ext in BINARY_EXTENSIONS:
+        x, y = _read_binary(path, ext, use_cache)
+        if progress:
+            progress(1.0)
+        return x, y
+
+    if use_cache:
+        fingerprint = source_fingerprint(path)
+        if sheet not in (None, 0):
+            # every sheet of a workbook has its own cache folder
+            fingerprint = hashlib.sha1(f"{fingerprint}:{sheet!r}".encode()).hexdigest()
+        cached = _load_cached(path, fingerprint)
+        if cached is not None:
+            if progress:
+                progress(1.0)
+            return cached
+
+    if ext in TEXT_EXTENSIONS:
+        x, y = _read_text(path, header=(ext == ".csv"), progress=progress)
     else:
-        raise ValueError(f"Unsupported file type: {ext}")
+        x, y = _read_excel(path, sheet, progress)
+
+    x, y = _compact(x), _compact(y)
+    if use_cache:
+        _save_cached(path, fingerprint, x, y)
+    return x, y
+
+
+# -------------------------------------------------
+# Text parsing
+# -------------------------------------------------
+def _sniff(path, header):
+    """(separator, number of columns to read) from the first data line."""
+    with open(path, "r", errors="replace") as fh:
+        lines = (ln for ln in fh if ln.strip())
+        first = next(lines, None)
+        if header:
+            first = next(lines, first)
+    if first is None:
+        raise ValueError("File has no valid data columns.")
+    if header:
+        sep = ","
+    elif "\t" in first:
+        sep = "\t"
+    else:
+        sep = None  # any run of whitespace
+    return sep, min(2, len(first.split(sep)))
+
+
+def _pyarrow_csv():
+    """(pyarrow, pyarrow.csv) imported on first use, (None, None) when not installed."""
+    try:
+        import pyarrow as pa
+        from pyarrow import csv as pa_csv
+    except ImportError:  # optional: text files are then parsed by pandas in chunks
+        return None, None
+    return pa, pa_csv
+
+
+def _read_text(path, header, progress=None):
+    sep, ncols = _sniff(path, header)
+    if _pyarrow_csv()[1] is not None and sep is not None:
+        cols = _read_arrow(path, header, sep, ncols, progress)
+    else:
+        cols = _read_pandas(path, header, sep, ncols, progress)
+    if ncols == 1:
+        return np.arange(len(cols[0])), cols[0]
+    return cols[0], cols[1]
+
+
+def _read_arrow(path, header, sep, ncols, progress):
+    pa, pa_csv = _pyarrow_csv()
+    names = [f"f{i}" for i in range(ncols)]
+    size = os.path.getsize(path) or 1
+    parts = [[] for _ in names]
+    with pa.OSFile(path, "rb") as src:
+        try:
+            reader = pa_csv.open_csv(
+                src,
+                read_options=pa_csv.ReadOptions(block_size=_ARROW_BLOCK, skip_rows=int(header),
+                                                autogenerate_column_names=True),
+                parse_options=pa_csv.ParseOptions(delimiter=sep),
+                convert_options=pa_csv.ConvertOptions(include_columns=names,
+                                                      column_types={n: pa.float64() for n in names}))
+            for batch in reader:
+                for i, n in enumerate(names):
+                    parts[i].append(batch.column(n).to_numpy(zero_copy_only=False))
+                if progress:
+                    progress(min(src.tell() / size, 1.0))
+        except pa.ArrowInvalid as e:
+            raise ValueError(f"Non-numeric data in {path}: {e}") from e
+    return [np.concatenate(p) if p else np.empty(0) for p in parts]
+
+
+def _read_pandas(path, header, sep, ncols, progress):
+    import pandas as pd
+    size = os.path.getsize(path) or 1
+    parts = [[] for _ in range(ncols)]
+    with open(path, "rb") as fh:
+        reader = pd.read_csv(fh, sep=sep if sep is not None else r"\s+",
+                             header=0 if header else None, usecols=list(range(ncols)),
+                             dtype=np.float64, chunksize=_PANDAS_CHUNK)
+        for chunk in reader:
+            for i in range(ncols):
+                parts[i].append(chunk.iloc[:, i].to_numpy())
+            if progress:
+                progress(min(fh.tell() / size, 1.0))
+    return [np.concatenate(p) if p else np.empty(0) for p in parts]
 
-    # Handle single-column or two-column files
-    if df.shape[1] == 1:
-        df.reset_index(inplace=True)
-        df.columns = ["x", "y"]
-    elif df.shape[1] >= 2:
-        df.columns = ["x", "y"] + list(df.columns[2:])
+
+def _compact(values):
+    """Integral columns (counts) as int32 when they fit, anything else unchanged."""
+    values = np.asarray(values)
+    if values.dtype.kind not in "fiu" or not len(values):
+        return values
+    lo, hi = values.min(), values.max()
+    if not (np.iinfo(np.int32).min <= lo and hi <= np.iinfo(np.int32).max):
+        return values
+    if values.dtype.kind == "f" and not np.array_equal(values, np.trunc(values)):
+        return values
+    return values.astype(np.int32)
+
+
+# -------------------------------------------------
+# Excel, streamed row by row
+# -------------------------------------------------
+def excel_sheets(path):
+    """Sheet names of a workbook, without reading the sheets."""
+    if os.path.splitext(path)[1].lower() == ".xls":
+        book = _xlrd().open_workbook(path, on_demand=True)
+        try:
+            return book.sheet_names()
+        finally:
+            book.release_resources()
+    book = _openpyxl().load_workbook(path, read_only=True)
+    try:
+        return list(book.sheetnames)
+    finally:
+        book.close()
+
+
+def _openpyxl():
+    try:
+        import openpyxl
+    except ImportError:  # optional: only needed for .xlsx inputs
+        raise ImportError("Reading .xlsx files needs openpyxl") from None
+    return openpyxl
+
+
+def _xlrd():
+    try:
+        import xlrd
+    except ImportError:  # optional: only needed for .xls inputs
+        raise ImportError("Reading .xls files needs xlrd") from None
+    return xlrd
+
+
+def _read_excel(path, sheet=None, progress=None):
+    """
+    First two columns of one sheet. .xlsx goes through openpyxl's read-only
+    row iterator and .xls through xlrd, so no cell objects or DataFrame are
+    built for the whole sheet. Leading rows whose first cell is not a number
+    are taken as a header. An empty second column means y alone (x is the index).
+    """
+    if os.path.splitext(path)[1].lower() == ".xls":
+        book = _xlrd().open_workbook(path, on_demand=True)
+        close = book.release_resources
+        ws = book.sheet_by_name(sheet) if isinstance(sheet, str) else book.sheet_by_index(sheet or 0)
+        rows = (ws.row_values(r, 0, min(2, ws.ncols)) for r in range(ws.nrows))
+        total = ws.nrows
     else:
+        book = _openpyxl().load_workbook(path, read_only=True, data_only=True)
+        close = book.close
+        ws = book[sheet] if isinstance(sheet, str) else book.worksheets[sheet or 0]
+        rows = ws.iter_rows(min_col=1, max_col=2, values_only=True)
+        total = ws.max_row  # from the sheet's dimension record, may be missing
+    try:
+        return _fill_columns(rows, total, path, progress)
+    finally:
+        close()
+
+
+def _blank(value):
+    return value is None or (isinstance(value, str) and not value.strip())
+
+
+def _is_number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return True
+    try:
+        float(value)
+    except (TypeError, ValueError):
+        return False
+    return True
+
+
+def _fill_columns(rows, total, path, progress=None):
+    """
+    (x, y) float64 arrays from (first cell, second cell) rows, preallocated from
+    total. Rows with no value (blank lines, trailing formatted rows) are skipped;
+    a single blank cell in a data row is NaN.
+    """
+    size = max(total or 0, 1024)
+    xs, ys = np.empty(size), np.empty(size)
+    n, ncols = 0, None
+    for i, row in enumerate(rows, 1):
+        a = row[0] if len(row) else None
+        b = row[1] if len(row) > 1 else None
+        if ncols is None:
+            if not _is_number(a):
+                continue  # blank or header rows before the data
+            ncols = 1 if _blank(b) else 2
+        # checked on the raw cells: openpyxl's None would be stored as NaN without an error
+        if _blank(a) and (ncols == 1 or _blank(b)):
+            continue
+        if n == size:
+            size *= 2
+            xs, ys = np.resize(xs, size), np.resize(ys, size)
+        try:
+            xs[n] = a
+            if ncols == 2:
+                ys[n] = b
+        except (TypeError, ValueError):
+            # blank cells ("" from xlrd) and anything non-numeric
+            try:
+                xs[n] = np.nan if _blank(a) else a
+                if ncols == 2:
+                    ys[n] = np.nan if _blank(b) else b
+            except (TypeError, ValueError):
+                raise ValueError(f"Non-numeric data in {path}, row {i}: {a!r}, {b!r}") from None
+        n += 1
+        if progress and total and i % _EXCEL_PROGRESS == 0:
+            progress(min(i / total, 1.0))
+    if ncols is None:
         raise ValueError("File has no valid data columns.")
+    if progress:
+        progress(1.0)
+    if ncols == 1:
+        return np.arange(n), xs[:n]
+    return xs[:n], ys[:n]
+
 
-    x = np.asarray(df.iloc[:, 0])
-    y = np.asarray(df.iloc[:, 1])
+# -------------------------------------------------
+# Binary inputs, memory-mapped
+# -------------------------------------------------
+def _read_binary(path, ext, use_cache=True):
+    """
+    .npy, .npz, raw arrays with a JSON descriptor, tile stores and HDF5, mapped
+    without copying. An array is either y alone (1-D, x is the index) or x and y
+    as the columns of (n, 2) or rows of (2, n); .npz and HDF5 files may instead
+    hold separate "x" and "y" arrays. Compressed .npz members are read into
+    memory; chunked or compressed HDF5 datasets are converted once to the cache.
+    """
+    if ext == ".npy":
+        return _columns(np.load(path, mmap_mode="r"), path)
+    if ext == ".npz":
+        return _read_npz(path)
+    if ext == ".tiles":
+        store = TileStore(path)
+        return _index(len(store)), store.data
+    if ext in (".h5", ".hdf5"):
+        return _read_hdf5(path, use_cache)
+    return _read_raw(path)
+
+
+def _columns(arr, path):
+    """(x, y) views of one array (see _read_binary)."""
+    if arr.dtype.kind not in "fiu":
+        raise ValueError(f"{path}: expected a numeric array, found {arr.dtype}")
+    if arr.ndim == 1:
+        return _index(len(arr)), arr
+    if arr.ndim == 2 and arr.shape[1] in (1, 2):
+        return (_index(len(arr)), arr[:, 0]) if arr.shape[1] == 1 else (arr[:, 0], arr[:, 1])
+    if arr.ndim == 2 and arr.shape[0] == 2:
+        return arr[0], arr[1]
+    raise ValueError(f"{path}: expected a 1-D array or two columns, found shape {arr.shape}")
+
+
+def _pick(names, path):
+    """(x name or None, y name) out of an archive's array names."""
+    if "y" in names:
+        return ("x" if "x" in names else None), "y"
+    if not names:
+        raise ValueError(f"{path}: no arrays found")
+    return None, names[0]
+
+
+def _read_npz(path):
+    with zipfile.ZipFile(path) as zf:
+        names = [n[:-4] for n in zf.namelist() if n.endswith(".npy")]
+        x_name, y_name = _pick(names, path)
+        y = _npz_member(path, zf, y_name + ".npy")
+        if x_name is None:
+            return _columns(y, path)
+        x = _npz_member(path, zf, x_name + ".npy")
+    if len(x) != len(y):
+        raise ValueError(f"{path}: x and y have different lengths")
     return x, y
 
 
+def _npz_member(path, zf, name):
+    """One .npz member, memory-mapped when it is stored uncompressed."""
+    info = zf.getinfo(name)
+    if info.compress_type != zipfile.ZIP_STORED:
+        with zf.open(info) as fh:
+            return np.lib.format.read_array(fh, allow_pickle=False)
+    with open(path, "rb") as fh:
+        fh.seek(info.header_offset)
+        local = fh.read(30)
+        if local[:4] != b"PK\x03\x04":
+            raise ValueError(f"{path}: damaged member {name}")
+        # the data follows the local header, its file name and extra field
+        name_len, extra_len = struct.unpack("<HH", local[26:30])
+        fh.seek(info.header_offset + 30 + name_len + extra_len)
+        version = np.lib.format.read_magic(fh)
+        if version == (1, 0):
+            shape, fortran, dtype = np.lib.format.read_array_header_1_0(fh)
+        else:
+            shape, fortran, dtype = np.lib.format.read_array_header_2_0(fh)
+        offset = fh.tell()
+    if dtype.hasobject:
+        raise ValueError(f"{path}: member {name} holds Python objects")
+    if not np.prod(shape):
+        return np.empty(shape, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape,
+                     order="F" if fortran else "C")
+
+
+def _raw_descriptor(path):
+    """(dtype, data offset, columns, length or None) from a raw file's <file>.json descriptor."""
+    desc_path = path + ".json"
+    if not os.path.exists(desc_path):
+        raise ValueError(f"{path}: raw arrays need a descriptor {os.path.basename(desc_path)} "
+                         '(e.g. {"dtype": "<u4"})')
+    with open(desc_path) as fh:
+        desc = json.load(fh)
+    dtype = np.dtype(desc["dtype"])
+    if dtype.byteorder == "=":
+        dtype = dtype.newbyteorder("<")
+    columns = int(desc.get("columns", 1))
+    if columns not in (1, 2):
+        raise ValueError(f"{desc_path}: columns must be 1 or 2")
+    length = desc.get("length")
+    return dtype, int(desc.get("offset", 0)), columns, None if length is None else int(length)
+
+
+def _read_raw(path):
+    """
+    Headerless array described by <file>.json, e.g. {"dtype": "<u4"}. Optional
+    keys: "offset" (bytes to skip), "length" (points, default: the rest of the
+    file) and "columns" (2 for interleaved x, y pairs). Multi-byte types without
+    an explicit byte order are read as little-endian.
+    """
+    dtype, offset, columns, length = _raw_descriptor(path)
+    available = (os.path.getsize(path) - offset) // (dtype.itemsize * columns)
+    if length is None:
+        length = available
+    if length > available:
+        raise ValueError(f"{path}: descriptor asks for {length} points, the file holds {available}")
+    if not length:
+        return _columns(np.empty((0, columns), dtype=dtype), path)
+    shape = (length,) if columns == 1 else (length, 2)
+    return _columns(np.memmap(path, dtype=dtype, mode="r", offset=offset, shape=shape), path)
+
+
+def _read_hdf5(path, use_cache=True):
+    try:
+        import h5py
+    except ImportError:  # optional: only needed for .h5/.hdf5 inputs
+        raise ImportError("Reading HDF5 files needs h5py") from None
+    fingerprint = source_fingerprint(path) if use_cache else None
+    if use_cache:
+        cached = _load_cached(path, fingerprint)
+        if cached is not None:
+            return cached
+    with h5py.File(path, "r") as f:
+        found = []
+        f.visititems(lambda name, obj: found.append(name) if isinstance(obj, h5py.Dataset) else None)
+        # datasets by their name inside whichever group holds them
+        by_base = {n.rsplit("/", 1)[-1]: n for n in found if f[n].dtype.kind in "fiu"}
+        x_base, y_base = _pick(list(by_base), path)
+        x_name, y_name = by_base.get(x_base), by_base[y_base]
+        mapped = [_hdf5_map(path, f[n]) for n in (x_name, y_name) if n is not None]
+        if all(m is not None for m in mapped):
+            if x_name is None:
+                return _columns(mapped[0], path)
+            return mapped[0], mapped[1]
+        # chunked or compressed: convert once, one slice at a time, then map the cache
+        y = f[y_name]
+        if y.ndim != 1 or (x_name is not None and f[x_name].ndim != 1):
+            raise ValueError(f"{path}: chunked datasets must be 1-D (store x and y separately)")
+        if not use_cache:
+            x = f[x_name][()] if x_name is not None else _index(len(y))
+            return x, y[()]
+        _save_cached(path, fingerprint, f[x_name] if x_name is not None else None, y)
+    return _load_cached(path, fingerprint)
+
+
+def _hdf5_map(path, ds):
+    """Memmap of a contiguous, uncompressed HDF5 dataset, or None."""
+    offset = ds.id.get_offset()
+    if ds.chunks is not None or ds.compression is not None or offset is None or not ds.size:
+        return None
+    return np.memmap(path, dtype=ds.dtype, mode="r", offset=offset, shape=ds.shape)
+
+
+# -------------------------------------------------
+# Binary sidecar cache
+# -------------------------------------------------
+def _is_index(x):
+    return np.array_equal(x, np.arange(len(x)))
+
+
+def _index(n):
+    return np.arange(n, dtype=np.int32 if n <= np.iinfo(np.int32).max else np.int64)
+
+
+def _load_cached(path, fingerprint):
+    folder = source_cache_dir(path, fingerprint)
+    store_path = os.path.join(folder, STORE_NAME)
+    if not os.path.exists(store_path):
+        return None
+    try:
+        store = TileStore(store_path)
+        if store.source_hash != fingerprint or "x" not in store.header:
+            return None
+        if store.header["x"] == "index":
+            x = _index(len(store))
+        else:
+            x = TileStore(os.path.join(folder, X_NAME)).data
+        return x, store.data
+    except (ValueError, OSError):
+        return None
+
+
+def _save_cached(path, fingerprint, x, y):
+    """x=None means the index; x and y may be any sliceable arrays (written a block at a time)."""
+    folder = source_cache_dir(path, fingerprint)
+    x_kind = "index"
+    if x is not None and not _is_index(x):
+        write_store(os.path.join(folder, X_NAME), x, source_hash=fingerprint)
+        x_kind = X_NAME
+    # the y store doubles as the tile store used by tile mode
+    write_store(os.path.join(folder, STORE_NAME), y, tile_size=TILE_SIZE,
+                source_hash=fingerprint, source=os.path.abspath(path), x=x_kind)
+
+
 # -------------------------------------------------
 # Optional: Export detected peaks to CSV
 # -------------------------------------------------
-def export_peaks_csv(rows, out_path):
-    """Save peaks as CSV."""
-    df = pd.DataFrame(rows)
-    df.to_csv(out_path, index=False)
+def export_peaks_csv(peaks, out_path, metadata=None):
+    """Save peaks (a PeakTable, or a list of row dicts) as CSV, metadata in a sidecar (see peak_writer)."""
+    with CsvPeakWriter(out_path, metadata) as writer:
+        writer.write(peaks)
@@ -2,34 +2,58 @@
 #connects signals, handles file dialogs, status msgs, export, and simple validation
 from PyQt5.QtWidgets import (
     QMainWindow, QWidget, QVBoxLayout, QHBoxLayout, QPushButton,
-    QFileDialog, QTableView, QMessageBox, QStatusBar, QLabel,
-    QSpinBox, QDoubleSpinBox, QComboBox, QApplication
+    QFileDialog, QTableView, QMessageBox, QLabel,
+    QSpinBox, QDoubleSpinBox, QComboBox, QApplication, QProgressBar, QSplitter, QAbstractItemView,
+    QInputDialog
 )
-from PyQt5.QtCore import Qt
+from PyQt5.QtCore import Qt, QTimer
 from PyQt5.QtWidgets import QCheckBox
-import os
-from io_utils import save_tiles
+from tile_writer import save_tiles
 from plot_widget import PlotWidget
-from io_utils import load_data, export_peaks_csv
+from io_utils import load_data, excel_sheets, EXCEL_EXTENSIONS
 import constants as C
-from detection_thread_utils import DetectionWorker, get_visible_range, downsample_line
+from detection_thread_utils import DetectionWorker, get_visible_range
+from pyramid import load_pyramid
+from result_cache import ResultCache
+from sweep_dialog import SweepDialog
+from profiling import StageProfiler, stage, format_summary
+from peak_table import PeakTable, PeakIndex
+from models import PeakTableModel
+from follow import FollowSession
 
 
 class MainWindow(QMainWindow):
 
-    def on_detection_done(self, result, offset):
-        # Apply offset to peak indices
-        for row in result["kept_rows"]:
-            row["index"] += offset
+    def on_detection_done(self, generation, result):
+        if generation != self.generation:
+            return  # an older run or viewport finished late; its peaks are stale
+        self.detection_finished()
 
+        # Peak indices and islands are relative to the full series; rows is a PeakTable
         self.rows = result["kept_rows"]
         self.islands = result.get("islands", [])
         self.W_by_island = result.get("W_by_island", [])
         self.R_by_island = result.get("R_by_island", [])
 
         self.plot.set_islands(self.islands)
-        self.plot.set_peaks(self.rows)
-        self.statusBar().showMessage(f"Detected {len(self.rows)} peaks", 3000)
+        peaks = PeakIndex(self.rows)  # sorted once for the plot and the table
+        self.plot.set_peaks(peaks)
+        self.peak_model.set_peaks(peaks)
+        message = f"Detected {len(self.rows)} peaks"
+        if "noise" in result:
+            # keep the estimate for later runs on this file, show the height it picked
+            self.noise_estimate = result["noise"]
+            if result["height"] is not None:
+                self.set_exact(self.threshold_box, result["height"])
+                message += f" (auto height {result['height']:.4g})"
+            else:
+                heights = result["noise"]["heights"]
+                message += f" (per-window heights {heights.min():.4g} to {heights.max():.4g})"
+        if "profile" in result:
+            message += " | " + format_summary(result["profile"])
+            self.statusBar().showMessage(message, 15000)
+            return
+        self.statusBar().showMessage(message, 5000)
 
     
     def __init__(self, parent=None):
@@ -39,11 +63,15 @@ class MainWindow(QMainWindow):
         # Persistent attributes
         self.x = None
         self.y = None
-        self.rows = []
+        self.rows = PeakTable()
         self.islands = []
         self.W_by_island = []
         self.R_by_island = []
         self.current_csv_path = None
+        self.view_cache = None  # per-chunk viewport results for the loaded series
+        self.noise_estimate = None  # noise.estimate_noise of the loaded series, once computed
+        self.follow = None  # follow.FollowSession while a growing file is followed
+        self.exact_values = {}  # spin box -> unrounded value set by the program (auto height, sweep cell)
 
         # Main layout setup
         central = QWidget(self)
@@ -51,12 +79,30 @@ class MainWindow(QMainWindow):
         central.setLayout(ly)
         self.setCentralWidget(central)
 
-        # Plot widget
+        # Plot widget above the peak table
         self.plot = PlotWidget(self)
-        ly.addWidget(self.plot)
+        self.peak_model = PeakTableModel(self)
+        self.peak_table = QTableView(self)
+        self.peak_table.setModel(self.peak_model)
+        self.peak_table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.peak_table.setSelectionMode(QAbstractItemView.SingleSelection)
+        self.peak_table.verticalHeader().setDefaultSectionSize(20)
+        self.peak_table.setSortingEnabled(True)
+        self.peak_table.sortByColumn(0, Qt.AscendingOrder)
+        splitter = QSplitter(Qt.Vertical, self)
+        splitter.addWidget(self.plot)
+        splitter.addWidget(self.peak_table)
+        splitter.setStretchFactor(0, 3)
+        splitter.setStretchFactor(1, 1)
+        ly.addWidget(splitter)
 
         # Status bar
         self.statusBar().showMessage("Ready")
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.setMaximumWidth(200)
+        self.progress_bar.hide()
+        self.statusBar().addPermanentWidget(self.progress_bar)
 
         # Controls layout
         controls = QHBoxLayout()
@@ -87,13 +133,48 @@ class MainWindow(QMainWindow):
         controls.addWidget(QLabel("Min Height:"))
         self.threshold_box = QDoubleSpinBox(self)
         self.threshold_box.setRange(0, 1e9)
-        self.threshold_box.setDecimals(1)
+        self.threshold_box.setDecimals(3)
         self.threshold_box.setValue(C.APEX_MIN_HEIGHT)
         controls.addWidget(self.threshold_box)
 
+        # manual height, or picked from the file's noise floor (whole file / per window)
+        self.height_mode_box = QComboBox(self)
+        self.height_mode_box.addItems(["manual", "auto", "auto per window"])
+        controls.addWidget(self.height_mode_box)
+
+        controls.addWidget(QLabel("Alpha:"))
+        self.alpha_box = QDoubleSpinBox(self)
+        self.alpha_box.setRange(0.05, 1.0)
+        self.alpha_box.setSingleStep(0.05)
+        self.alpha_box.setDecimals(2)
+        self.alpha_box.setValue(C.ALPHA)
+        controls.addWidget(self.alpha_box)
+
+        # Worker processes for full-dataset runs
+        controls.addWidget(QLabel("Workers:"))
+        self.workers_box = QSpinBox(self)
+        self.workers_box.setRange(1, max(1, C.WORKERS))
+        self.workers_box.setValue(C.WORKERS)
+        controls.addWidget(self.workers_box)
+
         # Add buttons to layout
         controls.addWidget(btn_open)
         controls.addWidget(btn_run)
+        self.btn_cancel = QPushButton("Cancel", self)
+        self.btn_cancel.setEnabled(False)
+        controls.addWidget(self.btn_cancel)
+        btn_sweep = QPushButton("Sweep...", self)
+        controls.addWidget(btn_sweep)
+
+        # Keep reading a file that is still being written, detecting in the new data
+        self.follow_box = QCheckBox("Follow")
+        controls.addWidget(self.follow_box)
+
+        # Opt-in stage timings and memory peaks (load, tiling, redraw, detection)
+        self.profile_box = QCheckBox("Profile")
+        controls.addWidget(self.profile_box)
+        btn_save_profile = QPushButton("Save Profile...", self)
+        controls.addWidget(btn_save_profile)
 
         # Insert control bar above plot
         ly.insertLayout(0, controls)
@@ -101,10 +182,28 @@ class MainWindow(QMainWindow):
         # Wire up signals
         btn_open.clicked.connect(self.on_open_file)
         btn_run.clicked.connect(self.on_run)
+        self.btn_cancel.clicked.connect(self.cancel_detection)
+        btn_sweep.clicked.connect(self.on_sweep)
+        self.profile_box.toggled.connect(self.on_profile_toggled)
+        self.follow_box.toggled.connect(self.on_follow_toggled)
+        btn_save_profile.clicked.connect(self.on_save_profile)
         self.mode_box.currentTextChanged.connect(self.on_mode_changed)  # enable/disable threshold
+        self.height_mode_box.currentTextChanged.connect(self.update_height_controls)
+        # clicks only: the view also moves its current row by itself when the peaks are replaced
+        self.peak_table.clicked.connect(self.on_peak_clicked)
 
-        # Async detection thread object
+        # Async detection: the current worker, every worker whose thread is still
+        # alive (cancelled ones wind down in the background), and the current job id
         self.detector = None
+        self.running_workers = []
+        self.generation = 0
+        self.detect_range = None  # (start, end) of a viewport run, None for full runs
+        self.plot.ax.callbacks.connect("xlim_changed", self.on_view_changed)
+        self.sweep_dialog = None
+        self.profiler = None  # StageProfiler for the loaded file while Profile is checked
+        self.follow_timer = QTimer(self)
+        self.follow_timer.setInterval(C.FOLLOW_INTERVAL_MS)
+        self.follow_timer.timeout.connect(self.on_follow_poll)
 
         # For downsampled overview mode
         self.overview_enabled = True
@@ -121,41 +220,90 @@ class MainWindow(QMainWindow):
     def on_mode_changed(self, mode):
         if mode == "wavelet":
             self.threshold_box.setEnabled(False)
+            self.alpha_box.setEnabled(False)
+            self.height_mode_box.setEnabled(False)
         else:
-            self.threshold_box.setEnabled(True)
+            self.alpha_box.setEnabled(True)
+            self.height_mode_box.setEnabled(True)
+            self.update_height_controls()
+
+    def update_height_controls(self, *_):
+        self.threshold_box.setEnabled(self.height_mode_box.currentText() == "manual")
 
     def on_open_file(self):
         path, _ = QFileDialog.getOpenFileName(
             self,
             "Open File",
             "",
-            "Data files (*.csv *.txt *.xls *.xlsx)"
+            "Data files (*.csv *.txt *.xls *.xlsx *.npy *.npz *.tiles *.h5 *.hdf5 *.bin *.raw *.dat)"
         )
         if not path:
             return
 
+        # A fresh profile per file
+        self.set_profiler(self.profile_box.isChecked())
+        self.stop_follow()
+        if self.follow_box.isChecked():
+            self.start_follow(path)
+            return
+
+        # Workbooks with several sheets: ask which one
+        sheet = None
+        if path.lower().endswith(EXCEL_EXTENSIONS):
+            try:
+                sheets = excel_sheets(path)
+            except (ValueError, ImportError, OSError) as e:
+                QMessageBox.critical(self, "Open File", str(e))
+                return
+            if len(sheets) > 1:
+                name, ok = QInputDialog.getItem(self, "Open File", "Sheet:", sheets, 0, False)
+                if not ok:
+                    return
+                sheet = sheets.index(name)
+
         # Load data based on extension
-        x, y = load_data(path)
+        self.progress_bar.setValue(0)
+        self.progress_bar.setFormat("load %p%")
+        self.progress_bar.show()
+        try:
+            with stage(self.profiler, "load") as counts:
+                x, y = load_data(path, progress=self.on_load_progress, sheet=sheet)
+                counts["points"] = len(y)
+        except (ValueError, ImportError, OSError) as e:
+            # unsupported or damaged file, missing descriptor, optional reader not installed
+            QMessageBox.critical(self, "Open File", str(e))
+            return
+        finally:
+            self.progress_bar.hide()
         self.x, self.y = x, y
         self.current_csv_path = path
 
-        # Clear old results
-        self.rows = []
+        # Clear old results (and drop a detection still running on the old data)
+        self.cancel_detection()
+        self.noise_estimate = None
+        self.rows = PeakTable()
         self.islands = []
         self.W_by_island = []
         self.R_by_island = []
+        self.peak_model.set_peaks(self.rows)
 
         # If very large, activate tile mode
         if len(y) > 5_000_000:
-            tile_dir = os.path.join(os.getcwd(), "tiles")
-            save_tiles(y, tile_size=10000, out_dir=tile_dir)
-            self.plot.enable_tile_mode(tile_dir)
+            with stage(self.profiler, "tiling", points=len(y)):
+                tiles = save_tiles(y, path, tile_size=C.TILE_SIZE)
+                pyramid = load_pyramid(tiles)
+            self.y = tiles.data  # detection reads the memmapped store too
+            self.plot.enable_tile_mode(tiles, pyramid)
             self.statusBar().showMessage(f"Loaded {len(y):,} points using tile mode", 3000)
         else:
             self.plot.set_series(x, y)
             self.statusBar().showMessage(f"Loaded {len(x)} points from {path}", 3000)
 
 
+    def on_load_progress(self, fraction):
+        self.progress_bar.setValue(int(round(100 * fraction)))
+        QApplication.processEvents()
+
     # ------------------
     # Run detection
     # ------------------
@@ -165,24 +313,22 @@ class MainWindow(QMainWindow):
             return
 
         mode = self.mode_box.currentText()
-        tile_pref = self.tile_box.currentText()
+        config = self.detection_config()
+        auto_height = {"auto": "file", "auto per window": "window"}.get(self.height_mode_box.currentText())
+        if mode != "threshold":
+            auto_height = None
 
-        # Threshold config
-        if mode == "threshold":
-            C.APEX_MIN_HEIGHT = self.threshold_box.value()
+        # A new run supersedes whatever is still running
+        self.cancel_detection()
 
         # Clear previous visuals
         self.plot.set_islands([])
-        self.plot.set_peaks([])
+        self.plot.set_peaks(PeakTable())
+        self.peak_model.set_peaks(PeakTable())
 
         # Check whether to run on full dataset or just visible range
-        if self.full_run_box.isChecked():
-            y_slice = self.y
-            offset = 0
-        else:
+        if not self.full_run_box.isChecked():
             start_idx, end_idx = get_visible_range(self.plot.ax, len(self.y))
-            y_slice = self.y[start_idx:end_idx]
-            offset = start_idx
 
 
         if self.full_run_box.isChecked():
@@ -195,11 +341,253 @@ class MainWindow(QMainWindow):
         QApplication.processEvents()
 
         # Async detection setup
-        self.detector = DetectionWorker(y_data=y_slice, mode=mode)
-        self.detector.finished.connect(lambda res: self.on_detection_done(res, offset))
-        self.detector.error.connect(lambda e: QMessageBox.critical(self, "Error", str(e)))
-        self.detector.start()
+        self.generation += 1
+        if self.full_run_box.isChecked():
+            self.detect_range = None
+            worker = DetectionWorker(y_data=self.y, mode=mode, generation=self.generation,
+                                     chunk_size=C.CHUNK_SIZE, workers=self.workers_box.value(),
+                                     config=config, auto_height=auto_height, noise=self.noise_estimate,
+                                     profiler=self.profiler)
+        else:
+            # chunks analyzed by earlier viewport runs come from the cache
+            if self.view_cache is None or self.view_cache.data is not self.y:
+                self.view_cache = ResultCache(self.y)
+            self.detect_range = (start_idx, end_idx)
+            worker = DetectionWorker(y_data=self.y, mode=mode, generation=self.generation,
+                                     cache=self.view_cache, view=self.detect_range, config=config,
+                                     auto_height=auto_height, noise=self.noise_estimate,
+                                     profiler=self.profiler)
+        worker.progress.connect(self.on_detection_progress)
+        worker.done.connect(self.on_detection_done)
+        worker.failed.connect(self.on_detection_failed)
+        worker.cancelled.connect(self.on_detection_cancelled)
+        worker.finished.connect(lambda: self.on_worker_finished(worker))
+        self.detector = worker
+        self.running_workers.append(worker)
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.btn_cancel.setEnabled(True)
+        worker.start()
+
+    # ------------------
+    # Profiling
+    # ------------------
+    def set_profiler(self, enabled):
+        """Start a new StageProfiler (or drop the current one) for the GUI and the plot."""
+        if self.profiler is not None:
+            self.profiler.close()
+        self.profiler = StageProfiler(memory=True) if enabled else None
+        self.plot.profiler = self.profiler
+
+    def on_profile_toggled(self, checked):
+        if checked != (self.profiler is not None):
+            self.set_profiler(checked)
+
+    def on_save_profile(self):
+        if self.profiler is None or not self.profiler.events:
+            QMessageBox.warning(self, "No profile", "Check Profile, then load a file or run a detection.")
+            return
+        path, _ = QFileDialog.getSaveFileName(
+            self, "Save Profile", "profile.trace.json",
+            "Trace events (*.trace.json);;Stage summary (*.json)")
+        if not path:
+            return
+        if path.endswith(".trace.json"):
+            self.profiler.to_trace(path)
+        else:
+            self.profiler.to_json(path)
+        self.statusBar().showMessage(f"Saved profile to {path}", 3000)
+
+    def detection_config(self):
+        """The controls' parameters as an immutable DetectionConfig for one job."""
+        return C.DEFAULT_CONFIG.replace(height=self.exact_value(self.threshold_box),
+                                        alpha=self.exact_value(self.alpha_box))
+
+    def set_exact(self, box, value):
+        """Show value in box, and keep it unrounded for the next run while the box still shows it."""
+        box.setValue(value)
+        self.exact_values[box] = value
+
+    def exact_value(self, box):
+        """box's value, or the unrounded one set_exact put there if the user has not changed it since."""
+        exact = self.exact_values.get(box)
+        if exact is not None and round(exact, box.decimals()) == box.value():
+            return exact
+        return box.value()
+
+    # ------------------
+    # Detection progress, cancellation and results
+    # ------------------
+    def cancel_detection(self):
+        """Stop the running job (it exits at its next checkpoint) and forget its results."""
+        if self.detector is None:
+            return
+        self.detector.cancel()
+        self.generation += 1
+        self.detection_finished()
+        self.statusBar().showMessage("Detection cancelled", 3000)
+
+    def detection_finished(self):
+        self.detector = None
+        self.detect_range = None
+        self.progress_bar.hide()
+        self.btn_cancel.setEnabled(False)
+
+    def on_view_changed(self, ax):
+        # a viewport run is pointless once the user has panned or zoomed away
+        if self.detect_range is None or self.detector is None:
+            return
+        start, end = get_visible_range(ax, len(self.y))
+        if (start, end) != self.detect_range:
+            self.cancel_detection()
 
+    def on_detection_progress(self, generation, stage, fraction):
+        if generation != self.generation:
+            return
+        self.progress_bar.setValue(int(round(100 * fraction)))
+        self.progress_bar.setFormat(f"{stage} %p%")
+
+    def on_detection_failed(self, generation, message):
+        if generation != self.generation:
+            return
+        self.detection_finished()
+        QMessageBox.critical(self, "Error", message)
+
+    def on_detection_cancelled(self, generation):
+        if generation == self.generation:
+            self.detection_finished()
+
+    def on_worker_finished(self, worker):
+        if worker in self.running_workers:
+            self.running_workers.remove(worker)
+        worker.deleteLater()
+
+    # ------------------
+    # Follow a growing file
+    # ------------------
+    def on_follow_toggled(self, checked):
+        if not checked:
+            self.stop_follow()
+        elif self.follow is None and self.current_csv_path is not None:
+            self.start_follow(self.current_csv_path)
+
+    def start_follow(self, path):
+        """Read path from the start, then poll it for appended data (threshold detection only)."""
+        self.cancel_detection()
+        try:
+            self.follow = FollowSession(path, config=self.detection_config(), backed=True)
+        except (ValueError, OSError) as e:
+            self.follow_box.setChecked(False)
+            QMessageBox.warning(self, "Follow", str(e))
+            return
+        self.current_csv_path = path
+        self.x = self.y = None
+        self.view_cache = None
+        self.noise_estimate = None
+        self.show_follow_result()
+        self.on_follow_poll()
+        self.follow_timer.start()
+
+    def stop_follow(self):
+        """Stop polling; the data read so far stays loaded and its last open island is detected."""
+        self.follow_timer.stop()
+        if self.follow is None:
+            return
+        session, self.follow = self.follow, None
+        if session.finish():
+            self.show_follow_result(session)
+        session.close()
+
+    def on_follow_poll(self):
+        session = self.follow
+        if session is None:
+            return
+        try:
+            with stage(self.profiler, "follow") as counts:
+                counts["points"], counts["peaks"] = session.poll()
+        except (ValueError, OSError) as e:
+            self.follow_box.setChecked(False)
+            QMessageBox.critical(self, "Follow", str(e))
+            return
+        if session.behind:
+            # a poll reads a bounded amount: catch up in steps, letting the GUI run in between
+            QTimer.singleShot(0, self.on_follow_poll)
+        if not counts["points"]:
+            return
+        x = None if session.indexed else session.x
+        if self.y is None:
+            self.plot.set_growing(session.pyramid, x)
+        else:
+            self.plot.extend_series(x)
+        self.x, self.y = session.x, session.y
+        if counts["peaks"]:
+            self.show_follow_result(session)
+        self.statusBar().showMessage(
+            f"Following {self.current_csv_path}: {len(session):,} points, {len(self.rows):,} peaks")
+
+    def show_follow_result(self, session=None):
+        result = session.detector.result() if session is not None else {
+            "kept_rows": PeakTable(), "islands": [], "W_by_island": [], "R_by_island": []}
+        self.rows = result["kept_rows"]
+        self.islands = result["islands"]
+        self.W_by_island = result["W_by_island"]
+        self.R_by_island = result["R_by_island"]
+        self.plot.set_islands(self.islands)
+        peaks = PeakIndex(self.rows)
+        self.plot.set_peaks(peaks)
+        self.peak_model.set_peaks(peaks)
+
+    # ------------------
+    # Peak table
+    # ------------------
+    def on_peak_clicked(self, index):
+        self.plot.center_on_index(self.peak_model.peak_at(index.row())["index"])
+
+    # ------------------
+    # Parameter sweep
+    # ------------------
+    def on_sweep(self):
+        if self.sweep_dialog is None:
+            self.sweep_dialog = SweepDialog(self.sweep_data, self)
+            self.sweep_dialog.chosen.connect(self.on_sweep_chosen)
+        self.sweep_dialog.show()
+        self.sweep_dialog.raise_()
+
+    def sweep_data(self):
+        """
+        (data, offset, config, view) for a sweep: the same islands a Run would keep,
+        i.e. for a viewport the whole islands reaching into it (see ResultCache).
+        """
+        config = self.detection_config()
+        if self.y is None:
+            return None, 0, config, None
+        if self.full_run_box.isChecked():
+            return self.y, 0, config, None
+        return self.y, 0, config, get_visible_range(self.plot.ax, len(self.y))
+
+    def on_sweep_chosen(self, height, alpha, rows, islands):
+        self.cancel_detection()
+        self.set_exact(self.threshold_box, height)
+        self.set_exact(self.alpha_box, alpha)
+        self.rows = rows
+        self.islands = islands
+        self.W_by_island = []
+        self.R_by_island = []
+        self.plot.set_islands(self.islands)
+        peaks = PeakIndex(self.rows)  # sorted once for the plot and the table
+        self.plot.set_peaks(peaks)
+        self.peak_model.set_peaks(peaks)
+        self.statusBar().showMessage(
+            f"Min Height {height:g}, alpha {alpha:g}: {len(rows)} peaks", 5000)
+
+    def closeEvent(self, event):
+        self.stop_follow()
+        self.cancel_detection()
+        for worker in list(self.running_workers):
+            worker.wait()
+        if self.profiler is not None:
+            self.profiler.close()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
@@ -1 +1,80 @@
-#Qt table model for peaks
\ No newline at end of file
+#Qt table model for peaks: a lazy view over a PeakIndex, so a million-peak result
+#opens instantly. Rows are formatted only when the view paints them, the row count
+#grows in FETCH_ROWS steps as the view scrolls, and sorting reorders a NumPy permutation.
+import numpy as np
+from PyQt5.QtCore import QAbstractTableModel, QModelIndex, Qt
+from peak_table import PEAK_FIELDS, PeakIndex
+
+FETCH_ROWS = 1000
+FIELDS = list(PEAK_FIELDS)
+HEADERS = ["Index", "Value", "Region", "Width", "Radius"]
+
+
+class PeakTableModel(QAbstractTableModel):
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self.peaks = PeakIndex()
+        self.order = np.empty(0, dtype=np.int64)  # row -> position in self.peaks.peaks
+        self.loaded = 0
+        self.sort_key = None  # (column, Qt.SortOrder) of the last sort, kept across set_peaks
+
+    def set_peaks(self, peaks):
+        self.beginResetModel()
+        self.peaks = PeakIndex(peaks)
+        self.order = self._ordered()
+        self.loaded = min(len(self.order), FETCH_ROWS)
+        self.endResetModel()
+
+    def _ordered(self):
+        if self.sort_key is None:
+            return np.arange(len(self.peaks))
+        column, order = self.sort_key
+        return self.peaks.order_by(FIELDS[column], order == Qt.DescendingOrder)
+
+    def peak_at(self, row):
+        """The peak shown in a row, as a dict."""
+        return self.peaks.peaks[int(self.order[row])]
+
+    # ---- QAbstractTableModel ----
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else self.loaded
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(FIELDS)
+
+    def canFetchMore(self, parent):
+        return not parent.isValid() and self.loaded < len(self.order)
+
+    def fetchMore(self, parent):
+        if parent.isValid():
+            return
+        n = min(len(self.order) - self.loaded, FETCH_ROWS)
+        if n <= 0:
+            return
+        self.beginInsertRows(QModelIndex(), self.loaded, self.loaded + n - 1)
+        self.loaded += n
+        self.endInsertRows()
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        if role == Qt.TextAlignmentRole:
+            return int(Qt.AlignRight | Qt.AlignVCenter)
+        if role != Qt.DisplayRole:
+            return None
+        value = self.peaks.peaks[FIELDS[index.column()]][self.order[index.row()]]
+        return f"{value:g}" if isinstance(value, np.floating) else str(value)
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if role != Qt.DisplayRole:
+            return None
+        if orientation == Qt.Horizontal:
+            return HEADERS[section]
+        return str(section + 1)
+
+    def sort(self, column, order=Qt.AscendingOrder):
+        self.beginResetModel()
+        self.sort_key = (column, order)
+        self.order = self._ordered()
+        self.endResetModel()
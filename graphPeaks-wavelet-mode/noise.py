@@ -0,0 +1,96 @@
+#Noise-floor estimation: picks APEX_MIN_HEIGHT from the data instead of a fixed value.
+#One streaming pass over fixed windows records a robust baseline (median) and spread
+#(MAD, scaled to a standard deviation) per window. The file-level suggestion is
+#baseline + NOISE_K * spread from the medians over windows, so windows full of peaks
+#do not drag it up; per-window heights follow a drifting background.
+import numpy as np
+from constants import ENGINE, DEFAULT_CONFIG, NOISE_WINDOW, NOISE_K
+import detect
+from chunked import iter_chunks, next_cut, merge_threshold
+from profiling import stage
+
+_MAD_SCALE = 1.4826   # MAD -> standard deviation for Gaussian noise
+_Q95_SCALE = 1.6449   # (95th percentile - median) -> standard deviation
+
+
+def _window_stats(v):
+    """(baseline, sigma, step) of one window; step is the gap to the next value above the baseline."""
+    v = v[np.isfinite(v)] if v.dtype.kind == "f" else v
+    if not v.size:
+        return np.nan, np.nan, np.nan
+    med = float(np.median(v))
+    sigma = _MAD_SCALE * float(np.median(np.abs(v - med)))
+    if sigma == 0:
+        # mostly one value (e.g. zero counts): fall back to the upper tail
+        sigma = (float(np.quantile(v, 0.95)) - med) / _Q95_SCALE
+    above = v[v > med]
+    step = float(above.min()) - med if above.size else 0.0
+    return med, sigma, step
+
+
+def estimate_noise(data, window=NOISE_WINDOW, k=NOISE_K, progress=None):
+    """
+    Noise floor of data in one pass of `window`-point reads. Returns a dict:
+    baseline, sigma, height (suggested APEX_MIN_HEIGHT for the whole series)
+    and per-window arrays starts, stops, baselines, sigmas, heights.
+    progress("noise", fraction) is reported per window.
+    """
+    n = len(data)
+    starts = np.arange(0, n, window, dtype=np.int64)
+    stats = np.full((len(starts), 3), np.nan)
+    for i, v in enumerate(iter_chunks(data, window)):
+        stats[i] = _window_stats(v)
+        detect._report(progress, "noise", min((i + 1) * window, n) / max(n, 1))
+    base, sigma, step = stats.T
+    ok = ~np.isnan(base)
+    if ok.any():
+        g_base, g_sigma, g_step = (float(np.median(c[ok])) for c in (base, sigma, step))
+    else:
+        g_base = g_sigma = g_step = 0.0
+    height = g_base + max(k * g_sigma, g_step)
+    heights = np.where(ok, base + np.maximum(k * np.nan_to_num(sigma), np.nan_to_num(step)), height)
+    return {"baseline": g_base, "sigma": g_sigma, "height": height, "k": k, "window": window,
+            "starts": starts, "stops": np.minimum(starts + window, n),
+            "baselines": base, "sigmas": sigma, "heights": heights}
+
+
+def suggest_height(data, window=NOISE_WINDOW, k=NOISE_K):
+    """Suggested APEX_MIN_HEIGHT for data (see estimate_noise)."""
+    return estimate_noise(data, window, k)["height"]
+
+
+def window_heights(estimate, start=0, stop=None):
+    """[(a, b, height), ...] of the estimate's windows clipped to [start, stop), relative to start."""
+    if stop is None:
+        stop = int(estimate["stops"][-1]) if len(estimate["stops"]) else 0
+    spans = []
+    for a, b, h in zip(estimate["starts"], estimate["stops"], estimate["heights"]):
+        a, b = max(int(a), start), min(int(b), stop)
+        if b > a:
+            spans.append((a - start, b - start, float(h)))
+    return spans
+
+
+def run_adaptive(data, spans, engine=ENGINE, config=DEFAULT_CONFIG, progress=None, profiler=None):
+    """
+    Threshold detection with a height per span ((a, b, height) covering data).
+    Spans are joined at the first point at or after their border that is below
+    both heights, so no island is split, then merged like chunked detection.
+    """
+    n = len(data)
+    blocks, a = [], 0
+    for (_, b, h), nxt in zip(spans, spans[1:] + [None]):
+        cut = n if nxt is None else max(a, next_cut(data, b, min(h, nxt[2])))
+        if cut > a:
+            blocks.append((a, cut, h))
+            a = cut
+
+    def parts():
+        for a, b, h in blocks:
+            with stage(profiler, "chunk", points=b - a):
+                res = detect.run_pipeline(np.asarray(data[a:b]), "threshold", engine,
+                                          config=config.replace(height=h), profiler=profiler)
+            yield a, res
+            detect._report(progress, "chunks", b / n)
+    with stage(profiler, "adaptive", points=n, windows=len(blocks)):
+        return merge_threshold(parts())
@@ -0,0 +1,78 @@
+#Plot overlays: islands as one PolyCollection of vertical spans and peaks as one
+#LineCollection of stems plus one scatter of apex dots. Each update hands matplotlib only
+#the items around the current xlim, and past MAX_ITEMS it draws one per pixel column
+#(neighbouring islands merged, the tallest peak kept), so pan/zoom refills three
+#artists in place however many islands and peaks were detected.
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from peak_table import PeakIndex
+
+MAX_ITEMS = 2000  # more visible islands or peaks than this are decimated per pixel column
+
+
+def _merge_spans(starts, ends, gap):
+    """Spans with gaps of at most `gap` merged into one (inputs sorted, non-overlapping)."""
+    breaks = np.flatnonzero(starts[1:] - ends[:-1] > gap) + 1
+    return starts[np.r_[0, breaks]], ends[np.r_[breaks - 1, len(ends) - 1]]
+
+
+def _tallest_per_bin(x, values, xmin, width):
+    """Positions of the largest value in every bin of `width` (x sorted)."""
+    bins = np.floor((x - xmin) / width).astype(np.int64)
+    order = np.lexsort((-values, bins))
+    first = np.r_[True, bins[order][1:] != bins[order][:-1]]
+    return np.sort(order[first])
+
+
+class OverlayLayer:
+    """Island spans and peak markers on one axes, culled to the view by update()."""
+
+    def __init__(self, ax):
+        self.ax = ax
+        self.starts = self.ends = np.empty(0)
+        self.peaks = PeakIndex()
+        # x in data coordinates, y spanning the axes like axvspan
+        self.spans = PolyCollection([], facecolors="C0", edgecolors="none", alpha=0.15,
+                                    transform=ax.get_xaxis_transform())
+        self.stems = LineCollection([], colors="C0", linewidths=1.0)
+        self.dots = ax.scatter([], [], s=20, zorder=3, color="C0")
+        ax.add_collection(self.spans, autolim=False)
+        ax.add_collection(self.stems, autolim=False)
+
+    def set_islands(self, islands):
+        islands = np.asarray(islands, dtype=np.float64).reshape(-1, 2)
+        islands = islands[np.argsort(islands[:, 0], kind="stable")]
+        self.starts, self.ends = islands[:, 0], islands[:, 1]
+
+    def set_peaks(self, peaks):
+        self.peaks = peaks if isinstance(peaks, PeakIndex) else PeakIndex(peaks)
+
+    def update(self, xlim, width_px):
+        """Refill the artists for xlim (plus one view width either side); returns the items drawn."""
+        xmin, xmax = xlim
+        span = xmax - xmin
+        lo, hi = xmin - span, xmax + span
+        px = span / max(width_px, 1)
+
+        a = int(np.searchsorted(self.ends, lo, side="left"))
+        b = int(np.searchsorted(self.starts, hi, side="right"))
+        starts, ends = self.starts[a:b], self.ends[a:b]
+        if len(starts) > MAX_ITEMS:
+            starts, ends = _merge_spans(starts, ends, px)
+        verts = np.empty((len(starts), 4, 2))
+        verts[:, :, 0] = np.column_stack([starts, starts, ends, ends])
+        verts[:, :, 1] = [0, 1, 1, 0]
+        self.spans.set_verts(verts)
+
+        peaks = self.peaks.between(lo, hi)
+        x, y = peaks["index"].astype(np.float64), peaks["value"]
+        if len(x) > MAX_ITEMS:
+            keep = _tallest_per_bin(x, y, lo, px)
+            x, y = x[keep], y[keep]
+        segments = np.empty((len(x), 2, 2))
+        segments[:, :, 0] = x[:, None]
+        segments[:, 0, 1] = 0.0
+        segments[:, 1, 1] = y
+        self.stems.set_segments(segments)
+        self.dots.set_offsets(np.column_stack([x, y]))
+        return len(starts) + len(x)
@@ -0,0 +1,124 @@
+#Parallel detection: splits the signal into island-aligned chunks (threshold) or
+#CWT block ranges (wavelet) and runs them on a process pool. Workers read the
+#signal through a memory map instead of receiving pickled slices.
+import math
+import mmap
+import multiprocessing
+import os
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from constants import CHUNK_SIZE, ENGINE, WAVELET_BLOCK, WORKERS, DEFAULT_CONFIG, POOL_START
+from chunked import island_aligned_chunks, merge_threshold, chunked_median
+import detect
+from profiling import stage
+
+# RAM-backed when available, so the shared copy never touches the disk
+_SHARED_DIR = "/dev/shm" if os.path.isdir("/dev/shm") else None
+
+
+# ----------------------------------------------------
+# shared signal
+# ----------------------------------------------------
+def _mapped_source(data):
+    """(filename, dtype, offset, length) if data already is a whole-file 1-D memmap."""
+    if (isinstance(data, np.memmap) and isinstance(data.base, mmap.mmap)
+            and data.ndim == 1 and data.flags.c_contiguous and data.filename):
+        return data.filename, data.dtype.str, data.offset, len(data)
+    return None
+
+def _share(data, tmp):
+    """Describe data as a file workers can map, copying it into tmp if needed."""
+    src = _mapped_source(data)
+    if src is None:
+        data = np.ascontiguousarray(data)
+        path = os.path.join(tmp, "signal.bin")
+        data.tofile(path)
+        src = (path, data.dtype.str, 0, len(data))
+    return src
+
+def _open(src, mode="r"):
+    path, dtype, offset, length = src
+    if length == 0:
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode=mode, offset=offset, shape=(length,))
+
+
+# ----------------------------------------------------
+# worker tasks (module level so the pool can pickle them)
+# ----------------------------------------------------
+def _threshold_task(src, start, stop, engine, config):
+    return detect.run_pipeline(np.asarray(_open(src)[start:stop]), "threshold", engine, config=config)
+
+def _wavelet_task(src, out_src, start, stop, widths):
+    out = _open(out_src, "r+")
+    out[start:stop] = detect._cwt_abs_sum(_open(src), widths, start, stop)
+    out.flush()
+    return stop
+
+
+# ----------------------------------------------------
+# driver
+# ----------------------------------------------------
+def _task_size(n, workers, chunk_size):
+    """A few tasks per worker for balance, on the wavelet block grid."""
+    size = min(chunk_size, max(1, math.ceil(n / (4 * workers))))
+    return WAVELET_BLOCK * math.ceil(size / WAVELET_BLOCK)
+
+def run_parallel(data, mode="threshold", engine=ENGINE, workers=WORKERS, chunk_size=CHUNK_SIZE,
+                 progress=None, config=DEFAULT_CONFIG, profiler=None):
+    """
+    Same result as detect.run_pipeline(data, mode), computed on a pool of
+    `workers` processes. Threshold chunks are cut between islands and merged
+    back in order, so kept_rows and region_id numbering are unchanged; wavelet
+    blocks land on the same FFT grid as a single-shot run.
+    progress("chunks", fraction) is reported as tasks finish; if it raises,
+    queued tasks are cancelled. The profiler sees the driver's stages only
+    (sharing, the pool as a whole, merging), not the work inside the workers.
+    """
+    n = len(data)
+    size = _task_size(n, workers, chunk_size)
+    if workers <= 1 or n <= size:
+        return detect.run_pipeline(data, mode, engine, progress=progress, config=config, profiler=profiler)
+
+    with tempfile.TemporaryDirectory(dir=_SHARED_DIR) as tmp:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context(POOL_START))
+        try:
+            return _run_on_pool(pool, data, mode, engine, size, chunk_size, tmp, progress, config, profiler)
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+
+def _run_on_pool(pool, data, mode, engine, size, chunk_size, tmp, progress, config, profiler):
+    n = len(data)
+    with stage(profiler, "share", points=n):
+        src = _share(data, tmp)
+    if mode == "wavelet":
+        widths = config.wavelet_widths
+        out_path = os.path.join(tmp, "cwt_sum.bin")
+        with open(out_path, "wb") as fh:
+            fh.truncate(n * 8)
+        out_src = (out_path, "<f8", 0, n)
+        with stage(profiler, "pool_cwt", points=n, tasks=-(-n // size)):
+            for stop in pool.map(_wavelet_task, *zip(*[(src, out_src, a, min(a + size, n), widths)
+                                                       for a in range(0, n, size)])):
+                detect._report(progress, "chunks", stop / n)
+        cwt_sum = _open(out_src)
+        with stage(profiler, "median", points=n):
+            median = chunked_median(cwt_sum, chunk_size)
+        with stage(profiler, "peaks") as counts:
+            result = detect.wavelet_rows(data, cwt_sum, median)
+            counts["peaks"] = len(result["kept_rows"])
+        del cwt_sum
+        return result
+
+    with stage(profiler, "chunk_bounds", points=n) as counts:
+        bounds = list(island_aligned_chunks(data, size, config.height))
+        counts["tasks"] = len(bounds)
+    tasks = [(src, a, b, engine, config) for a, b in bounds]
+    results = []
+    with stage(profiler, "pool_threshold", points=n, tasks=len(bounds)):
+        for (a, b), res in zip(bounds, pool.map(_threshold_task, *zip(*tasks))):
+            results.append((a, res))
+            detect._report(progress, "chunks", b / n)
+    with stage(profiler, "merge", parts=len(results)):
+        return merge_threshold(results)
@@ -0,0 +1,133 @@
+#Columnar peak table: the kept peaks (and local-maxima candidates) of a detection run as
+#one NumPy array per field instead of a dict per peak. Offsets are vector adds, plotting
+#and export read whole columns, and dict rows are only built by the compatibility views
+#(rows(), iteration, integer indexing).
+import numpy as np
+
+# field -> dtype, in export column order
+PEAK_FIELDS = {"index": np.int64, "value": np.float64, "region_id": np.int64,
+               "W_region": np.int64, "R_region": np.int64}
+
+
+class PeakTable:
+    """
+    Equal-length columns index, value, region_id, W_region, R_region.
+    table["value"] is a column, table[mask] / table[a:b] a sub-table,
+    table[i] one peak as a dict.
+    """
+    __slots__ = ("columns",)
+
+    def __init__(self, columns=None):
+        if columns is None:
+            columns = {}
+        self.columns = {name: np.asarray(columns.get(name, ()), dtype=dtype)
+                        for name, dtype in PEAK_FIELDS.items()}
+
+    @classmethod
+    def from_columns(cls, index, value, region_id=-1, W_region=0, R_region=0):
+        """Scalars are broadcast to the length of index."""
+        n = len(index)
+        cols = dict(index=index, value=value, region_id=region_id, W_region=W_region, R_region=R_region)
+        return cls({name: np.broadcast_to(np.asarray(v, dtype=PEAK_FIELDS[name]), (n,)).copy()
+                    for name, v in cols.items()})
+
+    @classmethod
+    def from_rows(cls, rows):
+        """Table of row dicts (the old kept_rows format)."""
+        rows = list(rows)
+        return cls({name: [row[name] for row in rows] for name in PEAK_FIELDS})
+
+    @classmethod
+    def concat(cls, tables):
+        tables = list(tables)
+        if not tables:
+            return cls()
+        return cls({name: np.concatenate([t.columns[name] for t in tables]) for name in PEAK_FIELDS})
+
+    def __len__(self):
+        return len(self.columns["index"])
+
+    def __getitem__(self, key):
+        if isinstance(key, str):
+            return self.columns[key]
+        if isinstance(key, (int, np.integer)):
+            return {name: col[key].item() for name, col in self.columns.items()}
+        return PeakTable({name: col[key] for name, col in self.columns.items()})
+
+    def __iter__(self):
+        return iter(self.rows())
+
+    def __eq__(self, other):
+        if not isinstance(other, PeakTable):
+            return NotImplemented
+        return all(np.array_equal(self.columns[name], other.columns[name]) for name in PEAK_FIELDS)
+
+    def __repr__(self):
+        return f"PeakTable({len(self)} peaks)"
+
+    def shifted(self, index=0, region_id=0):
+        """New table with index and region_id offset (the columns are not shared)."""
+        cols = {name: col.copy() for name, col in self.columns.items()}
+        cols["index"] += index
+        cols["region_id"] += region_id
+        return PeakTable(cols)
+
+    def rows(self):
+        """Compatibility view: one {"index", "value", "region_id", "W_region", "R_region"} dict per peak."""
+        names = list(PEAK_FIELDS)
+        return [dict(zip(names, values)) for values in zip(*(self.columns[n].tolist() for n in names))]
+
+
+def as_peak_table(peaks):
+    """peaks as a PeakTable (a list of row dicts is converted)."""
+    return peaks if isinstance(peaks, PeakTable) else PeakTable.from_rows(peaks)
+
+
+def islands_array(starts, ends):
+    """(n, 2) int64 array of inclusive [start, end] island bounds."""
+    return np.column_stack([np.asarray(starts, dtype=np.int64), np.asarray(ends, dtype=np.int64)])
+
+
+class PeakIndex:
+    """
+    A PeakTable sorted by index for lookups: nearest() and span() are binary
+    searches over the index column instead of scans over every peak.
+    """
+
+    def __init__(self, peaks=None):
+        if isinstance(peaks, PeakIndex):
+            peaks = peaks.peaks
+        peaks = PeakTable() if peaks is None else as_peak_table(peaks)
+        x = peaks["index"]
+        if len(x) > 1 and np.any(x[1:] < x[:-1]):
+            peaks = peaks[np.argsort(x, kind="stable")]
+        self.peaks = peaks
+        self.x = peaks["index"]
+
+    def __len__(self):
+        return len(self.x)
+
+    def nearest(self, x):
+        """Position (in self.peaks) of the peak closest to x, ties to the left; None when empty."""
+        n = len(self.x)
+        if not n:
+            return None
+        i = int(np.searchsorted(self.x, x))
+        if i == n or (i > 0 and x - self.x[i - 1] <= self.x[i] - x):
+            i -= 1
+        return i
+
+    def span(self, lo, hi):
+        """(first, end) positions of the peaks with lo <= index <= hi."""
+        return int(np.searchsorted(self.x, lo, side="left")), int(np.searchsorted(self.x, hi, side="right"))
+
+    def between(self, lo, hi):
+        a, b = self.span(lo, hi)
+        return self.peaks[a:b]
+
+    def order_by(self, field, descending=False):
+        """Positions sorted by a column, equal values kept in index order."""
+        keys = self.peaks[field]
+        if not descending:
+            return np.argsort(keys, kind="stable")
+        return len(keys) - 1 - np.argsort(keys[::-1], kind="stable")[::-1]
@@ -0,0 +1,285 @@
+#Peak export: writes PeakTables column-wise to CSV, Parquet, Feather, .npz or .npy,
+#one table at a time, so chunked and batch runs can stream their peaks out without
+#holding them all. Every file carries a metadata block (parameters, source file and
+#its SHA-256): in the schema for Parquet/Feather, as a member for .npz and as a
+#<file>.meta.json sidecar for CSV and .npy. Files are written to <file>.part and
+#renamed on close, so a failed run never leaves a half-written output behind.
+import hashlib
+import json
+import os
+import struct
+import tempfile
+import time
+import zipfile
+import numpy as np
+from peak_table import PeakTable, PEAK_FIELDS, as_peak_table
+
+META_KEY = "graphpeaks"        # schema metadata key (Parquet/Feather), member name (.npz)
+SIDECAR = ".meta.json"         # metadata next to CSV and .npy outputs
+_NPY_HEADER = 256              # fixed .npy header size, rewritten with the final length on close
+_PEAK_DTYPE = np.dtype(list(PEAK_FIELDS.items()))
+
+
+# ----------------------------------------------------
+# metadata
+# ----------------------------------------------------
+def file_sha256(path, block=1 << 22):
+    h = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for buf in iter(lambda: fh.read(block), b""):
+            h.update(buf)
+    return h.hexdigest()
+
+
+def config_dict(config):
+    """A DetectionConfig as JSON-friendly values (the radius rule by name)."""
+    rule = config.radius_rule
+    return {"height": config.height, "alpha": config.alpha, "separation": config.separation,
+            "radius_rule": f"{rule.__module__}.{rule.__qualname__}",
+            "wavelet_widths": list(config.wavelet_widths)}
+
+
+def peak_metadata(config=None, mode=None, engine=None, source=None, **extra):
+    """Provenance block for an export: parameters, source path, size and SHA-256, time written."""
+    meta = {"written": time.strftime("%Y-%m-%dT%H:%M:%S"), "mode": mode, "engine": engine}
+    if config is not None:
+        meta["config"] = config_dict(config)
+    if source is not None:
+        meta.update(source=os.path.abspath(source), source_size=os.path.getsize(source),
+                    source_sha256=file_sha256(source))
+    meta.update(extra)
+    return meta
+
+
+def _pyarrow(action):
+    """pyarrow and pyarrow.parquet, imported on first use (optional: Parquet and Feather need them)."""
+    try:
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+    except ImportError:
+        raise ImportError(f"{action} needs pyarrow") from None
+    return pa, pq
+
+
+# ----------------------------------------------------
+# writers
+# ----------------------------------------------------
+class PeakWriter:
+    """
+    Base writer: write(table) appends a PeakTable, close() finishes the file.
+    Used as a context manager, an exception discards the partial output.
+    """
+    sidecar = False
+
+    def __init__(self, path, metadata=None):
+        self.path = path
+        self.metadata = dict(metadata or {})
+        self.count = 0
+        self.tmp = path + ".part"
+        self._open()
+
+    def write(self, peaks):
+        peaks = as_peak_table(peaks)
+        self._write(peaks)
+        self.count += len(peaks)
+
+    def close(self):
+        try:
+            self._close()
+            os.replace(self.tmp, self.path)
+        except BaseException:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+            raise
+        if self.sidecar and self.metadata:
+            with open(self.path + SIDECAR, "w") as fh:
+                json.dump(dict(self.metadata, peaks=self.count), fh, indent=1)
+
+    def abort(self):
+        try:
+            self._discard()
+        finally:
+            if os.path.exists(self.tmp):
+                os.remove(self.tmp)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def _open(self):
+        raise NotImplementedError
+
+    def _write(self, peaks):
+        raise NotImplementedError
+
+    def _close(self):
+        raise NotImplementedError
+
+    def _discard(self):
+        self._close()
+
+
+class CsvPeakWriter(PeakWriter):
+    sidecar = True
+
+    def _open(self):
+        import pandas as pd
+        self.fh = open(self.tmp, "w", newline="")
+        pd.DataFrame(PeakTable().columns).to_csv(self.fh, index=False)
+
+    def _write(self, peaks):
+        import pandas as pd
+        pd.DataFrame(peaks.columns).to_csv(self.fh, index=False, header=False)
+
+    def _close(self):
+        self.fh.close()
+
+
+class _ArrowPeakWriter(PeakWriter):
+    def _schema(self):
+        self.pa, self.pq = _pyarrow(f"Writing {os.path.basename(self.path)}")
+        fields = [(name, self.pa.from_numpy_dtype(np.dtype(dtype))) for name, dtype in PEAK_FIELDS.items()]
+        return self.pa.schema(fields, metadata={META_KEY: json.dumps(self.metadata)})
+
+    def _write(self, peaks):
+        if len(peaks):
+            self.writer.write_table(self.pa.Table.from_pydict(peaks.columns, schema=self.schema))
+
+    def _close(self):
+        self.writer.close()
+
+
+class ParquetPeakWriter(_ArrowPeakWriter):
+    """One row group per written table."""
+
+    def _open(self):
+        self.schema = self._schema()
+        self.writer = self.pq.ParquetWriter(self.tmp, self.schema)
+
+
+class FeatherPeakWriter(_ArrowPeakWriter):
+    """Feather v2 (the Arrow IPC file format), one record batch per written table."""
+
+    def _open(self):
+        self.schema = self._schema()
+        self.writer = self.pa.ipc.new_file(self.tmp, self.schema)
+
+
+class NpyPeakWriter(PeakWriter):
+    """A structured array, appended record by record; the header is rewritten with the final length."""
+    sidecar = True
+
+    def _open(self):
+        self.fh = open(self.tmp, "wb")
+        self.fh.write(_npy_header(0))
+
+    def _write(self, peaks):
+        records = np.empty(len(peaks), dtype=_PEAK_DTYPE)
+        for name, col in peaks.columns.items():
+            records[name] = col
+        records.tofile(self.fh)
+
+    def _close(self):
+        self.fh.seek(0)
+        self.fh.write(_npy_header(self.count))
+        self.fh.close()
+
+
+class NpzPeakWriter(PeakWriter):
+    """One .npy member per column plus a "graphpeaks" metadata member; columns are spooled until close."""
+
+    def _open(self):
+        folder = os.path.dirname(os.path.abspath(self.path))
+        self.spool = {name: tempfile.TemporaryFile(dir=folder) for name in PEAK_FIELDS}
+
+    def _write(self, peaks):
+        for name, col in peaks.columns.items():
+            col.tofile(self.spool[name])
+
+    def _close(self):
+        if self.spool is None:
+            return
+        with zipfile.ZipFile(self.tmp, "w", allowZip64=True) as zf:
+            for name, dtype in PEAK_FIELDS.items():
+                spool = self.spool[name]
+                spool.seek(0)
+                with zf.open(name + ".npy", "w", force_zip64=True) as member:
+                    member.write(_npy_header(self.count, dtype))
+                    for buf in iter(lambda: spool.read(1 << 22), b""):
+                        member.write(buf)
+                spool.close()
+            meta = np.array(json.dumps(dict(self.metadata, peaks=self.count)))
+            with zf.open(META_KEY + ".npy", "w") as member:
+                np.lib.format.write_array(member, meta)
+        self.spool = None
+
+    def _discard(self):
+        for spool in (self.spool or {}).values():
+            spool.close()
+
+
+def _npy_header(n, dtype=_PEAK_DTYPE):
+    """Version 1.0 .npy header for a 1-D array of n items, padded to a fixed size."""
+    d = repr({"descr": np.lib.format.dtype_to_descr(np.dtype(dtype)), "fortran_order": False,
+              "shape": (n,)})
+    return (b"\x93NUMPY\x01\x00" + struct.pack("<H", _NPY_HEADER - 10)
+            + (d.ljust(_NPY_HEADER - 11) + "\n").encode("latin1"))
+
+
+WRITERS = {".csv": CsvPeakWriter, ".parquet": ParquetPeakWriter, ".feather": FeatherPeakWriter,
+           ".arrow": FeatherPeakWriter, ".npz": NpzPeakWriter, ".npy": NpyPeakWriter}
+
+
+def open_peak_writer(path, metadata=None):
+    """Writer for path, chosen by its extension (see WRITERS)."""
+    ext = os.path.splitext(path)[1].lower()
+    if ext not in WRITERS:
+        raise ValueError(f"Unsupported peak file type: {ext} (use {', '.join(WRITERS)})")
+    return WRITERS[ext](path, metadata)
+
+
+def write_peaks(path, peaks, metadata=None):
+    """Write one PeakTable (or list of row dicts) to path."""
+    with open_peak_writer(path, metadata) as writer:
+        writer.write(peaks)
+
+
+# ----------------------------------------------------
+# reading back
+# ----------------------------------------------------
+def read_peaks(path):
+    """(PeakTable, metadata dict) of a file written by a PeakWriter."""
+    ext = os.path.splitext(path)[1].lower()
+    meta = {}
+    if ext in (".parquet", ".feather", ".arrow"):
+        pa, pq = _pyarrow(f"Reading {os.path.basename(path)}")
+        if ext == ".parquet":
+            table = pq.read_table(path)
+        else:
+            with pa.memory_map(path) as source:
+                table = pa.ipc.open_file(source).read_all()
+        raw = (table.schema.metadata or {}).get(META_KEY.encode())
+        meta = json.loads(raw) if raw else {}
+        return PeakTable({name: table.column(name).to_numpy() for name in PEAK_FIELDS}), meta
+    if ext == ".npz":
+        with np.load(path) as npz:
+            if META_KEY in npz.files:
+                meta = json.loads(npz[META_KEY].item())
+            return PeakTable({name: npz[name] for name in PEAK_FIELDS}), meta
+    if ext == ".npy":
+        records = np.load(path)
+        table = PeakTable({name: records[name] for name in PEAK_FIELDS})
+    elif ext == ".csv":
+        import pandas as pd
+        table = PeakTable({name: col.to_numpy() for name, col in pd.read_csv(path, float_precision="round_trip").items()})
+    else:
+        raise ValueError(f"Unsupported peak file type: {ext}")
+    if os.path.exists(path + SIDECAR):
+        with open(path + SIDECAR) as fh:
+            meta = json.load(fh)
+    return table, meta
@@ -1,9 +1,14 @@
+from PyQt5.QtCore import QTimer
 from PyQt5.QtWidgets import QWidget, QVBoxLayout
 from matplotlib.figure import Figure
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
 from matplotlib.backends.backend_qt5agg import NavigationToolbar2QT as NavigationToolbar
 import numpy as np
-import os
+from constants import TILE_SIZE, REDRAW_DELAY_MS
+from pyramid import MinMaxPyramid
+from tile_cache import TileCache
+from profiling import stage
+from overlay import OverlayLayer
 
 class PlotWidget(QWidget):
     def __init__(self, parent=None):
@@ -20,9 +25,7 @@ class PlotWidget(QWidget):
 
         # ---- Default Plot Elements ----
         self.series_line = None
-        self.island_patches = []
-        self.peak_lines = None
-        self.peak_dots = None
+        self.overlay = OverlayLayer(self.ax)  # island spans and peak markers, culled to the view
         self.peak_labels = []
 
         self.ax.set_xlabel("Index")
@@ -34,83 +37,174 @@ class PlotWidget(QWidget):
 
         # Tile settings
         self.tile_mode = False
-        self.tile_dir = None
-        self.tile_size = 10000
-
-    def enable_tile_mode(self, tile_dir, tile_size=10000):
+        self.tiles = None
+        self.tile_size = TILE_SIZE
+        self.tile_cache = None
+        self._last_view = None  # xlim of the previous redraw, gives the pan direction
+        self._end = None  # last x of a growing (followed) series
+
+        # Decimated series: min/max pyramid over y, x positions (None = index)
+        self.pyramid = None
+        self.x_data = None
+
+        # profiling.StageProfiler timing redraws, set by the window
+        self.profiler = None
+
+        # xlim_changed fires for every mouse move while panning: redraw once it settles
+        self.redraw_timer = QTimer(self)
+        self.redraw_timer.setSingleShot(True)
+        self.redraw_timer.setInterval(REDRAW_DELAY_MS)
+        self.redraw_timer.timeout.connect(self.on_redraw_timer)
+
+    def enable_tile_mode(self, tiles, pyramid):
         self.tile_mode = True
-        self.tile_dir = tile_dir
-        self.tile_size = tile_size
-        self.series_line = None
-        self.ax.set_xlim(0, tile_size * 2)
+        self.tiles = tiles
+        self.tile_size = tiles.tile_size
+        self.close_tile_cache()
+        self.tile_cache = TileCache()
+        self.pyramid = pyramid.cached(self.tile_cache, self.tile_size)
+        self.x_data = None
+        self._last_view = None
+        self.ax.set_xlim(0, self.tile_size * 2)
         self.update_visible_tiles()
 
+    def close_tile_cache(self):
+        if self.tile_cache is not None:
+            self.tile_cache.close()
+            self.tile_cache = None
+
+    def set_growing(self, pyramid, x=None):
+        """Show a follow-mode series (a pyramid.GrowingPyramid); extend_series() picks up new points."""
+        self.tile_mode = False
+        self.close_tile_cache()
+        self.pyramid = pyramid
+        self._end = None
+        self.extend_series(x)
+
+    def extend_series(self, x=None):
+        """
+        The growing series got new points (x: the new x column, None for the
+        index). A view that showed the old end scrolls along with the data.
+        """
+        self.x_data = x
+        n = len(self.pyramid)
+        if not n:
+            return
+        end = float(x[n - 1]) if x is not None else n - 1.0
+        if self._end is None:
+            first = float(x[0]) if x is not None else 0.0
+            self.ax.set_xlim(first, max(end, first + 1), auto=True)
+        else:
+            xmin, xmax = self.ax.get_xlim()
+            if xmax >= self._end:
+                self.ax.set_xlim(xmin + end - self._end, xmax + end - self._end)
+        self._end = end
+        self.redraw_series()
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+
     def on_zoom(self, ax):
+        self.redraw_timer.start()
+
+    def on_redraw_timer(self):
         if self.tile_mode:
             self.update_visible_tiles()
+        elif self.pyramid is not None:
+            self.redraw_series()
+        self.redraw_overlay()
+        self.prefetch_ahead()
+
+    def prefetch_ahead(self):
+        """Queue the next viewport's tiles in the pan direction (both sides after a zoom)."""
+        xmin, xmax = self.ax.get_xlim()
+        last, self._last_view = self._last_view, (xmin, xmax)
+        if self.tile_cache is None or last is None:
+            return
+        span = xmax - xmin
+        if not np.isclose(span, last[1] - last[0]):
+            ahead = [(xmax, xmax + span), (xmin - span, xmin)]
+        elif xmin > last[0]:
+            ahead = [(xmax, xmax + span)]
+        elif xmin < last[0]:
+            ahead = [(xmin - span, xmin)]
+        else:
+            return
+        points = self.visible_points()
+        self.tile_cache.prefetch([b for a, z in ahead
+                                  for b in self.pyramid.blocks(int(np.floor(a)), int(np.ceil(z)) + 1, points)])
 
     def update_visible_tiles(self):
-        if not self.tile_dir:
+        if self.tiles is None:
             return
-        xmin, xmax = map(int, self.ax.get_xlim())
-        start = (xmin // self.tile_size) * self.tile_size
-        end = ((xmax // self.tile_size) + 1) * self.tile_size
-
-        x_all, y_all = [], []
-        for i in range(start, end, self.tile_size):
-            path = os.path.join(self.tile_dir, f"tile_{i}.npy")
-            if os.path.exists(path):
-                y = np.load(path)
-                x = np.arange(i, i + len(y))
-                x_all.append(x)
-                y_all.append(y)
-
-        self.ax.clear()
-        if x_all and y_all:
-            self.ax.plot(np.concatenate(x_all), np.concatenate(y_all), linewidth=1.0)
-        self.ax.set_xlabel("Index")
-        self.ax.set_ylabel("Value")
-        self.ax.grid(True)
+        self.redraw_series()
+        self.ax.relim()
+        self.ax.autoscale_view(scalex=False)
+
+    def visible_points(self):
+        """Point budget for the line: about two per pixel column of the axes."""
+        return max(2 * int(self.ax.bbox.width), 200)
+
+    def redraw_series(self):
+        """Refill the series line for the current xlim from the pyramid."""
+        with stage(self.profiler, "redraw") as counts:
+            counts["points"] = self._redraw_series()
+
+    def _redraw_series(self):
+        xmin, xmax = self.ax.get_xlim()
+        if self.x_data is None:
+            start, stop = int(np.floor(xmin)), int(np.ceil(xmax)) + 1
+        else:
+            start = int(np.searchsorted(self.x_data, xmin)) - 1
+            stop = int(np.searchsorted(self.x_data, xmax, side="right")) + 1
+        x, y = self.pyramid.query(start, stop, self.visible_points())
+        if self.x_data is not None and len(x):
+            x = self.x_data[x.astype(np.int64)]
+        if self.series_line is None:
+            self.series_line, = self.ax.plot(x, y, linewidth=1.0)
+        else:
+            self.series_line.set_data(x, y)
         self.canvas.draw_idle()
+        return len(x)
 
     def set_series(self, x, y):
         self.tile_mode = False  # disable tiles for static view
+        self.close_tile_cache()
         if len(x) != len(y):
             raise ValueError("x and y must be the same length")
-        if self.series_line is None:
-            line, = self.ax.plot(x, y, linewidth=1.0)
-            self.series_line = line
+        x, y = np.asarray(x), np.asarray(y)
+        if len(x) > 1 and not np.all(x[1:] >= x[:-1]):
+            # decimation needs x ordered; draw unordered data as-is
+            self.pyramid = None
+            if self.series_line is None:
+                self.series_line, = self.ax.plot(x, y, linewidth=1.0)
+            else:
+                self.series_line.set_data(x, y)
         else:
-            self.series_line.set_data(x, y)
+            self.pyramid = MinMaxPyramid.build(y)
+            self.x_data = x
+            if len(x):
+                self.ax.set_xlim(x[0], x[-1], auto=True)
+            self.redraw_series()
         self.ax.relim()
         self.ax.autoscale_view()
         self.canvas.draw_idle()
 
     def set_islands(self, islands):
-        for p in self.island_patches:
-            p.remove()
-        self.island_patches = []
-        for start, end in islands:
-            patch = self.ax.axvspan(start, end, alpha=0.15)
-            self.island_patches.append(patch)
-        self.canvas.draw_idle()
+        self.overlay.set_islands(islands)
+        self.redraw_overlay()
 
-    def set_peaks(self, kept_rows):
-        if self.peak_lines:
-            self.peak_lines.remove()
-            self.peak_lines = None
-        if self.peak_dots:
-            self.peak_dots.remove()
-            self.peak_dots = None
+    def set_peaks(self, peaks):
+        """Show the peaks of a PeakTable (or a list of row dicts) as stems and dots."""
         for txt in self.peak_labels:
             txt.remove()
         self.peak_labels = []
+        self.overlay.set_peaks(peaks)
+        self.redraw_overlay()
 
-        x_idx = [row["index"] for row in kept_rows]
-        y_val = [row["value"] for row in kept_rows]
-
-        self.peak_lines = self.ax.vlines(x_idx, 0.0, y_val, linewidths=1.0)
-        self.peak_dots = self.ax.scatter(x_idx, y_val, s=20, zorder=3)
+    def redraw_overlay(self):
+        """Refill the island and peak collections for the current xlim."""
+        with stage(self.profiler, "overlay") as counts:
+            counts["items"] = self.overlay.update(self.ax.get_xlim(), self.ax.bbox.width)
         self.canvas.draw_idle()
 
     def center_on_index(self, idx):
@@ -121,15 +215,14 @@ class PlotWidget(QWidget):
         self.canvas.draw_idle()
 
     def on_canvas_click(self, event):
-        if event.inaxes != self.ax or self.peak_dots is None:
+        peaks = self.overlay.peaks
+        if event.inaxes != self.ax or not len(peaks):
             return
         x_click, y_click = event.xdata, event.ydata
         if x_click is None or y_click is None:
             return
-        offsets = self.peak_dots.get_offsets()
-        x_peaks, y_peaks = offsets[:, 0], offsets[:, 1]
-        nearest_i = abs(x_peaks - x_click).argmin()
-        xi, yi = x_peaks[nearest_i], y_peaks[nearest_i]
+        peak = peaks.peaks[peaks.nearest(x_click)]
+        xi, yi = peak["index"], peak["value"]
         for label in self.peak_labels:
             label.remove()
         self.peak_labels = []
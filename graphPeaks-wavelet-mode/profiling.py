@@ -0,0 +1,149 @@
+#Opt-in stage profiler: records wall time, peak traced memory and element counts per
+#stage. Pass a StageProfiler as `profiler=` to run_pipeline (or wrap any code in
+#profiler.stage(...)); export with to_json() or to_trace() (Chrome trace-event format,
+#opens in chrome://tracing or Perfetto).
+import json
+import os
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+
+class StageProfiler:
+    """
+    Collects one event per stage; stages may nest and may run on several threads.
+    memory=True traces allocations (numpy buffers included) with tracemalloc,
+    which slows pure-Python stages; peaks are process-wide, so stages running
+    at the same time on other threads are counted in.
+    """
+
+    def __init__(self, memory=False):
+        self.memory = memory
+        self.events = []
+        self._t0 = time.perf_counter()
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self._started_tracing = False
+        if memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._started_tracing = True
+
+    def close(self):
+        """Stop tracemalloc if this profiler started it."""
+        if self._started_tracing:
+            tracemalloc.stop()
+            self._started_tracing = False
+
+    def _stack(self):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+        return stack
+
+    def active(self):
+        """True inside a stage on the calling thread."""
+        return bool(self._stack())
+
+    @contextmanager
+    def stage(self, name, **counts):
+        """Time the block as stage `name`; add counts to the yielded dict inside it."""
+        stack = self._stack()
+        tracing = self.memory and tracemalloc.is_tracing()
+        if tracing:
+            # keep what the enclosing stages reached before the peak is reset for this one
+            peak = tracemalloc.get_traced_memory()[1]
+            for outer in stack:
+                outer["_peak"] = max(outer["_peak"], peak)
+            tracemalloc.reset_peak()
+        event = {"name": name, "counts": dict(counts), "depth": len(stack),
+                 "thread": threading.current_thread().name, "_peak": 0}
+        stack.append(event)
+        start = time.perf_counter()
+        try:
+            yield event["counts"]
+        finally:
+            end = time.perf_counter()
+            stack.pop()
+            event["start"] = start - self._t0
+            event["seconds"] = end - start
+            if tracing:
+                event["_peak"] = max(event["_peak"], tracemalloc.get_traced_memory()[1])
+                if stack:
+                    stack[-1]["_peak"] = max(stack[-1]["_peak"], event["_peak"])
+                event["peak_mb"] = event["_peak"] / 1e6
+            else:
+                event["peak_mb"] = None
+            del event["_peak"]
+            with self._lock:
+                self.events.append(event)
+
+    def mark(self):
+        """Position to pass as summary(since=...) to cover only the stages finished after now."""
+        with self._lock:
+            return len(self.events)
+
+    def summary(self, since=0):
+        """{stage: {"calls", "seconds", "peak_mb", counts...}} summed over calls (peak is the max)."""
+        out = {}
+        with self._lock:
+            events = self.events[since:]
+        for e in events:
+            s = out.setdefault(e["name"], {"calls": 0, "seconds": 0.0, "peak_mb": None})
+            s["calls"] += 1
+            s["seconds"] += e["seconds"]
+            if e["peak_mb"] is not None:
+                s["peak_mb"] = max(s["peak_mb"] or 0.0, e["peak_mb"])
+            for k, v in e["counts"].items():
+                # numbers add up over calls, labels (e.g. a mode) keep the last value
+                s[k] = s.get(k, 0) + v if isinstance(v, (int, float)) else v
+        return out
+
+    def format(self, names=None, limit=6):
+        """format_summary of everything recorded so far."""
+        return format_summary(self.summary(), names, limit)
+
+    def to_json(self, path):
+        with self._lock:
+            events = list(self.events)
+        with open(path, "w") as fh:
+            json.dump({"summary": self.summary(), "events": events}, fh, indent=1)
+
+    def to_trace(self, path):
+        """Chrome trace-event JSON: one complete ("X") event per stage."""
+        with self._lock:
+            events = list(self.events)
+        threads = {}
+        trace = []
+        for e in events:
+            tid = threads.setdefault(e["thread"], len(threads) + 1)
+            args = dict(e["counts"])
+            if e["peak_mb"] is not None:
+                args["peak_mb"] = round(e["peak_mb"], 3)
+            trace.append({"name": e["name"], "ph": "X", "pid": os.getpid(), "tid": tid,
+                          "ts": e["start"] * 1e6, "dur": e["seconds"] * 1e6, "args": args})
+        for name, tid in threads.items():
+            trace.append({"name": "thread_name", "ph": "M", "pid": os.getpid(), "tid": tid,
+                          "args": {"name": name}})
+        with open(path, "w") as fh:
+            json.dump({"traceEvents": trace, "displayTimeUnit": "ms"}, fh)
+
+
+def format_summary(summary, names=None, limit=6):
+    """Short one-line summary ("widths 40 ms / 12 MB, islands 12 ms, ...") for a status bar."""
+    items = [(n, s) for n, s in summary.items() if names is None or n in names]
+    items.sort(key=lambda item: -item[1]["seconds"])
+    parts = []
+    for name, s in items[:limit]:
+        text = f"{name} {s['seconds'] * 1e3:.0f} ms"
+        if s["peak_mb"] is not None:
+            text += f" / {s['peak_mb']:.0f} MB"
+        parts.append(text)
+    return ", ".join(parts)
+
+
+def stage(profiler, name, **counts):
+    """profiler.stage(name) or, without a profiler, a no-op block yielding a scratch dict."""
+    if profiler is None:
+        return nullcontext({})
+    return profiler.stage(name, **counts)
@@ -0,0 +1,220 @@
+#Min/max decimation pyramid for plotting long series. Level k keeps the min and
+#max of every bucket of PYRAMID_BASE * 2**k points, so any zoom level can be drawn
+#with about two points per pixel column without losing peak extremes.
+import os
+import numpy as np
+from constants import PYRAMID_BASE
+from tile_writer import TileStore, write_store
+
+PYRAMID_NAME = "pyramid.tiles"
+_MIN_BUCKETS = 1024      # stop adding levels once a level is this small
+_BUILD_CHUNK = 1 << 22   # raw points reduced at a time when building
+
+
+def _base_level(y, base):
+    """(min, max) per bucket of `base` points, the last bucket may be partial."""
+    n = len(y)
+    mm = np.empty((-(-n // base), 2), dtype=y.dtype)
+    step = _BUILD_CHUNK - _BUILD_CHUNK % base
+    for a in range(0, n, step):
+        block = np.asarray(y[a:a + step])
+        full, j = len(block) // base, a // base
+        if full:
+            rows = block[:full * base].reshape(full, base)
+            np.fmin.reduce(rows, axis=1, out=mm[j:j + full, 0])
+            np.fmax.reduce(rows, axis=1, out=mm[j:j + full, 1])
+        if len(block) % base:
+            tail = block[full * base:]
+            mm[j + full] = np.fmin.reduce(tail), np.fmax.reduce(tail)
+    return mm
+
+
+def _reduce(mm):
+    """Merge neighbouring buckets pairwise (a trailing odd bucket is kept as is)."""
+    half = len(mm) // 2
+    out = np.empty((len(mm) - half, 2), dtype=mm.dtype)
+    np.fmin(mm[0:2 * half:2, 0], mm[1:2 * half:2, 0], out=out[:half, 0])
+    np.fmax(mm[0:2 * half:2, 1], mm[1:2 * half:2, 1], out=out[:half, 1])
+    out[half:] = mm[2 * half:]
+    return out
+
+
+def build_levels(y, base=PYRAMID_BASE):
+    """[(bucket size, (m, 2) min/max array), ...] from finest to coarsest."""
+    levels = [(base, _base_level(y, base))]
+    while len(levels[-1][1]) > _MIN_BUCKETS:
+        bucket, mm = levels[-1]
+        levels.append((bucket * 2, _reduce(mm)))
+    return levels
+
+
+class MinMaxPyramid:
+    """Raw series plus its min/max levels; query() picks the level for a viewport."""
+
+    def __init__(self, y, levels):
+        self.y = y
+        self.levels = levels
+
+    @classmethod
+    def build(cls, y, base=PYRAMID_BASE):
+        return cls(y, build_levels(y, base))
+
+    def __len__(self):
+        return len(self.y)
+
+    def _pick(self, start, stop, max_points):
+        """(array, first row, end row, bucket) query() reads for a clipped range; bucket 0 is the raw series."""
+        if stop - start <= max_points:
+            return self.y, start, stop, 0
+        for bucket, mm in self.levels:
+            j0, j1 = start // bucket, -(-stop // bucket)
+            if 2 * (j1 - j0) <= max_points:
+                break
+        return mm, j0, j1, bucket
+
+    def query(self, start, stop, max_points):
+        """
+        (index, value) arrays for y[start:stop] with at most ~max_points points:
+        the raw slice when it is short enough, otherwise the (min, max) pair of
+        every bucket of the finest level that fits, placed at the bucket center.
+        """
+        start, stop = max(0, int(start)), min(len(self.y), int(stop))
+        if stop <= start:
+            return np.empty(0), np.empty(0)
+        data, j0, j1, bucket = self._pick(start, stop, max_points)
+        if not bucket:
+            return np.arange(start, stop), np.asarray(data[start:stop])
+        lo = np.arange(j0, j1) * bucket
+        x = ((lo + np.minimum(lo + bucket, len(self.y)) - 1) / 2).repeat(2)
+        return x, np.asarray(data[j0:j1]).ravel()
+
+    # ---- reading through a tile_cache.TileCache ----
+    def cached(self, cache, block):
+        """Same pyramid with the series and every level read through cache, block rows per tile."""
+        return MinMaxPyramid(cache.view(self.y, block), [(b, cache.view(mm, block)) for b, mm in self.levels])
+
+    def blocks(self, start, stop, max_points):
+        """[(view, block index), ...] a query of this range would read (empty when not cached)."""
+        start, stop = max(0, int(start)), min(len(self.y), int(stop))
+        if stop <= start:
+            return []
+        data, j0, j1, _ = self._pick(start, stop, max_points)
+        if not hasattr(data, "blocks"):
+            return []
+        return [(data, i) for i in data.blocks(j0, j1)]
+
+    # ---- storage next to a tile store ----
+    def save(self, path, **meta):
+        """Write all levels into one store file (min/max interleaved, level table in the header)."""
+        table, offset = [], 0
+        for bucket, mm in self.levels:
+            table.append([bucket, offset, len(mm)])
+            offset += mm.size
+        flat = np.concatenate([mm.ravel() for _, mm in self.levels])
+        write_store(path, flat, levels=table, length_source=len(self.y), **meta)
+
+    @classmethod
+    def open(cls, path, y):
+        store = TileStore(path)
+        levels = [(bucket, store.data[off:off + 2 * m].reshape(m, 2))
+                  for bucket, off, m in store.header["levels"]]
+        return cls(y, levels), store.header
+
+
+# ----------------------------------------------------
+# growing series (follow mode)
+# ----------------------------------------------------
+class GrowingArray:
+    """
+    Append-only array with doubling capacity, so appending costs the new rows
+    only. In memory, or in a file when path is given (mapped, grown by
+    truncate). data is a view of the filled rows; views taken before an append
+    stay valid but do not see the new rows.
+    """
+
+    def __init__(self, dtype, shape=(), path=None, capacity=1 << 16):
+        self.dtype = np.dtype(dtype)
+        self.row_shape = tuple(shape)
+        self.path = path
+        self.length = 0
+        self._buf = None
+        self._alloc(capacity)
+
+    def _alloc(self, capacity):
+        old = self._buf
+        if self.path is None:
+            self._buf = np.empty((capacity,) + self.row_shape, dtype=self.dtype)
+            if old is not None:
+                self._buf[:self.length] = old[:self.length]
+        else:
+            row = self.dtype.itemsize * int(np.prod(self.row_shape, dtype=np.int64))
+            with open(self.path, "ab") as fh:
+                fh.truncate(capacity * row)
+            self._buf = np.memmap(self.path, dtype=self.dtype, mode="r+", shape=(capacity,) + self.row_shape)
+
+    def __len__(self):
+        return self.length
+
+    @property
+    def data(self):
+        return self._buf[:self.length]
+
+    def resize(self, n):
+        """Keep the first n rows (n may exceed the length; the new rows are then undefined)."""
+        if n > len(self._buf):
+            self._alloc(max(n, 2 * len(self._buf)))
+        self.length = n
+
+    def extend(self, values):
+        values = np.asarray(values)
+        n = self.length
+        self.resize(n + len(values))
+        self._buf[n:self.length] = values
+
+
+class GrowingPyramid(MinMaxPyramid):
+    """
+    MinMaxPyramid of a series that only grows. extend(y) recomputes just the
+    last (partial) bucket of every level onwards, so an update costs about the
+    appended points; the levels equal build_levels(y) after every update.
+    """
+
+    def __init__(self, dtype, base=PYRAMID_BASE):
+        super().__init__(np.empty(0, dtype=dtype), [])
+        self.base = base
+        self._bufs = []
+
+    def extend(self, y):
+        """y is the previous series with points appended."""
+        j = len(self.y) // self.base
+        self.y = y
+        rows = _base_level(y[j * self.base:], self.base)
+        k = 0
+        while True:
+            if k == len(self._bufs):
+                self._bufs.append(GrowingArray(rows.dtype, (2,)))
+            buf = self._bufs[k]
+            buf.resize(j)
+            buf.extend(rows)
+            if len(buf) <= _MIN_BUCKETS:
+                break
+            k += 1
+            # a level added by this update is computed in full
+            j = min(j // 2, len(self._bufs[k])) if k < len(self._bufs) else 0
+            rows = _reduce(buf.data[2 * j:])
+        self.levels = [(self.base << k, buf.data) for k, buf in enumerate(self._bufs)]
+
+
+def load_pyramid(tiles):
+    """Pyramid for a TileStore, built once and kept in the same cache folder."""
+    path = os.path.join(os.path.dirname(tiles.path), PYRAMID_NAME)
+    if os.path.exists(path):
+        try:
+            pyramid, header = MinMaxPyramid.open(path, tiles.data)
+            if header.get("source_hash") == tiles.source_hash and header.get("length_source") == len(tiles):
+                return pyramid
+        except (ValueError, OSError, KeyError):
+            pass
+    pyramid = MinMaxPyramid.build(tiles.data)
+    pyramid.save(path, source_hash=tiles.source_hash)
+    return pyramid
@@ -0,0 +1,162 @@
+#Viewport result cache: detection results for one dataset kept per chunk, so a
+#viewport run only computes the chunks it has not seen with the same parameters.
+#threshold mode caches run_pipeline results per island-aligned chunk of a fixed grid,
+#wavelet mode caches the CWT abs-sum per WAVELET_BLOCK block (blocks are exact, see
+#detect._cwt_abs_sum), and both are evicted least-recently-used first.
+import threading
+from collections import OrderedDict
+import numpy as np
+from constants import ENGINE, VIEW_CHUNK, VIEW_CACHE_ENTRIES, DEFAULT_CONFIG
+import detect
+from chunked import next_cut, merge_threshold
+from profiling import stage
+
+
+def params_key(mode, engine=ENGINE, config=DEFAULT_CONFIG):
+    """Everything besides the data that a chunk's result depends on."""
+    if mode == "wavelet":
+        return ("wavelet", tuple(config.wavelet_widths))
+    return ("threshold", engine, config)
+
+
+class ResultCache:
+    """LRU of per-chunk detection results over one series (cleared when the data changes)."""
+
+    def __init__(self, data, chunk_size=VIEW_CHUNK, max_entries=VIEW_CACHE_ENTRIES):
+        self.data = data
+        self.chunk_size = chunk_size
+        self.max_entries = max_entries
+        self.hits = self.misses = 0
+        self._entries = OrderedDict()
+        self._cuts = {}
+        # a cancelled worker may still be finishing while the next one starts
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._cuts.clear()
+
+    def _get(self, key):
+        with self._lock:
+            value = self._entries.get(key)
+            if value is None:
+                self.misses += 1
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+            return value
+
+    def _put(self, key, value):
+        with self._lock:
+            self._entries[key] = value
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    # ---- threshold: island-aligned chunks ----
+    def _cut(self, k, height):
+        """Start of grid chunk k (see chunked.island_aligned_chunks)."""
+        n = len(self.data)
+        g = k * self.chunk_size
+        if g <= 0 or g >= n:
+            return min(max(g, 0), n)
+        with self._lock:
+            cut = self._cuts.get((height, k))
+        if cut is None:
+            cut = next_cut(self.data, g, height)
+            with self._lock:
+                self._cuts[(height, k)] = cut
+        return cut
+
+    def chunks(self, start, stop, height):
+        """[(a, b), ...] island-aligned chunks that together cover [start, stop)."""
+        k = start // self.chunk_size
+        # an island longer than a chunk pushes a cut past later grid points
+        while k > 0 and self._cut(k, height) > start:
+            k -= 1
+        out, a = [], self._cut(k, height)
+        while a < stop:
+            k += 1
+            b = self._cut(k, height)
+            if b > a:
+                out.append((a, b))
+                a = b
+        return out
+
+    def threshold(self, start, stop, engine=ENGINE, progress=None, config=DEFAULT_CONFIG, counts=None,
+                  profiler=None):
+        key = params_key("threshold", engine, config)
+        chunks = self.chunks(start, stop, config.height)
+        parts = []
+        for i, (a, b) in enumerate(chunks):
+            res = self._get((key, a, b))
+            if res is None:
+                res = detect.run_pipeline(np.asarray(self.data[a:b]), "threshold", engine, config=config,
+                                          profiler=profiler)
+                self._put((key, a, b), res)
+            elif counts is not None:
+                counts["hits"] += 1
+            parts.append((a, res))
+            detect._report(progress, "chunks", (i + 1) / len(chunks))
+        return _trim(merge_threshold(parts), start, stop)
+
+    # ---- wavelet: CWT blocks ----
+    def wavelet(self, start, stop, progress=None, config=DEFAULT_CONFIG, counts=None, profiler=None):
+        key = params_key("wavelet", config=config)
+        widths = config.wavelet_widths
+        block = detect.WAVELET_BLOCK
+        n = len(self.data)
+        first = start - start % block
+        blocks = list(range(first, stop, block))
+        cwt = []
+        for i, a in enumerate(blocks):
+            values = self._get((key, a))
+            if values is None:
+                with stage(profiler, "cwt", points=min(a + block, n) - a, widths=len(widths)):
+                    values = detect._cwt_abs_sum(self.data, widths, a, min(a + block, n), block)
+                values.flags.writeable = False
+                self._put((key, a), values)
+            elif counts is not None:
+                counts["hits"] += 1
+            cwt.append(values)
+            detect._report(progress, "cwt", (i + 1) / len(blocks))
+        cwt_sum = np.concatenate(cwt)[start - first:stop - first] if cwt else np.empty(0)
+        result = detect.wavelet_rows(np.asarray(self.data[start:stop]), cwt_sum, np.median(cwt_sum))
+        result["kept_rows"] = result["kept_rows"].shifted(start)
+        return result
+
+    def detect(self, start, stop, mode="threshold", engine=ENGINE, progress=None, config=DEFAULT_CONFIG,
+               profiler=None):
+        """
+        run_pipeline-style result for data[start:stop], indices relative to the full series.
+        With a profiler the run is one "view_cache" stage counting cache hits; misses
+        show up as the stages of the detection they ran.
+        """
+        start, stop = max(0, int(start)), min(len(self.data), int(stop))
+        if stop <= start:
+            return merge_threshold([])
+        with stage(profiler, "view_cache", points=stop - start) as counts:
+            counts["hits"] = 0
+            if mode == "wavelet":
+                return self.wavelet(start, stop, progress, config, counts, profiler)
+            return self.threshold(start, stop, engine, progress, config, counts, profiler)
+
+
+def _trim(result, start, stop):
+    """Keep the islands that reach into [start, stop), renumbering region ids."""
+    islands = result["islands"]
+    # islands are sorted and disjoint, so the ones reaching into the view are a run [a, b)
+    a = int(np.searchsorted(islands[:, 1], start, side="left"))
+    b = int(np.searchsorted(islands[:, 0], stop, side="left"))
+    b = max(a, b)
+
+    def in_view(table):
+        rid = table["region_id"]
+        return table[(rid >= a) & (rid < b)].shifted(region_id=-a)
+    return {"islands": islands[a:b], "local_max": in_view(result["local_max"]),
+            "W_by_island": result["W_by_island"][a:b], "R_by_island": result["R_by_island"][a:b],
+            "kept_rows": in_view(result["kept_rows"])}
@@ -0,0 +1,138 @@
+#Startup budget check for the GUI: times launch to a shown window in a fresh interpreter,
+#reports where the import time goes, and checks the lazy-import rules:
+#  - scipy, pandas, pyarrow, h5py and the Excel readers are not loaded before the window
+#    shows (they load on first use, or in warm_up()'s background thread once it is up)
+#  - the headless detection path (batch runs, detect, chunked, ...) never imports Qt or pyplot
+#Exits 1 when a check fails or the startup is over the budget.
+#
+#    python startup.py [--budget SECONDS] [--top N]
+import argparse
+import importlib
+import os
+import subprocess
+import sys
+import threading
+import time
+from collections import defaultdict
+import constants as C
+
+WARM_MODULES = ("pandas", "scipy.fft", "scipy.signal", "openpyxl")   # warm_up() imports these
+LAZY_MODULES = ("scipy", "pandas", "pyarrow", "h5py", "openpyxl", "xlrd")  # not needed to show the window
+HEADLESS_MODULES = ("detect", "chunked", "parallel", "noise", "sweep", "result_cache", "io_utils",
+                    "peak_writer", "follow", "batch", "bench")
+HEADLESS_FORBIDDEN = ("PyQt5", "matplotlib.pyplot")
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+_SHOW_WINDOW = """
+import sys, time
+from PyQt5.QtWidgets import QApplication
+from main_window import MainWindow
+app = QApplication(sys.argv[:1])
+win = MainWindow()
+win.show()
+app.processEvents()
+print(time.time())
+print(" ".join(sorted(sys.modules)))
+"""
+
+_HEADLESS = """
+import sys
+import numpy as np
+import {modules}
+data = np.abs(np.sin(np.arange(20000) / 50.0)) * 100
+detect.run_pipeline(data, "threshold")
+detect.run_pipeline(data, "wavelet")
+print(" ".join(sorted(sys.modules)))
+"""
+
+
+def warm_up(modules=WARM_MODULES):
+    """Import modules in a daemon thread, so the first load or wavelet run does not wait for them."""
+    def run():
+        for name in modules:
+            try:
+                importlib.import_module(name)
+            except ImportError:
+                pass
+    thread = threading.Thread(target=run, name="warm-up", daemon=True)
+    thread.start()
+    return thread
+
+
+# ----------------------------------------------------
+# measurements (each in a fresh interpreter)
+# ----------------------------------------------------
+def _python(code, env=None):
+    """(stdout, stderr) of running code with -X importtime in this folder."""
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", code], cwd=HERE, env=env,
+                          capture_output=True, text=True)
+    if proc.returncode:
+        raise RuntimeError(proc.stderr.strip().splitlines()[-1] if proc.stderr.strip() else "failed")
+    return proc.stdout, proc.stderr
+
+
+def import_times(stderr):
+    """Seconds of import time per top-level package, from -X importtime output, largest first."""
+    totals = defaultdict(int)
+    for line in stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        own, _, name = line[len("import time:"):].split("|")
+        if own.strip().isdigit():
+            totals[name.strip().split(".")[0]] += int(own)
+    return sorted(((name, us / 1e6) for name, us in totals.items()), key=lambda t: -t[1])
+
+
+def measure_startup():
+    """{"seconds": launch to shown window, "imports": import_times, "modules": loaded by then}."""
+    env = dict(os.environ)
+    if sys.platform.startswith("linux") and not (env.get("DISPLAY") or env.get("WAYLAND_DISPLAY")):
+        env.setdefault("QT_QPA_PLATFORM", "offscreen")
+    start = time.time()
+    out, err = _python(_SHOW_WINDOW, env)
+    shown, modules = out.splitlines()[-2:]
+    return {"seconds": float(shown) - start, "imports": import_times(err), "modules": set(modules.split())}
+
+
+def headless_modules():
+    """Modules loaded by importing the headless path and running both detection modes."""
+    out, _ = _python(_HEADLESS.format(modules=", ".join(HEADLESS_MODULES)))
+    return set(out.split())
+
+
+def _loaded(modules, names):
+    return [n for n in names if any(m == n or m.startswith(n + ".") for m in modules)]
+
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(description="Check GUI startup time and the lazy-import rules.")
+    ap.add_argument("--budget", type=float, default=C.STARTUP_BUDGET,
+                    help="seconds allowed from launch to a shown window (default %(default)s)")
+    ap.add_argument("--top", type=int, default=10, help="packages listed in the import report")
+    args = ap.parse_args(argv)
+
+    failures = []
+    startup = measure_startup()
+    print(f"window shown after {startup['seconds']:.2f} s (budget {args.budget:.2f} s)")
+    print("import time by package:")
+    for name, seconds in startup["imports"][:args.top]:
+        print(f"  {name:<24} {seconds * 1000:8.1f} ms")
+    if startup["seconds"] > args.budget:
+        failures.append(f"startup took {startup['seconds']:.2f} s, over the {args.budget:.2f} s budget")
+    early = _loaded(startup["modules"], LAZY_MODULES)
+    if early:
+        failures.append(f"loaded before the window showed: {', '.join(early)}")
+
+    forbidden = _loaded(headless_modules(), HEADLESS_FORBIDDEN)
+    if forbidden:
+        failures.append(f"headless detection imports {', '.join(forbidden)}")
+    else:
+        print("headless detection path: no Qt, no pyplot")
+
+    for failure in failures:
+        print("FAIL:", failure)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+#Parameter sweep for the threshold pipeline: evaluates a grid of (min height, alpha)
+#settings in one pass. Local-maxima candidates and the block-minimum pyramid used for
+#widths are computed once at the lowest height; every setting then only re-derives its
+#islands, filters the candidates, recomputes widths and runs the separation step.
+import numpy as np
+from constants import DEFAULT_CONFIG
+from detect import (_report, _island_mask, _island_bounds, _local_maxima_np, _min_levels,
+                    _run_length_np, _median_widths, _radii_np, _separate_np)
+from chunked import next_cut, prev_cut
+from peak_table import PeakTable, islands_array
+
+
+def sweep(data, heights, alphas, progress=None, config=DEFAULT_CONFIG, view=None):
+    """
+    Threshold detection for every (height, alpha) in the grid; each point gives
+    the peaks run_pipeline keeps with config.replace(height=height, alpha=alpha).
+    With view=(start, stop) only the islands reaching into data[start:stop] are
+    kept, whole, as a viewport Run keeps them; indices stay relative to data.
+    Returns {"heights", "alphas", "counts": (len(heights), len(alphas)) array,
+    "peaks": {(height, alpha): PeakTable}, "islands": {height: (starts, ends)}}.
+    progress("sweep", fraction) is reported per grid point.
+    """
+    heights = sorted(float(h) for h in heights)
+    alphas = sorted(float(a) for a in alphas)
+    counts = np.zeros((len(heights), len(alphas)), dtype=np.int64)
+    out = {"heights": heights, "alphas": alphas, "counts": counts, "peaks": {}, "islands": {}}
+    if not heights or not alphas:
+        return out
+    offset = 0
+    if view is not None:
+        # islands at a higher height lie inside the ones at the lowest, so the
+        # lowest-height islands around the view hold every island any point needs
+        start, stop = max(0, int(view[0])), min(len(data), int(view[1]))
+        offset = prev_cut(data, start, heights[0]) if stop > start else start
+        end = next_cut(data, stop, heights[0]) if stop > start else start
+        data = data[offset:end]
+        start, stop = start - offset, stop - offset
+    data = np.asarray(data)
+
+    # a NaN carries the island state of the point before it, so a candidate next
+    # to a NaN can change with the height: find those candidates per height
+    has_nan = data.dtype.kind == "f" and bool(np.isnan(data).any())
+    _report(progress, "maxima", 0.0)
+    mask = _island_mask(data, heights[0])
+    cand = _local_maxima_np(data, mask, *_island_bounds(mask))
+    levels = _min_levels(data)
+
+    total, done = len(heights) * len(alphas), 0
+    for i, h in enumerate(heights):
+        mask = _island_mask(data, h)
+        starts, ends = _island_bounds(mask)
+        if has_nan:
+            idx, val, isl = _local_maxima_np(data, mask, starts, ends)
+        else:
+            # maxima at a higher threshold are exactly the lower ones still above it
+            keep = cand[1] >= h
+            idx, val = cand[0][keep], cand[1][keep]
+            isl = np.searchsorted(starts, idx, side="right") - 1
+        if view is not None:
+            # the islands reaching into the view are a run [lo, hi) (see result_cache._trim)
+            lo = int(np.searchsorted(ends, start, side="left"))
+            hi = max(lo, int(np.searchsorted(starts, stop, side="left")))
+            keep = (isl >= lo) & (isl < hi)
+            idx, val, isl = idx[keep], val[keep], isl[keep] - lo
+            starts, ends = starts[lo:hi], ends[lo:hi]
+        out["islands"][h] = (starts + offset, ends + offset)
+        length = ends - starts + 1
+        memo = {}
+        for j, a in enumerate(alphas):
+            thr = a * val
+            w = (_run_length_np(data, levels, idx, thr, starts[isl], right=False)
+                 + _run_length_np(data, levels, idx, thr, ends[isl], right=True) + 1)
+            W = _median_widths(w, isl, length)
+            R = _radii_np(W, config.radius_rule)
+            # memoized by (island, radius), which repeats across alphas at the same height
+            kept = _separate_np(idx, val, isl, R, config.separation, memo)
+            k_isl = isl[kept]
+            out["peaks"][(h, a)] = PeakTable.from_columns(idx[kept] + offset, val[kept], k_isl, W[k_isl],
+                                                          R[k_isl])
+            counts[i, j] = len(kept)
+            done += 1
+            _report(progress, "sweep", done / total)
+    return out
+
+
+def sweep_rows(result, height, alpha):
+    """kept_rows (the PeakTable run_pipeline returns) for one grid point."""
+    return result["peaks"][(float(height), float(alpha))]
+
+
+def sweep_islands(result, height):
+    return islands_array(*result["islands"][float(height)])
@@ -0,0 +1,129 @@
+#Sweep dialog: runs a (min height, alpha) grid over the same range a Run would use and
+#shows the peak count of every setting. Double-clicking a cell applies that setting.
+import numpy as np
+from PyQt5.QtWidgets import (
+    QDialog, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QSpinBox,
+    QDoubleSpinBox, QLineEdit, QTableWidget, QTableWidgetItem, QProgressBar, QMessageBox
+)
+from PyQt5.QtCore import pyqtSignal
+import constants as C
+from detection_thread_utils import SweepWorker
+from sweep import sweep_rows, sweep_islands
+
+
+class SweepDialog(QDialog):
+    # height, alpha, kept_rows (PeakTable), islands (full-series indices)
+    chosen = pyqtSignal(float, float, object, object)
+
+    def __init__(self, data_source, parent=None):
+        """
+        data_source() -> (y, offset, config, view): the data to sweep, its index in
+        the full series, the config whose height and alpha are swept and the
+        (start, stop) range in y whose islands are kept (None for all of y).
+        """
+        super().__init__(parent)
+        self.setWindowTitle("Parameter Sweep")
+        self.data_source = data_source
+        self.result = None
+        self.offset = 0
+        self.worker = None
+        self.generation = 0
+
+        ly = QVBoxLayout(self)
+        grid = QHBoxLayout()
+        grid.addWidget(QLabel("Min Height from"))
+        self.h_from = QDoubleSpinBox(self)
+        self.h_to = QDoubleSpinBox(self)
+        for box, value in ((self.h_from, C.APEX_MIN_HEIGHT / 2), (self.h_to, C.APEX_MIN_HEIGHT * 2)):
+            box.setRange(0, 1e9)
+            box.setDecimals(1)
+            box.setValue(value)
+        grid.addWidget(self.h_from)
+        grid.addWidget(QLabel("to"))
+        grid.addWidget(self.h_to)
+        grid.addWidget(QLabel("steps"))
+        self.h_steps = QSpinBox(self)
+        self.h_steps.setRange(1, 200)
+        self.h_steps.setValue(10)
+        grid.addWidget(self.h_steps)
+        grid.addWidget(QLabel("Alphas"))
+        self.alphas_edit = QLineEdit("0.3, 0.4, 0.5, 0.6, 0.7", self)
+        grid.addWidget(self.alphas_edit)
+        self.btn_run = QPushButton("Sweep", self)
+        grid.addWidget(self.btn_run)
+        ly.addLayout(grid)
+
+        self.table = QTableWidget(self)
+        self.table.setEditTriggers(QTableWidget.NoEditTriggers)
+        ly.addWidget(self.table)
+        self.progress_bar = QProgressBar(self)
+        self.progress_bar.setRange(0, 100)
+        self.progress_bar.hide()
+        ly.addWidget(self.progress_bar)
+
+        self.btn_run.clicked.connect(self.on_sweep)
+        self.table.cellDoubleClicked.connect(self.on_cell)
+
+    def grid(self):
+        heights = np.linspace(self.h_from.value(), self.h_to.value(), self.h_steps.value())
+        alphas = [float(a) for a in self.alphas_edit.text().replace(";", ",").split(",") if a.strip()]
+        return heights.tolist(), alphas
+
+    def on_sweep(self):
+        try:
+            heights, alphas = self.grid()
+        except ValueError:
+            QMessageBox.warning(self, "Sweep", "Alphas must be numbers separated by commas.")
+            return
+        y, self.offset, config, view = self.data_source()
+        if y is None:
+            QMessageBox.warning(self, "No data", "Load a data file first.")
+            return
+        if self.worker is not None:
+            self.worker.cancel()
+        self.generation += 1
+        self.worker = SweepWorker(y, heights, alphas, self.generation, config, view, self)
+        self.worker.progress.connect(self.on_progress)
+        self.worker.done.connect(self.on_done)
+        self.worker.failed.connect(lambda gen, msg: gen == self.generation and self.on_failed(msg))
+        self.progress_bar.setValue(0)
+        self.progress_bar.show()
+        self.worker.start()
+
+    def on_progress(self, generation, stage, fraction):
+        if generation == self.generation:
+            self.progress_bar.setValue(int(round(100 * fraction)))
+
+    def on_failed(self, message):
+        self.progress_bar.hide()
+        self.worker = None
+        QMessageBox.critical(self, "Error", message)
+
+    def on_done(self, generation, result):
+        if generation != self.generation:
+            return
+        self.worker = None
+        self.progress_bar.hide()
+        self.result = result
+        heights, alphas, counts = result["heights"], result["alphas"], result["counts"]
+        self.table.setRowCount(len(heights))
+        self.table.setColumnCount(len(alphas))
+        self.table.setVerticalHeaderLabels([f"{h:g}" for h in heights])
+        self.table.setHorizontalHeaderLabels([f"alpha {a:g}" for a in alphas])
+        for i in range(len(heights)):
+            for j in range(len(alphas)):
+                self.table.setItem(i, j, QTableWidgetItem(str(int(counts[i, j]))))
+
+    def on_cell(self, i, j):
+        if self.result is None:
+            return
+        h, a = self.result["heights"][i], self.result["alphas"][j]
+        rows = sweep_rows(self.result, h, a).shifted(self.offset)
+        islands = sweep_islands(self.result, h) + self.offset
+        self.chosen.emit(h, a, rows, islands)
+
+    def closeEvent(self, event):
+        if self.worker is not None:
+            self.worker.cancel()
+            self.worker.wait()
+        super().closeEvent(event)
@@ -0,0 +1,121 @@
+#Parity of the threshold engines: engine="numpy" against the reference loops of
+#engine="python", single-shot and through the chunked driver, and of the per-island
+#separation against the original all-pairs loop.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detect
+from chunked import run_chunked, wavelet_peaks
+
+
+def coverage(n, seed, dtype=np.float64, plateaus=False, nan=False):
+    """Poisson background with gaussian bumps, floored to whole counts like alignment coverage."""
+    rng = np.random.default_rng(seed)
+    y = rng.poisson(3, n).astype(np.float64)
+    x = np.arange(n)
+    for c in rng.integers(0, n, max(1, n // 400)):
+        w, h = rng.integers(3, 40), rng.integers(10, 300)
+        lo, hi = max(0, c - 4 * w), min(n, c + 4 * w)
+        y[lo:hi] += h * np.exp(-0.5 * ((x[lo:hi] - c) / w) ** 2)
+        if plateaus:
+            y[c:c + rng.integers(2, 8)] = y[c]
+    y = np.floor(y)
+    if nan:
+        y[rng.integers(0, n, n // 200)] = np.nan
+    return y.astype(dtype)
+
+
+def plain(value):
+    """A result field as plain lists, whatever container the pipeline returns it in."""
+    if hasattr(value, "columns"):
+        return {name: np.asarray(col).tolist() for name, col in value.columns.items()}
+    if isinstance(value, np.ndarray):
+        return value.tolist()
+    return value
+
+
+def assert_same(a, b):
+    for key in ("islands", "local_max", "W_by_island", "R_by_island", "kept_rows"):
+        assert plain(a[key]) == plain(b[key]), key
+
+
+CASES = {
+    "random": dict(dtype=np.float64),
+    "plateau": dict(dtype=np.float64, plateaus=True),
+    "nan": dict(dtype=np.float64, plateaus=True, nan=True),
+    "int32": dict(dtype=np.int32, plateaus=True),
+    "float32": dict(dtype=np.float32),
+}
+
+
+@pytest.mark.parametrize("case", list(CASES))
+@pytest.mark.parametrize("seed", range(5))
+def test_numpy_matches_python(case, seed):
+    data = coverage(20000, seed, **CASES[case])
+    assert_same(detect.run_pipeline(data, engine="numpy"), detect.run_pipeline(data, engine="python"))
+
+
+@pytest.mark.parametrize("data", [np.zeros(100), np.full(100, 20.0), np.array([15.0]),
+                                  np.array([np.nan, 20, np.nan, 30, 5, np.nan])],
+                         ids=["below", "flat", "single", "nan-edges"])
+def test_edge_cases(data):
+    assert_same(detect.run_pipeline(data, engine="numpy"), detect.run_pipeline(data, engine="python"))
+
+
+@pytest.mark.parametrize("case", list(CASES))
+@pytest.mark.parametrize("engine", ["numpy", "python"])
+def test_chunked_matches_single_shot(case, engine):
+    data = coverage(20000, 11, **CASES[case])
+    single = detect.run_pipeline(data, engine="numpy")
+    for chunk_size in (97, 1000, 7000):
+        assert_same(run_chunked(data, engine=engine, chunk_size=chunk_size, local_max=True), single)
+        chunked = detect.run_pipeline(data, engine=engine, chunk_size=chunk_size)
+        assert "local_max" not in chunked
+        assert plain(chunked["kept_rows"]) == plain(single["kept_rows"])
+
+
+def test_chunked_wavelet_matches_single_shot():
+    data = coverage(50000, 3)
+    single = detect.run_pipeline(data, mode="wavelet")["kept_rows"]
+    assert plain(detect.run_pipeline(data, mode="wavelet", chunk_size=12000)["kept_rows"]) == plain(single)
+
+
+@pytest.mark.parametrize("seed", range(20))
+def test_wavelet_peaks_matches_find_peaks(seed):
+    from scipy.signal import find_peaks
+    rng = np.random.default_rng(seed)
+    values = np.repeat(rng.integers(0, 5, 300), rng.integers(1, 4, 300)).astype(np.float64)
+    values[rng.random(len(values)) < 0.02] = np.nan
+    for threshold in (0.5, 1.0, 3.0):
+        expected = find_peaks(values, prominence=threshold)[0]
+        np.testing.assert_array_equal(wavelet_peaks(values, threshold, chunk_size=int(rng.integers(1, 50))),
+                                      expected)
+
+
+def all_pairs_separation(candidates, radius_per_island):
+    """The original O(k²) apex_min_separation, kept as the reference for the per-island one."""
+    kept = []
+    for idx, val, rid in sorted(candidates, key=lambda p: (-p[1], p[0])):
+        R = max(2, int(radius_per_island[rid]))
+        if all(k_r != rid or abs(idx - k_i) >= R for k_i, _, k_r in kept):
+            kept.append([idx, val, rid])
+    kept.sort(key=lambda p: (p[2], p[0]))
+    return kept
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_separation_matches_all_pairs(seed):
+    rng = np.random.default_rng(seed)
+    islands = int(rng.integers(1, 6))
+    radii = rng.integers(0, 6, islands).tolist()
+    candidates = []
+    for rid in range(islands):
+        # few distinct values, so equal apexes (ties) are common
+        index = rng.choice(np.arange(rid * 500, rid * 500 + 200), int(rng.integers(0, 60)), replace=False)
+        candidates += [[int(i), float(rng.integers(0, 4)), rid] for i in index]
+    rng.shuffle(candidates)
+    assert detect.apex_min_separation(candidates, radii) == all_pairs_separation(candidates, radii)
@@ -0,0 +1,120 @@
+#Follow mode against a one-shot run: a file appended in pieces (cut mid-line or mid-record),
+#polled after every piece, must end with the islands and peaks run_pipeline finds in the
+#whole series, and everything already final must match it at every step.
+#    python -m pytest tests
+import json
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detect
+from follow import FollowSession, IncrementalDetector
+from test_engine_parity import coverage, plain
+
+
+def pieces(data, seed, count=25):
+    """data cut at random byte positions."""
+    cuts = np.sort(np.random.default_rng(seed).integers(0, len(data), count))
+    return [data[a:b] for a, b in zip([0, *cuts], [*cuts, len(data)])]
+
+
+def text_file(y):
+    return ("x,y\n" + "".join(f"{i},{v:g}\n" for i, v in enumerate(y))).encode()
+
+
+def final_part(full, done):
+    """The islands of a one-shot result that end before done, with their peaks."""
+    k = int(np.searchsorted(full["islands"][:, 1], done, side="left"))
+    rows = full["kept_rows"]
+    return {"islands": full["islands"][:k], "W_by_island": full["W_by_island"][:k],
+            "R_by_island": full["R_by_island"][:k], "kept_rows": rows[rows["region_id"] < k]}
+
+
+def assert_same(a, b):
+    for key in ("islands", "W_by_island", "R_by_island", "kept_rows"):
+        assert plain(a[key]) == plain(b[key]), key
+
+
+def follow_in_pieces(path, data, seed, budget=None):
+    open(path, "wb").close()
+    session = FollowSession(path, backed=True)
+    try:
+        for piece in pieces(data, seed):
+            with open(path, "ab") as fh:
+                fh.write(piece)
+            while True:
+                session.poll() if budget is None else session.poll(budget)
+                yield session
+                if not session.behind:
+                    break
+        session.finish()
+        yield session
+    finally:
+        session.close()
+
+
+@pytest.mark.parametrize("nan", [False, True], ids=["plain", "nan"])
+def test_csv_in_pieces(tmp_path, nan):
+    y = coverage(20000, 3, nan=nan)
+    full = detect.run_pipeline(y.astype(np.float64))
+    for session in follow_in_pieces(str(tmp_path / "cov.csv"), text_file(y), seed=1):
+        if session.y is not None:
+            assert_same(session.detector.result(), final_part(full, session.detector.done))
+    np.testing.assert_array_equal(session.y, y)
+    assert_same(session.detector.result(), full)
+
+
+def test_raw_in_pieces(tmp_path):
+    y = coverage(30000, 4).astype("<u2")
+    path = str(tmp_path / "cov.bin")
+    with open(path + ".json", "w") as fh:
+        json.dump({"dtype": "<u2"}, fh)
+    full = detect.run_pipeline(y)
+    for session in follow_in_pieces(path, y.tobytes(), seed=2):
+        if session.y is not None:
+            assert_same(session.detector.result(), final_part(full, session.detector.done))
+    assert_same(session.detector.result(), full)
+
+
+def test_poll_budget(tmp_path):
+    y = coverage(20000, 5)
+    data = text_file(y)
+    steps = list(follow_in_pieces(str(tmp_path / "cov.csv"), data, seed=3, budget=4096))
+    # far more polls than pieces: each one read at most the budget
+    assert len(steps) > len(data) // 4096
+    assert_same(steps[-1].detector.result(), detect.run_pipeline(y))
+
+
+class Recorder:
+    """A growing series that counts the points the detector reads."""
+
+    def __init__(self, values):
+        self.values = values
+        self.n = 0
+        self.read = 0
+
+    def __len__(self):
+        return self.n
+
+    def __getitem__(self, key):
+        self.read += len(range(*key.indices(self.n)))
+        return self.values[key]
+
+
+def test_update_reads_each_point_about_once():
+    # one long island that stays open for most updates: rescanning it every time would be quadratic
+    y = coverage(20000, 6)
+    y[2000:18000] += 1000
+    series = Recorder(y)
+    detector = IncrementalDetector()
+    for n in range(0, len(y) + 1, 250):
+        series.n = n
+        detector.update(series)
+        assert detector.scanned == n
+    series.n = len(y)
+    detector.update(series, final=True)
+    # each point is searched for the cut once and detected in once
+    assert series.read <= 2 * len(y)
+    assert_same(detector.result(), detect.run_pipeline(y))
@@ -0,0 +1,186 @@
+#Loaders of io_utils.load_data: the binary inputs (.npy, .npz stored and compressed, raw
+#arrays with their <file>.json descriptor, HDF5 when h5py is installed) and Excel sheets
+#with blank and trailing rows (.xlsx via openpyxl, .xls when xlwt can write one).
+#    python -m pytest tests
+import json
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from io_utils import load_data
+
+
+def series(n=5000, dtype=np.float64):
+    rng = np.random.default_rng(0)
+    return (rng.poisson(20, n) * (rng.random(n) + 0.5)).astype(dtype)
+
+
+def check(path, x, y, mapped=True):
+    lx, ly = load_data(path, use_cache=False)
+    np.testing.assert_array_equal(lx, x)
+    np.testing.assert_array_equal(ly, y)
+    assert ly.dtype == np.asarray(y).dtype
+    if mapped:
+        assert isinstance(ly, np.memmap) or isinstance(ly.base, np.memmap)
+
+
+@pytest.mark.parametrize("dtype", [np.float64, np.float32, np.uint16, np.int32])
+def test_npy_y_only(tmp_path, dtype):
+    y = series(dtype=dtype)
+    path = str(tmp_path / "data.npy")
+    np.save(path, y)
+    check(path, np.arange(len(y)), y)
+
+
+def test_npy_columns_and_rows(tmp_path):
+    x, y = np.arange(100, 600, dtype=np.float64), series(500)
+    np.save(tmp_path / "cols.npy", np.column_stack([x, y]))
+    np.save(tmp_path / "rows.npy", np.vstack([x, y]))
+    check(str(tmp_path / "cols.npy"), x, y)
+    check(str(tmp_path / "rows.npy"), x, y)
+
+
+def test_npy_rejects_other_shapes(tmp_path):
+    np.save(tmp_path / "cube.npy", np.zeros((3, 4, 5)))
+    np.save(tmp_path / "text.npy", np.array(["a", "b"]))
+    for name in ("cube.npy", "text.npy"):
+        with pytest.raises(ValueError):
+            load_data(str(tmp_path / name), use_cache=False)
+
+
+@pytest.mark.parametrize("compressed", [False, True], ids=["stored", "compressed"])
+def test_npz_x_and_y(tmp_path, compressed):
+    x, y = np.arange(10, 3010, dtype=np.int64), series(3000, np.float32)
+    path = str(tmp_path / "data.npz")
+    (np.savez_compressed if compressed else np.savez)(path, y=y, x=x, other=np.zeros(3))
+    # stored members are mapped, compressed ones read into memory
+    check(path, x, y, mapped=not compressed)
+
+
+@pytest.mark.parametrize("compressed", [False, True], ids=["stored", "compressed"])
+def test_npz_first_array(tmp_path, compressed):
+    y = series(2000)
+    path = str(tmp_path / "data.npz")
+    (np.savez_compressed if compressed else np.savez)(path, y)
+    check(path, np.arange(len(y)), y, mapped=not compressed)
+
+
+def test_npz_length_mismatch(tmp_path):
+    path = str(tmp_path / "data.npz")
+    np.savez(path, x=np.arange(5), y=np.arange(6))
+    with pytest.raises(ValueError):
+        load_data(path, use_cache=False)
+
+
+def write_raw(path, values, descriptor, header=b""):
+    with open(path, "wb") as fh:
+        fh.write(header)
+        values.tofile(fh)
+    with open(path + ".json", "w") as fh:
+        json.dump(descriptor, fh)
+
+
+@pytest.mark.parametrize("dtype", ["<u4", ">i2", "<f8"])
+def test_raw_with_descriptor(tmp_path, dtype):
+    y = series(4000).astype(dtype)
+    path = str(tmp_path / "data.bin")
+    write_raw(path, y, {"dtype": dtype})
+    check(path, np.arange(len(y)), y)
+
+
+def test_raw_offset_length_columns(tmp_path):
+    x, y = np.arange(50, 1050, dtype="<i4"), series(1000).astype("<i4")
+    path = str(tmp_path / "data.raw")
+    write_raw(path, np.column_stack([x, y]).ravel(), {"dtype": "<i4", "offset": 64, "columns": 2,
+                                                      "length": 900}, header=b"\xff" * 64)
+    check(path, x[:900], y[:900])
+
+
+def test_raw_descriptor_errors(tmp_path):
+    path = str(tmp_path / "data.dat")
+    np.arange(10, dtype="<u2").tofile(path)
+    with pytest.raises(ValueError, match="descriptor"):
+        load_data(path, use_cache=False)
+    for desc in ({"dtype": "<u2", "length": 11}, {"dtype": "<u2", "columns": 3}):
+        with open(path + ".json", "w") as fh:
+            json.dump(desc, fh)
+        with pytest.raises(ValueError):
+            load_data(path, use_cache=False)
+
+
+def test_unsupported_extension(tmp_path):
+    with pytest.raises(ValueError):
+        load_data(str(tmp_path / "data.xyz"), use_cache=False)
+
+
+@pytest.mark.parametrize("layout", ["contiguous", "chunked"])
+def test_hdf5(tmp_path, layout):
+    h5py = pytest.importorskip("h5py")
+    x, y = np.arange(7, 2007, dtype=np.int64), series(2000)
+    path = str(tmp_path / "data.h5")
+    options = {"chunks": True, "compression": "gzip"} if layout == "chunked" else {}
+    with h5py.File(path, "w") as f:
+        group = f.create_group("run1")
+        group.create_dataset("x", data=x, **options)
+        group.create_dataset("y", data=y, **options)
+    check(path, x, y, mapped=layout == "contiguous")
+
+
+# rows of a sheet: header, data with blank rows in between, a blank y cell, trailing blank rows
+SHEET = [("x", "y"), (None, None), (0, 5.0), (1, 7.5), (None, None), ("", "  "), (2, None), (3, 9.0),
+         (None, None), (4, 2.0)]
+EXPECTED_X = [0, 1, 2, 3, 4]
+EXPECTED_Y = [5.0, 7.5, np.nan, 9.0, 2.0]
+
+
+def write_xlsx(path, rows, trailing=20):
+    openpyxl = pytest.importorskip("openpyxl")
+    book = openpyxl.Workbook()
+    ws = book.active
+    for row in rows:
+        ws.append(list(row))
+    # formatted but empty rows past the data still count in the sheet's dimension
+    for r in range(len(rows) + 1, len(rows) + 1 + trailing):
+        ws.cell(row=r, column=1).font = openpyxl.styles.Font(bold=True)
+    book.save(path)
+
+
+def write_xls(path, rows, trailing=20):
+    xlwt = pytest.importorskip("xlwt")
+    pytest.importorskip("xlrd")
+    book = xlwt.Workbook()
+    ws = book.add_sheet("data")
+    for r, row in enumerate(rows):
+        for c, value in enumerate(row):
+            if value is not None:
+                ws.write(r, c, value)
+    for r in range(len(rows), len(rows) + trailing):
+        ws.write(r, 0, "")
+    book.save(path)
+
+
+@pytest.mark.parametrize("ext", [".xlsx", ".xls"])
+def test_excel_blank_rows(tmp_path, ext):
+    path = str(tmp_path / ("data" + ext))
+    (write_xlsx if ext == ".xlsx" else write_xls)(path, SHEET)
+    x, y = load_data(path, use_cache=False)
+    np.testing.assert_array_equal(x, EXPECTED_X)
+    np.testing.assert_array_equal(y, EXPECTED_Y)
+
+
+@pytest.mark.parametrize("ext", [".xlsx", ".xls"])
+def test_excel_single_column_blank_rows(tmp_path, ext):
+    path = str(tmp_path / ("data" + ext))
+    (write_xlsx if ext == ".xlsx" else write_xls)(path, [(3.0,), (None,), (4.0,), ("",), (6.0,)])
+    x, y = load_data(path, use_cache=False)
+    np.testing.assert_array_equal(x, [0, 1, 2])
+    np.testing.assert_array_equal(y, [3.0, 4.0, 6.0])
+
+
+def test_excel_non_numeric(tmp_path):
+    path = str(tmp_path / "data.xlsx")
+    write_xlsx(path, [(0, 1), (1, "n/a")])
+    with pytest.raises(ValueError, match="row 2"):
+        load_data(path, use_cache=False)
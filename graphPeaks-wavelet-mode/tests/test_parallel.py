@@ -0,0 +1,55 @@
+#Process-pool detection (parallel.run_parallel) against a single-process run.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detect
+from bench import make_signal
+from parallel import run_parallel, _task_size
+from peak_table import PEAK_FIELDS
+
+N = 60000
+CHUNK = 10000
+
+
+@pytest.fixture(scope="module")
+def series(tmp_path_factory):
+    """(mode, source) -> input: in memory or a np.memmap; NaN gaps for threshold mode."""
+    folder = tmp_path_factory.mktemp("parallel")
+    out = {}
+    for mode in ("threshold", "wavelet"):
+        y = make_signal(N, "dense", seed=2)
+        if mode == "threshold":
+            y[np.random.default_rng(2).integers(0, N, 50)] = np.nan
+        np.save(folder / f"{mode}.npy", y)
+        out[mode, "memory"] = y
+        out[mode, "memmap"] = np.load(folder / f"{mode}.npy", mmap_mode="r")
+    return out
+
+
+def test_several_tasks():
+    assert N > 3 * _task_size(N, 2, CHUNK)
+
+
+@pytest.mark.parametrize("source", ["memory", "memmap"])
+def test_threshold_matches_single_process(series, source):
+    data = series["threshold", source]
+    single = detect.run_pipeline(np.asarray(data))
+    pooled = run_parallel(data, "threshold", workers=2, chunk_size=CHUNK)
+    np.testing.assert_array_equal(pooled["islands"], single["islands"])
+    np.testing.assert_array_equal(pooled["W_by_island"], single["W_by_island"])
+    np.testing.assert_array_equal(pooled["R_by_island"], single["R_by_island"])
+    for name in PEAK_FIELDS:
+        np.testing.assert_array_equal(pooled["kept_rows"][name], single["kept_rows"][name], err_msg=name)
+
+
+@pytest.mark.parametrize("source", ["memory", "memmap"])
+def test_wavelet_matches_single_process(series, source):
+    data = series["wavelet", source]
+    single = detect.run_pipeline(np.asarray(data), "wavelet")
+    pooled = run_parallel(data, "wavelet", workers=2, chunk_size=CHUNK)
+    for name in PEAK_FIELDS:
+        np.testing.assert_array_equal(pooled["kept_rows"][name], single["kept_rows"][name], err_msg=name)
@@ -0,0 +1,108 @@
+#Peak export round trips: write_peaks / open_peak_writer and read_peaks for every format,
+#single and multi-block, with the metadata block or sidecar, and no .part file left
+#behind when a write fails.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import constants as C
+import peak_writer
+from peak_table import PeakTable
+from peak_writer import open_peak_writer, peak_metadata, read_peaks, write_peaks, SIDECAR
+
+FORMATS = [".csv", ".parquet", ".feather", ".npz", ".npy"]
+
+
+def needs(ext):
+    if ext in (".parquet", ".feather"):
+        pytest.importorskip("pyarrow")
+    if ext == ".csv":
+        pytest.importorskip("pandas")
+
+
+def peaks(n, seed=0, start=0):
+    rng = np.random.default_rng(seed)
+    return PeakTable.from_columns(start + np.sort(rng.choice(10 * n + 1, n, replace=False)),
+                                  rng.random(n) * 100, rng.integers(0, 50, n),
+                                  rng.integers(3, 40, n), rng.integers(2, 14, n))
+
+
+def concat(tables):
+    return PeakTable({name: np.concatenate([t[name] for t in tables]) for name in tables[0].columns})
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_round_trip(tmp_path, ext):
+    needs(ext)
+    path = str(tmp_path / ("peaks" + ext))
+    table = peaks(500)
+    meta = peak_metadata(C.DEFAULT_CONFIG, mode="threshold", engine="numpy", run=7)
+    write_peaks(path, table, meta)
+    back, back_meta = read_peaks(path)
+    assert back == table
+    assert back_meta["config"] == meta["config"]
+    assert back_meta["run"] == 7 and back_meta["mode"] == "threshold"
+    assert os.path.exists(path + SIDECAR) == (ext in (".csv", ".npy"))
+    assert not os.path.exists(path + ".part")
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_streamed_blocks(tmp_path, ext):
+    needs(ext)
+    path = str(tmp_path / ("peaks" + ext))
+    blocks = [peaks(300, 1), PeakTable(), peaks(1, 2, 5000), peaks(1000, 3, 6000)]
+    source = tmp_path / "signal.bin"
+    source.write_bytes(b"\x00\x01" * 1000)
+    with open_peak_writer(path, peak_metadata(source=str(source))) as writer:
+        for block in blocks:
+            writer.write(block)
+    back, meta = read_peaks(path)
+    assert back == concat(blocks)
+    assert meta["source_size"] == 2000
+    assert meta["source_sha256"] == peak_writer.file_sha256(str(source))
+    if ext in (".csv", ".npy", ".npz"):
+        assert meta["peaks"] == len(back)
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_empty(tmp_path, ext):
+    needs(ext)
+    path = str(tmp_path / ("peaks" + ext))
+    write_peaks(path, PeakTable())
+    assert len(read_peaks(path)[0]) == 0
+
+
+@pytest.mark.parametrize("ext", FORMATS)
+def test_failed_write_leaves_nothing(tmp_path, ext):
+    needs(ext)
+    path = str(tmp_path / ("peaks" + ext))
+    with pytest.raises(RuntimeError):
+        with open_peak_writer(path, {"run": 1}) as writer:
+            writer.write(peaks(200))
+            # .npz spools its columns and only creates the .part file on close
+            assert os.path.exists(path + ".part") == (ext != ".npz")
+            raise RuntimeError("detection failed")
+    assert os.listdir(tmp_path) == []
+
+
+def test_failed_close_leaves_nothing(tmp_path, monkeypatch):
+    path = str(tmp_path / "peaks.npz")
+    writer = open_peak_writer(path)
+    writer.write(peaks(10))
+
+    def replace(src, dst):
+        raise OSError("disk full")
+    monkeypatch.setattr(peak_writer.os, "replace", replace)
+    with pytest.raises(OSError):
+        writer.close()
+    assert os.listdir(tmp_path) == []
+
+
+def test_unsupported_extension(tmp_path):
+    with pytest.raises(ValueError):
+        open_peak_writer(str(tmp_path / "peaks.txt"))
+    with pytest.raises(ValueError):
+        read_peaks(str(tmp_path / "peaks.txt"))
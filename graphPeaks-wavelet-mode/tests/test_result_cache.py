@@ -0,0 +1,46 @@
+#Viewport result cache: a cached viewport run against a full run trimmed to the view.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detect
+from bench import make_signal
+from peak_table import PEAK_FIELDS
+from result_cache import ResultCache
+
+N = 50000
+
+
+def trimmed(full, start, stop):
+    """The full run's islands that reach into [start, stop), their peaks renumbered from 0."""
+    islands = np.asarray(full["islands"]).reshape(-1, 2)
+    keep = np.flatnonzero((islands[:, 1] >= start) & (islands[:, 0] < stop))
+    first = keep[0] if keep.size else 0
+    rows = full["kept_rows"]
+    rows = rows[np.isin(rows["region_id"], keep)].shifted(region_id=-first)
+    return islands[keep], full["W_by_island"][keep], full["R_by_island"][keep], rows
+
+
+@pytest.mark.parametrize("nan", [False, True])
+def test_threshold_view_equals_trimmed_full_run(nan):
+    y = make_signal(N, "dense", seed=4)
+    if nan:
+        y[np.random.default_rng(4).integers(0, N, 100)] = np.nan
+    full = detect.run_pipeline(y)
+    cache = ResultCache(y, chunk_size=4096)
+    rng = np.random.default_rng(0)
+    views = [(0, N), (0, 1), (N - 1, N)] + [tuple(sorted(rng.integers(0, N, 2))) for _ in range(20)]
+    for start, stop in views * 2:  # the second pass is served from the cache
+        if stop <= start:
+            continue
+        got = cache.detect(start, stop)
+        islands, W, R, rows = trimmed(full, start, stop)
+        np.testing.assert_array_equal(got["islands"].reshape(-1, 2), islands)
+        np.testing.assert_array_equal(got["W_by_island"], W)
+        np.testing.assert_array_equal(got["R_by_island"], R)
+        for name in PEAK_FIELDS:
+            np.testing.assert_array_equal(got["kept_rows"][name], rows[name], err_msg=name)
+    assert cache.hits > 0
@@ -0,0 +1,42 @@
+#Parameter sweep against run_pipeline: every grid point must keep the peaks and islands
+#a Run with that height and alpha keeps, over the full series and over a viewport.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import constants as C
+import detect
+from result_cache import ResultCache
+from sweep import sweep, sweep_rows, sweep_islands
+from test_engine_parity import coverage, plain
+
+HEIGHTS = [4.0, 9.5, 10.0, 25.0, 60.0]
+ALPHAS = [0.3, 0.5, 0.7]
+
+
+@pytest.mark.parametrize("nan", [False, True], ids=["plain", "nan"])
+def test_sweep_matches_run_pipeline(nan):
+    data = coverage(30000, 5, plateaus=True, nan=nan)
+    result = sweep(data, HEIGHTS, ALPHAS)
+    for i, h in enumerate(HEIGHTS):
+        for j, a in enumerate(ALPHAS):
+            full = detect.run_pipeline(data, config=C.DEFAULT_CONFIG.replace(height=h, alpha=a))
+            assert plain(sweep_rows(result, h, a)) == plain(full["kept_rows"]), (h, a)
+            assert sweep_islands(result, h).tolist() == plain(full["islands"]), h
+            assert result["counts"][i, j] == len(full["kept_rows"])
+
+
+@pytest.mark.parametrize("nan", [False, True], ids=["plain", "nan"])
+@pytest.mark.parametrize("view", [(0, 1000), (12345, 17000), (29000, 30000), (5000, 5000)])
+def test_sweep_view_matches_viewport_run(nan, view):
+    data = coverage(30000, 6, plateaus=True, nan=nan)
+    cache = ResultCache(data, chunk_size=4096)
+    result = sweep(data, HEIGHTS, ALPHAS, view=view)
+    for h in HEIGHTS:
+        for a in ALPHAS:
+            run = cache.detect(*view, config=C.DEFAULT_CONFIG.replace(height=h, alpha=a))
+            assert plain(sweep_rows(result, h, a)) == plain(run["kept_rows"]), (h, a)
+            assert sweep_islands(result, h).tolist() == plain(run["islands"]), h
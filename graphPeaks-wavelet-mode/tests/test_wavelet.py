@@ -0,0 +1,67 @@
+#Wavelet mode against the direct convolution it replaced: the blocked FFT abs-sum
+#(detect._cwt_abs_sum) and the peaks found in it.
+#    python -m pytest tests
+import os
+import sys
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+import detect
+from bench import make_signal
+from constants import DEFAULT_CONFIG, WAVELET_BLOCK
+
+WIDTHS = DEFAULT_CONFIG.wavelet_widths
+
+
+def direct_abs_sum(data, widths=WIDTHS):
+    """sum(abs(CWT)) with one np.convolve per width, as the original _cwt did."""
+    data = np.asarray(data, dtype=np.float64)
+    return sum(np.abs(np.convolve(data, detect._ricker_wavelet(w), mode="same")) for w in widths)
+
+
+def direct_peaks(data):
+    from scipy.signal import find_peaks
+    cwt_sum = direct_abs_sum(data)
+    return find_peaks(cwt_sum, prominence=np.median(cwt_sum) * 0.5)[0]
+
+
+def signal(kind):
+    n = 3 * WAVELET_BLOCK + 1234
+    y = make_signal(n, "dense", seed=5)
+    if kind == "block-edges":
+        # apexes right at and next to the FFT block boundaries
+        for edge in range(WAVELET_BLOCK, n, WAVELET_BLOCK):
+            y[edge - 1:edge + 2] += [40.0, 80.0, 40.0]
+    elif kind == "int":
+        y = np.rint(y).astype(np.int32)
+    elif kind == "zeros":
+        # long exact-zero stretches, where FFT round-off has to be snapped back to 0
+        y[2000:WAVELET_BLOCK + 3000] = 0.0
+        y[-4000:] = 0.0
+    return y
+
+
+@pytest.mark.parametrize("kind", ["plain", "block-edges", "int", "zeros"])
+def test_abs_sum_matches_direct_convolution(kind):
+    y = signal(kind)
+    expected = direct_abs_sum(y)
+    got = detect._cwt_abs_sum(y, WIDTHS)
+    scale = np.abs(y).max() * max(np.abs(detect._ricker_wavelet(w)).sum() for w in WIDTHS)
+    np.testing.assert_allclose(got, expected, rtol=0, atol=1e-9 * scale)
+    if kind == "zeros":
+        # far from any data the direct sum is exactly zero, and so is the FFT one
+        np.testing.assert_array_equal(got[5000:WAVELET_BLOCK], expected[5000:WAVELET_BLOCK])
+
+
+@pytest.mark.parametrize("kind", ["plain", "block-edges", "int", "zeros"])
+def test_peaks_match_direct_convolution(kind):
+    y = signal(kind)
+    np.testing.assert_array_equal(detect.run_wavelet_mode(y)["kept_rows"]["index"], direct_peaks(y))
+
+
+@pytest.mark.parametrize("start,stop", [(0, WAVELET_BLOCK), (WAVELET_BLOCK - 7, WAVELET_BLOCK + 7), (5000, 20011)])
+def test_ranges_equal_whole_series(start, stop):
+    y = signal("plain")
+    np.testing.assert_array_equal(detect._cwt_abs_sum(y, WIDTHS, start, stop),
+                                  detect._cwt_abs_sum(y, WIDTHS)[start:stop])
@@ -0,0 +1,141 @@
+#In-memory tile cache for tile mode: fixed-size blocks of the memory-mapped series and
+#of its pyramid levels are copied off the map once and kept least-recently-used first
+#within a byte budget, so panning back and forth never goes to disk twice. A background
+#thread loads the blocks the view is about to need (see PlotWidget.prefetch_ahead).
+import itertools
+import threading
+from collections import OrderedDict
+import numpy as np
+from constants import TILE_CACHE_BYTES
+
+
+class CachedArray:
+    """Read-only view of an array (e.g. a np.memmap) whose slices are served from a TileCache."""
+
+    def __init__(self, cache, array, block, key):
+        self.cache = cache
+        self.array = array
+        self.block = block
+        self.key = key
+        self.dtype = array.dtype
+        self.shape = array.shape
+
+    def __len__(self):
+        return len(self.array)
+
+    def load(self, i):
+        """Block i copied into memory."""
+        data = np.array(self.array[i * self.block:(i + 1) * self.block])
+        data.flags.writeable = False
+        return data
+
+    def blocks(self, start, stop):
+        """Indices of the blocks covering [start, stop)."""
+        start, stop = max(0, start), min(len(self), stop)
+        if stop <= start:
+            return range(0)
+        return range(start // self.block, (stop - 1) // self.block + 1)
+
+    def __getitem__(self, key):
+        if not isinstance(key, slice) or key.step not in (None, 1):
+            return np.asarray(self.array[key])
+        start, stop, _ = key.indices(len(self))
+        blocks = self.blocks(start, stop)
+        if not blocks:
+            return np.asarray(self.array[0:0])
+        parts = [self.cache.get(self, i) for i in blocks]
+        data = parts[0] if len(parts) == 1 else np.concatenate(parts)
+        off = blocks[0] * self.block
+        return data[start - off:stop - off]
+
+
+class TileCache:
+    """LRU of loaded blocks, bounded by bytes, shared by every CachedArray made with view()."""
+
+    def __init__(self, budget=TILE_CACHE_BYTES):
+        self.budget = budget
+        self.nbytes = 0
+        self.hits = self.misses = self.prefetched = 0
+        self._blocks = OrderedDict()
+        self._keys = itertools.count()
+        # the prefetch thread and the GUI thread share the blocks
+        self._lock = threading.Lock()
+        self._wake = threading.Condition(self._lock)
+        self._pending = []
+        self._thread = None
+        self._closed = False
+
+    def __len__(self):
+        return len(self._blocks)
+
+    def view(self, array, block):
+        return CachedArray(self, array, block, next(self._keys))
+
+    def get(self, view, i):
+        key = (view.key, i)
+        with self._lock:
+            data = self._blocks.get(key)
+            if data is not None:
+                self._blocks.move_to_end(key)
+                self.hits += 1
+                return data
+            self.misses += 1
+        data = view.load(i)
+        self._put(key, data)
+        return data
+
+    def _put(self, key, data):
+        with self._lock:
+            if key in self._blocks or self._closed:
+                return
+            self._blocks[key] = data
+            self.nbytes += data.nbytes
+            while self.nbytes > self.budget and len(self._blocks) > 1:
+                _, old = self._blocks.popitem(last=False)
+                self.nbytes -= old.nbytes
+
+    # ---- background loading ----
+    def prefetch(self, requests):
+        """
+        Load [(view, block index), ...] in the background, in order. Replaces what
+        is still queued from an earlier call, and stops at half the budget so it
+        never pushes out the blocks on screen.
+        """
+        with self._wake:
+            if self._closed:
+                return
+            pending, size = [], 0
+            for view, i in requests:
+                if (view.key, i) in self._blocks:
+                    continue
+                size += view.block * view.dtype.itemsize * int(np.prod(view.shape[1:]))
+                if size > self.budget // 2:
+                    break
+                pending.append((view, i))
+            self._pending = pending
+            if self._thread is None and pending:
+                self._thread = threading.Thread(target=self._run, name="tile-prefetch", daemon=True)
+                self._thread.start()
+            self._wake.notify()
+
+    def _run(self):
+        while True:
+            with self._wake:
+                while not self._pending and not self._closed:
+                    self._wake.wait()
+                if self._closed:
+                    return
+                view, i = self._pending.pop(0)
+                if (view.key, i) in self._blocks:
+                    continue
+            self._put((view.key, i), view.load(i))
+            self.prefetched += 1
+
+    def close(self):
+        """Stop the prefetch thread and drop every block."""
+        with self._wake:
+            self._closed = True
+            self._pending = []
+            self._blocks.clear()
+            self.nbytes = 0
+            self._wake.notify()
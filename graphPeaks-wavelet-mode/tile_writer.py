@@ -1,10 +1,111 @@
 # tile_writer.py
-import numpy as np
+# Single-file tile store: a small JSON header (dtype, length, tile size, source
+# hash) followed by the raw series. Opened as a memmap, so a tile or a viewport
+# is a zero-copy slice instead of one .npy file per tile.
+import json
 import os
+import struct
+import numpy as np
+from constants import TILE_SIZE
+from cache import source_cache_dir, source_fingerprint
+
+MAGIC = b"GPTILES1"
+ALIGN = 64  # data offset alignment
+STORE_NAME = "series.tiles"
+
+
+def write_store(path, y_data, **meta):
+    """
+    Write y_data and a header to path (atomically), return the opened store.
+    y_data may be any sliceable array with a dtype (a memmap, an HDF5 dataset):
+    it is copied a block at a time.
+    """
+    if not hasattr(y_data, "dtype"):
+        y_data = np.asarray(y_data)
+    header = dict(meta, dtype=y_data.dtype.str, length=len(y_data))
+    blob = json.dumps(header).encode()
+    offset = -(-(len(MAGIC) + 4 + len(blob)) // ALIGN) * ALIGN
+    tmp = path + ".part"
+    with open(tmp, "wb") as fh:
+        fh.write(MAGIC + struct.pack("<I", len(blob)) + blob)
+        fh.write(b"\0" * (offset - fh.tell()))
+        for i in range(0, len(y_data), 1 << 22):
+            np.ascontiguousarray(y_data[i:i + (1 << 22)]).tofile(fh)
+    os.replace(tmp, path)
+    return TileStore(path)
+
+
+def read_header(path):
+    """(header dict, data offset) of a store file."""
+    with open(path, "rb") as fh:
+        if fh.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"Not a tile store: {path}")
+        size, = struct.unpack("<I", fh.read(4))
+        header = json.loads(fh.read(size))
+    return header, -(-(len(MAGIC) + 4 + size) // ALIGN) * ALIGN
+
+
+class TileStore:
+    """Memory-mapped series with its header; `data` slices are zero-copy."""
+
+    def __init__(self, path):
+        self.path = path
+        self.header, offset = read_header(path)
+        self.dtype = np.dtype(self.header["dtype"])
+        self.length = int(self.header["length"])
+        self.tile_size = int(self.header.get("tile_size", TILE_SIZE))
+        self.source_hash = self.header.get("source_hash")
+        if self.length:
+            self.data = np.memmap(path, dtype=self.dtype, mode="r", offset=offset, shape=(self.length,))
+        else:
+            self.data = np.empty(0, dtype=self.dtype)
+
+    @classmethod
+    def wrap(cls, data, path, **meta):
+        """
+        Store over an already mapped series, without a store file. path only
+        places the derived files (the pyramid) in the right cache folder.
+        """
+        store = cls.__new__(cls)
+        store.path = path
+        store.header = dict(meta, dtype=data.dtype.str, length=len(data))
+        store.dtype = data.dtype
+        store.length = len(data)
+        store.tile_size = int(meta.get("tile_size", TILE_SIZE))
+        store.source_hash = meta.get("source_hash")
+        store.data = data
+        return store
+
+    def __len__(self):
+        return self.length
+
+    def tile(self, i):
+        """Points of tile i."""
+        return self.data[i * self.tile_size:(i + 1) * self.tile_size]
+
+    def view(self, start, stop):
+        """Points in [start, stop), clipped to the series."""
+        return self.data[max(0, start):max(0, min(stop, self.length))]
+
 
-def save_tiles(y_data, tile_size=10000, out_dir="tiles"):
-    os.makedirs(out_dir, exist_ok=True)
-    n = len(y_data)
-    for i in range(0, n, tile_size):
-        chunk = y_data[i:i + tile_size]
-        np.save(os.path.join(out_dir, f"tile_{i}.npy"), chunk)
+def save_tiles(y_data, source_path, tile_size=TILE_SIZE):
+    """
+    Tile store for the series loaded from source_path, kept in that file's cache
+    folder. A store already written for the same source contents is reused, and
+    a memory-mapped series (a binary input) is used in place instead of copied.
+    """
+    fingerprint = source_fingerprint(source_path)
+    path = os.path.join(source_cache_dir(source_path, fingerprint), STORE_NAME)
+    if os.path.exists(path):
+        try:
+            store = TileStore(path)
+            if (store.source_hash == fingerprint and store.length == len(y_data)
+                    and store.tile_size == tile_size):
+                return store
+        except (ValueError, OSError):
+            pass
+    if isinstance(y_data, np.memmap):
+        return TileStore.wrap(y_data, path, tile_size=tile_size, source_hash=fingerprint,
+                              source=os.path.abspath(source_path))
+    return write_store(path, y_data, tile_size=tile_size, source_hash=fingerprint,
+                       source=os.path.abspath(source_path))